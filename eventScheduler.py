@@ -0,0 +1,55 @@
+"""
+eventScheduler.py
+
+Coalesces bursts of host events (e.g. Maya scriptJob events) into a
+single deferred evaluation.  The host's event loop is only reached
+through a defer(func) callable, so the scheduler can be driven by a fake
+event loop outside of Maya (see tests/test_eventScheduler.py).
+"""
+
+
+class CoalescingScheduler(object):
+    """
+    Runs callback once, when the host next gets to the deferred call,
+    however many times trigger() was called before that.  If fingerprint
+    is given, the run is skipped when fingerprint() returns the same value
+    as for the last run, unless one of the triggers was forced.
+    """
+    def __init__(self, callback, defer, fingerprint=None):
+        self.callback = callback
+        self.defer = defer
+        self.fingerprint = fingerprint
+        self.pending = False
+        self.forced = False
+        self.lastFingerprint = None
+        self.triggers = 0
+        self.runs = 0
+        self.skips = 0
+
+    def __repr__(self):
+        return 'CoalescingScheduler({0} triggers, {1} runs, {2} skips)'.format(self.triggers, self.runs, self.skips)
+
+    def trigger(self, force=False):
+        self.triggers += 1
+        self.forced = self.forced or force
+        if not self.pending:
+            self.pending = True
+            self.defer(self.run)
+
+    def run(self):
+        """ Run the pending evaluation now.  Returns True if callback was called """
+        self.pending = False
+        forced, self.forced = self.forced, False
+        if self.fingerprint is not None:
+            fingerprint = self.fingerprint()
+            if fingerprint == self.lastFingerprint and not forced:
+                self.skips += 1
+                return False
+            self.lastFingerprint = fingerprint
+        self.runs += 1
+        self.callback()
+        return True
+
+    def reset(self):
+        """ Forget the last fingerprint, so the next run isn't skipped """
+        self.lastFingerprint = None
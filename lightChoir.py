@@ -22,8 +22,14 @@ __author__ = 'Chris Lewis'
 __version__ = '1.0.1'
 __email__ = 'clewis1@c.ringling.edu'
 
+import json
+from contextlib import contextmanager
+
 from pymel.core import *
 from pymel.core.nodetypes import *
+import maya.OpenMaya as om
+
+import lightList
 
 _LIGHT_NODE_TYPES = ['ambientLight', 
                      'directionalLight',
@@ -34,6 +40,7 @@ _LIGHT_NODE_TYPES = ['ambientLight',
                      'RenderManEnvLightShape']
 _MUTED_ATTR = 'mutedStatus'
 _SOLO_ATTR = 'soloStatus'
+_PRESETS_KEY = 'lightChoirPresets'
 
 def lcIsLight(node):
     if not node.type() in _LIGHT_NODE_TYPES:
@@ -53,75 +60,347 @@ def lcGetLight(node):
     else:
         print 'Warning: {0} is not a light'.format(node.name())
 
-def lcGetAllLights():
+def lcScanLights():
+    """ Find every light in the scene.  Use lcGetAllLights, which is cached """
     allLights = [lcGetLight(x) for x in ls(lt=1)]
     # include renderman environment lights if renderman is loaded
     if pluginInfo('RenderMan_for_Maya.mll', q=1, l=1):
         allLights += [lcGetLight(x) for x in ls(typ='RenderManEnvLightShape')]
-    return allLights
+    return [x for x in allLights if x is not None]
+
+
+class LightEntry(object):
+    __slots__ = ('light', 'handle', 'name', 'muted', 'solo', 'callback')
+
+    def __init__(self, light):
+        self.light = light
+        self.handle = om.MObjectHandle(light.__apimobject__())
+        self.name = light.name()
+        self.muted = bool(light.attr(_MUTED_ATTR).get())
+        self.solo = bool(light.attr(_SOLO_ATTR).get())
+        self.callback = None
+
+    def __repr__(self):
+        return 'LightEntry({0})'.format(self.name)
+
+
+class LightRegistry(object):
+    """
+    Cached lights of the scene with their muted and solo state.  The scene
+    is scanned once, then kept in sync by node added, removed and renamed
+    callbacks and an attribute changed callback per light, so listing and
+    formatting lights doesn't query the scene again.
+    """
+    def __init__(self):
+        self.entries = None
+        self.byName = {}
+        self.pending = []
+        self.namesDirty = False
+        self.callbacks = []
+
+    def __repr__(self):
+        if self.entries is None:
+            return 'LightRegistry(unbuilt)'
+        return 'LightRegistry({0} lights)'.format(len(self.entries))
+
+    def rebuild(self):
+        self._removeLightCallbacks()
+        self.entries = []
+        self.pending = []
+        for light in lcScanLights():
+            self._add(light)
+        self._reindex()
+        if not self.callbacks:
+            self._addCallbacks()
+
+    def invalidate(self):
+        """ Drop the cache; the scene is scanned again on the next query """
+        self._removeLightCallbacks()
+        self.entries = None
+        self.byName = {}
+        self.pending = []
+
+    def release(self):
+        """ Remove every callback """
+        self.invalidate()
+        for callback in self.callbacks:
+            om.MMessage.removeCallback(callback)
+        self.callbacks = []
+
+    def _add(self, light):
+        entry = LightEntry(light)
+        entry.callback = om.MNodeMessage.addAttributeChangedCallback(
+            light.__apimobject__(), lambda msg, plug, otherPlug, data: self._attributeChanged(entry, msg, plug))
+        self.entries.append(entry)
+        return entry
+
+    def _reindex(self):
+        for entry in self.entries:
+            entry.name = entry.light.name()
+        self.entries.sort(key=lambda x: x.name)
+        self.byName = dict([(x.name, x) for x in self.entries])
+        self.namesDirty = False
+
+    def _removeLightCallbacks(self):
+        for entry in self.entries or []:
+            if entry.callback is not None:
+                om.MMessage.removeCallback(entry.callback)
+                entry.callback = None
+
+    def _addCallbacks(self):
+        add = self.callbacks.append
+        add(om.MDGMessage.addNodeAddedCallback(self._nodeAdded))
+        add(om.MDGMessage.addNodeRemovedCallback(self._nodeRemoved))
+        add(om.MNodeMessage.addNameChangedCallback(om.MObject(), self._nameChanged))
+        for message in (om.MSceneMessage.kAfterOpen, om.MSceneMessage.kAfterNew,
+                        om.MSceneMessage.kAfterImport, om.MSceneMessage.kAfterCreateReference,
+                        om.MSceneMessage.kAfterPluginLoad):
+            add(om.MSceneMessage.addCallback(message, lambda data: self.invalidate()))
+
+    def _nodeAdded(self, node, data):
+        if self.entries is not None and om.MFnDependencyNode(node).typeName() in _LIGHT_NODE_TYPES:
+            # attributes can't be added while the node is being created
+            self.pending.append(om.MObjectHandle(node))
+
+    def _nodeRemoved(self, node, data):
+        if self.entries is None or om.MFnDependencyNode(node).typeName() not in _LIGHT_NODE_TYPES:
+            return
+        for entry in self.entries:
+            if entry.handle.object() == node:
+                om.MMessage.removeCallback(entry.callback)
+                self.entries.remove(entry)
+                self.byName.pop(entry.name, None)
+                break
+        self.pending = [x for x in self.pending if x.isValid() and x.object() != node]
+
+    def _nameChanged(self, node, prevName, data):
+        # renaming a parent can change a light's partial path name too
+        if self.entries is not None and node.hasFn(om.MFn.kDagNode):
+            self.namesDirty = True
+
+    def _attributeChanged(self, entry, msg, plug):
+        if not msg & om.MNodeMessage.kAttributeSet:
+            return
+        name = plug.partialName(False, False, False, False, False, True)
+        if name == _MUTED_ATTR:
+            entry.muted = plug.asBool()
+        elif name == _SOLO_ATTR:
+            entry.solo = plug.asBool()
+
+    def _ensure(self):
+        if self.entries is None:
+            self.rebuild()
+            return
+        if self.pending:
+            pending, self.pending = self.pending, []
+            for handle in pending:
+                if handle.isValid() and handle.isAlive():
+                    light = lcGetLight(PyNode(handle.object()))
+                    if light is not None and light.name() not in self.byName:
+                        self._add(light)
+            self.namesDirty = True
+        if self.namesDirty:
+            self._reindex()
+
+    def getEntries(self):
+        """ Return the LightEntries sorted by name """
+        self._ensure()
+        return list(self.entries)
+
+    def getEntry(self, light):
+        self._ensure()
+        name = light if isinstance(light, basestring) else light.name()
+        return self.byName.get(name)
+
+    def lights(self):
+        return [x.light for x in self.getEntries()]
+
+    def soloLights(self):
+        return [x.light for x in self.getEntries() if x.solo]
+
+    def isMuted(self, light):
+        entry = self.getEntry(light)
+        return entry is not None and entry.muted
+
+    def isSolo(self, light):
+        entry = self.getEntry(light)
+        return entry is not None and entry.solo
+
+    def formatEntry(self, entry, soloing):
+        if soloing:
+            prefix = '[S]  ' if entry.solo else '[X]  '
+        else:
+            prefix = '[X]  ' if entry.muted else '[0]  '
+        return prefix + entry.name
+
+    def formattedItems(self):
+        """ Return (name, formatted name) of every light """
+        entries = self.getEntries()
+        soloing = bool([x for x in entries if x.solo])
+        return [(x.name, self.formatEntry(x, soloing)) for x in entries]
+
+    def formattedList(self):
+        return [x[1] for x in self.formattedItems()]
+
+# a reloaded module must not leave the old registry's callbacks behind
+try:
+    _registry.release()
+except NameError:
+    pass
+_registry = None
+
+def lcGetRegistry():
+    global _registry
+    if _registry is None:
+        _registry = LightRegistry()
+    return _registry
+
+def lcGetAllLights():
+    return lcGetRegistry().lights()
+
+@contextmanager
+def lcUndoChunk():
+    undoInfo(openChunk=1)
+    try:
+        yield
+    finally:
+        undoInfo(closeChunk=1)
+
+def lcLightNames(lights):
+    return set([x if isinstance(x, basestring) else x.name() for x in lights])
+
+def lcApplyState(solo, muted=None):
+    """
+    Set the solo lights (and the muted lights, if given) of the whole
+    scene in one batch.  Visibility follows the flags: with any light
+    soloed only the solo lights are visible, otherwise the unmuted ones.
+    The current visibility of the lights is read in one query, and only
+    lights whose visibility or flags differ are touched, with one hide
+    and one showHidden call, all in a single undo chunk.  Returns the number of
+    lights changed.
+    """
+    entries = lcGetRegistry().getEntries()
+    soloNames = lcLightNames(solo)
+    if muted is None:
+        mutedNames = set([x.name for x in entries if x.muted])
+    else:
+        mutedNames = lcLightNames(muted)
+    # lights may have been created or hidden by hand since the flags were set
+    visibleNames = lcLightNames(ls([x.light for x in entries], visible=1)) if entries else set()
+    soloing = bool([x for x in entries if x.name in soloNames])
+    toHide = []
+    toShow = []
+    attrs = []
+    changed = 0
+    for entry in entries:
+        newSolo = entry.name in soloNames
+        newMuted = entry.name in mutedNames
+        wasVisible = entry.name in visibleNames
+        visible = newSolo if soloing else not newMuted
+        if visible != wasVisible:
+            (toShow if visible else toHide).append(entry.light)
+        if newSolo != entry.solo:
+            attrs.append((entry.light.attr(_SOLO_ATTR), newSolo))
+        if newMuted != entry.muted:
+            attrs.append((entry.light.attr(_MUTED_ATTR), newMuted))
+        if visible != wasVisible or newSolo != entry.solo or newMuted != entry.muted:
+            changed += 1
+    if not changed:
+        return 0
+    with lcUndoChunk():
+        if toHide:
+            hide(toHide)
+        if toShow:
+            showHidden(toShow, a=1)
+        for attr, value in attrs:
+            attr.set(value)
+    return changed
+
+def lcSoloLights(lights):
+    """ Solo a group of lights """
+    return lcApplyState(lights)
 
 def lcSoloLight(light):
-    for aLight in lcGetAllLights():
-        hide(aLight)
-        aLight.attr(_SOLO_ATTR).set(False)
-    showHidden(light, a=1)
-    light.attr(_SOLO_ATTR).set(True)
+    return lcSoloLights([light])
     
 def lcUnsoloLight():
-    for light in lcGetAllLights():
-        if light.attr(_MUTED_ATTR).get():
-            hide(light)
-        else:
-            showHidden(light, a=1)
-        light.attr(_SOLO_ATTR).set(False)
+    return lcApplyState([])
         
 def lcGetSoloLight():
-    for light in lcGetAllLights():
-        if light.attr(_SOLO_ATTR).get():
-            return light
+    soloLights = lcGetRegistry().soloLights()
+    if soloLights:
+        return soloLights[0]
+
+def lcGetSoloLights():
+    return lcGetRegistry().soloLights()
             
 def lcIsMuted(light):
-    return light.attr(_MUTED_ATTR).get()
+    return lcGetRegistry().isMuted(light)
 
-def lcMuteLight(light, val=True):
-    light.attr(_MUTED_ATTR).set(val)
+def lcMuteLights(lights, val=True):
+    """ Mute or unmute a group of lights """
+    registry = lcGetRegistry()
+    muted = set([x.name for x in registry.getEntries() if x.muted])
     if val:
-        hide(light)
+        muted.update(lcLightNames(lights))
     else:
-        showHidden(light, a=1)
+        muted.difference_update(lcLightNames(lights))
+    return lcApplyState(registry.soloLights(), muted)
+
+def lcMuteLight(light, val=True):
+    return lcMuteLights([light], val)
+
+def lcGetPresets():
+    """ Return the light presets stored in the scene, as a dict of name -> {'solo': [...], 'muted': [...]} """
+    if _PRESETS_KEY not in fileInfo:
+        return {}
+    value = fileInfo[_PRESETS_KEY]
+    try:
+        return json.loads(value)
+    except ValueError:
+        # fileInfo can hand values back with their quotes escaped
+        return json.loads(value.decode('string_escape'))
+
+def lcSetPresets(presets):
+    fileInfo[_PRESETS_KEY] = json.dumps(presets, sort_keys=True)
+
+def lcSavePreset(name):
+    """ Store the current solo and mute state of every light in the scene as a preset """
+    entries = lcGetRegistry().getEntries()
+    presets = lcGetPresets()
+    presets[name] = {
+        'solo': [x.name for x in entries if x.solo],
+        'muted': [x.name for x in entries if x.muted],
+    }
+    lcSetPresets(presets)
+
+def lcLoadPreset(name):
+    """ Switch every light to a stored preset in one batch.  Lights missing from the scene are skipped """
+    preset = lcGetPresets()[name]
+    return lcApplyState(preset['solo'], preset['muted'])
+
+def lcDeletePreset(name):
+    presets = lcGetPresets()
+    presets.pop(name, None)
+    lcSetPresets(presets)
     
 def lcGetFormattedLightName(light):
-    curSoloLight = lcGetSoloLight()
-    if curSoloLight is not None:
-        if light == curSoloLight:
-            return '[S]  ' + light.name()
-        else:
-            return '[X]  ' + light.name()
-    else:
-        if light.attr(_MUTED_ATTR).get():
-            return '[X]  ' + light.name()
-        else:
-            return '[0]  ' + light.name()
+    registry = lcGetRegistry()
+    entry = registry.getEntry(light)
+    if entry is None:
+        # a light the registry missed, scan the scene again
+        registry.rebuild()
+        entry = registry.getEntry(light)
+    if entry is None:
+        return '[0]  ' + (light if isinstance(light, basestring) else light.name())
+    return registry.formatEntry(entry, bool(registry.soloLights()))
     
 def lcFormatLightList():
-    lightNameList = sorted([x.name() for x in lcGetAllLights()])
-    curSoloLight = lcGetSoloLight()
-    for i, light in enumerate(lightNameList):
-        if curSoloLight is not None:
-            if curSoloLight.name() == light:
-                lightNameList[i] = '[S]  ' + light
-            else:
-                lightNameList[i] = '[X]  ' + light
-        else:
-            print light
-            if ls(light)[0].attr(_MUTED_ATTR).get():
-                lightNameList[i] = '[X]  ' + light
-            else:
-                lightNameList[i] = '[0]  ' + light
-    return lightNameList
+    return lcGetRegistry().formattedList()
     
 class LightChoirGUI(object):
     selectedLight = None
+    selectedLights = []
     def __init__(self):
         windowName = 'lightChoirWin'
         openWindows = ls(regex=windowName + '[0-9]*')
@@ -130,58 +409,91 @@ class LightChoirGUI(object):
         self.win = window(title='LightChoir {0}'.format(__version__))
         with formLayout() as mainLayout:
             self.refreshBtn = rfb = button(l='Refresh', c=Callback(self.refreshCallback))
-            self.lightsList = lsl = textScrollList(ams=0, sc=Callback(self.selectCallback))
+            self.lightsList = lsl = textScrollList(ams=1, sc=Callback(self.selectCallback))
+            self.model = lightList.LightListModel()
             with horizontalLayout() as lhl:
                 self.muteBtn = button(l='Mute', c=Callback(self.muteCallback))
                 self.soloBtn = button(l='Solo', c=Callback(self.soloCallback))
+            with horizontalLayout() as phl:
+                self.presetMenu = optionMenu()
+                button(l='Load Preset', c=Callback(self.loadPresetCallback))
+                button(l='Save Preset', c=Callback(self.savePresetCallback))
         formLayout(mainLayout, e=1,
             attachForm=[
                 (rfb, 'left', 40), (rfb, 'top', 5), (rfb, 'right', 40),
                 (lsl, 'left', 5), (lsl, 'right', 5),
-                (lhl, 'left', 5), (lhl, 'bottom', 5), (lhl, 'right', 5)
+                (lhl, 'left', 5), (lhl, 'right', 5),
+                (phl, 'left', 5), (phl, 'bottom', 5), (phl, 'right', 5)
             ],
             attachControl=[
                 (lsl, 'top', 5, rfb),
-                (lsl, 'bottom', 5, lhl)
+                (lsl, 'bottom', 5, lhl),
+                (lhl, 'bottom', 5, phl)
             ])
+        self.refreshPresets()
         self.refreshCallback()
         self.win.show()
         
+    def getSelectedLights(self):
+        registry = lcGetRegistry()
+        entries = [registry.getEntry(self.model.nameAt(x - 1)) for x in self.lightsList.getSelectIndexedItem() or []]
+        self.selectedLights = [x.light for x in entries if x is not None]
+        self.selectedLight = self.selectedLights[0] if self.selectedLights else None
+        if self.selectedLights:
+            select(self.selectedLights)
+        return self.selectedLights
+
     def getSelectedLight(self):
-        if not len(self.lightsList.getSelectItem()):
-            return
-        selectedLightName = self.lightsList.getSelectItem()[0][5:]
-        self.selectedLight = ls(selectedLightName)[0]
-        select(self.selectedLight)
+        self.getSelectedLights()
         return self.selectedLight
         
+    def selectLights(self, lights):
+        """ Select the rows of lights in the list """
+        self.lightsList.deselectAll()
+        for light in lights:
+            row = self.model.row(light if isinstance(light, basestring) else light.name())
+            if row is not None:
+                self.lightsList.setSelectIndexedItem(row + 1)
+
     def selectLight(self, light):
-        lightName = lcGetFormattedLightName(light)
-        self.lightsList.setSelectItem(lightName)
-        select(self.selectedLight)
+        self.selectLights([light])
+        select(light)
             
     def selectCallback(self):
-        self.getSelectedLight()
-        if self.selectedLight.attr(_MUTED_ATTR).get():
+        self.getSelectedLights()
+        if not self.selectedLights:
+            return
+        if lcIsMuted(self.selectedLight):
             self.muteBtn.setLabel('Unmute')
         else:
             self.muteBtn.setLabel('Mute')
-        if self.selectedLight.attr(_SOLO_ATTR).get():
+        if self.isSoloed(self.selectedLights):
             self.soloBtn.setLabel('Unsolo')
         else:
             self.soloBtn.setLabel('Solo')
+
+    def isSoloed(self, lights):
+        return lcLightNames(lcGetSoloLights()) == lcLightNames(lights)
         
     def refreshCallback(self):
-        self.lightsList.removeAll()
-        for lightName in lcFormatLightList():
-            self.lightsList.append(lightName)
-        if self.selectedLight is not None:
-            self.selectLight(self.selectedLight)
+        selected = [self.model.nameAt(x - 1) for x in self.lightsList.getSelectIndexedItem() or []]
+        edits = self.model.update(lcGetRegistry().formattedItems())
+        for edit in edits:
+            if edit[0] == 'clear':
+                self.lightsList.removeAll()
+                continue
+            if edit[0] != 'insert':
+                self.lightsList.removeIndexedItem(edit[1] + 1)
+            if edit[0] != 'remove':
+                self.lightsList.appendPosition((edit[1] + 1, edit[2]))
+        # rows that were set again or rebuilt lose their selection
+        if [x for x in edits if x[0] != 'insert']:
+            self.selectLights(selected)
         
     def muteCallback(self):
-        if self.selectedLight is not None:
+        if self.selectedLights:
             newMuteStatus = not lcIsMuted(self.selectedLight)
-            lcMuteLight(self.selectedLight, newMuteStatus)
+            lcMuteLights(self.selectedLights, newMuteStatus)
             if newMuteStatus:
                 self.muteBtn.setLabel('Unmute')
             else:
@@ -189,10 +501,10 @@ class LightChoirGUI(object):
             self.refreshCallback()
         
     def soloCallback(self):
-        if self.selectedLight is not None:
-            newSoloStatus = not (lcGetSoloLight() == self.selectedLight)
+        if self.selectedLights:
+            newSoloStatus = not self.isSoloed(self.selectedLights)
             if newSoloStatus:
-                lcSoloLight(self.selectedLight)
+                lcSoloLights(self.selectedLights)
             else:
                 lcUnsoloLight()
             if newSoloStatus:
@@ -200,5 +512,29 @@ class LightChoirGUI(object):
             else:
                 self.soloBtn.setLabel('Solo')
             self.refreshCallback()
+
+    def refreshPresets(self, current=None):
+        for item in self.presetMenu.getItemListLong() or []:
+            deleteUI(item)
+        names = sorted(lcGetPresets())
+        for name in names:
+            menuItem(l=name, p=self.presetMenu)
+        if current in names:
+            self.presetMenu.setValue(current)
+
+    def savePresetCallback(self):
+        result = promptDialog(t='Save Preset', m='Preset Name:', b=['Save', 'Cancel'], db='Save', cb='Cancel', ds='Cancel')
+        name = promptDialog(q=1, tx=1).strip()
+        if result != 'Save' or not name:
+            return
+        lcSavePreset(name)
+        self.refreshPresets(name)
+
+    def loadPresetCallback(self):
+        name = self.presetMenu.getValue()
+        if name:
+            lcLoadPreset(name)
+            self.refreshCallback()
+            self.selectCallback()
             
 lightChoirGUI = LightChoirGUI()
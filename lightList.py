@@ -0,0 +1,62 @@
+"""
+lightList.py
+
+Row bookkeeping for the LightChoir light list, kept apart from Maya so
+it can be tested on its own.
+"""
+
+class LightListModel(object):
+    """
+    Rows of the light list, by light name.  update() diffs the new rows
+    against the current ones and returns the edits that bring the list
+    control up to date, so only the rows that changed are touched.
+    Edits are ('remove', row), ('insert', row, text), ('set', row, text)
+    and ('clear',), with 0-based rows, to be applied in order.  When the
+    edits would cost more calls than clearing the list and filling it
+    again (e.g. soloing changes the prefix of every row), that is
+    returned instead.
+    """
+    def __init__(self):
+        self.rowNames = []
+        self.texts = {}
+        self.rows = {}
+
+    def __repr__(self):
+        return 'LightListModel({0} rows)'.format(len(self.rowNames))
+
+    def __len__(self):
+        return len(self.rowNames)
+
+    def update(self, items):
+        """ Set the rows to items, a list of (name, text).  Returns the edits """
+        texts = dict(items)
+        names = [x[0] for x in items]
+        edits = []
+        kept = [x for x in self.rowNames if x in texts]
+        if kept == [x for x in names if x in self.texts]:
+            for row in reversed(range(len(self.rowNames))):
+                if self.rowNames[row] not in texts:
+                    edits.append(('remove', row))
+            for row, (name, text) in enumerate(items):
+                if name not in self.texts:
+                    edits.append(('insert', row, text))
+                elif self.texts[name] != text:
+                    edits.append(('set', row, text))
+            # a set is a remove and an insert
+            cost = len(edits) + len([x for x in edits if x[0] == 'set'])
+        else:
+            # the order changed, so build the list again
+            cost = None
+        if cost is None or cost > len(items) + 1:
+            edits = [('clear',)] + [('insert', row, text) for row, (name, text) in enumerate(items)]
+        self.rowNames = names
+        self.texts = texts
+        self.rows = dict([(name, row) for row, name in enumerate(names)])
+        return edits
+
+    def nameAt(self, row):
+        return self.rowNames[row]
+
+    def row(self, name):
+        """ Return the row of a light name, or None """
+        return self.rows.get(name)
@@ -13,48 +13,83 @@ MaxTumble on and off.
 
 from pymel.core import *
 
+import maya.cmds as cmds
+import eventScheduler
+import tumblePivot
+
+_engine = tumblePivot.PivotEngine(incremental=True)
+# mirrors Workspace.variables['ENABLE_MAXTUMBLE'], which is only read in init
+_enabled = False
+
 def convertSelectionToVertices():
+    """ Return the selected components as compact vertex ranges, and the selected objects """
+    components = [x for x in cmds.ls(sl=1) or [] if '.' in x]
+    # shading groups, sets, shapes etc. picked in the outliner have no translation
+    objects = cmds.ls(sl=1, type='transform') or []
     verts = []
-    for x in ls(sl=1, fl=1):
-        if isinstance(x, MeshFace) or isinstance(x, MeshEdge):
-            verts.append(x.connectedVertices())
-        else:
-            verts.append(x)
-    return verts
+    if components:
+        verts = cmds.polyListComponentConversion(components, tv=1) or []
+    return verts, objects
+
+
+def selectionFingerprint():
+    # the focused panel is included so switching viewports updates the new camera
+    return (cmds.getPanel(withFocus=1),) + tuple(cmds.ls(sl=1) or ())
+
+
+def activeCamera():
+    """ Return the camera of the focused viewport, or of the last active one """
+    panel = cmds.getPanel(withFocus=1)
+    if not panel or cmds.getPanel(typeOf=panel) != 'modelPanel':
+        panel = cmds.playblast(activeEditor=1)
+    return cmds.modelEditor(panel, q=1, camera=1)
 
 
 def avgSelPoint():
-    if eval(Workspace.variables['ENABLE_MAXTUMBLE']):
-        convertSelectionToVertices()
-        sel = ls(convertSelectionToVertices(), fl=1)
-        pnts = []
-        for x in sel:
-            try:
-                pnts.append(xform(x, q=1, t=1, ws=1))
-            except:
-                pass
-        if len(pnts):
-            tp = dt.Point()
-            for x in pnts:
-                tp += dt.Point(x)
-            tp = tp / float(len(sel))
-            for camera in ls(ca=1):
-                camera.setTumblePivot(tp)
+    if _enabled:
+        verts, objects = convertSelectionToVertices()
+        tp = _engine.pivot(verts, objects)
+        if tp is not None:
+            cmds.camera(activeCamera(), e=1, tumblePivot=tp)
+
+
+def deferIdle(func):
+    cmds.evalDeferred(func, lowestPriority=1)
+
+
+_scheduler = eventScheduler.CoalescingScheduler(avgSelPoint, deferIdle, selectionFingerprint)
+
+def onSelectionChanged():
+    if _enabled:
+        _scheduler.trigger()
+
+
+def onToolChanged():
+    # the selection may have been moved since the last update
+    if _enabled:
+        _scheduler.trigger(force=True)
                 
 
 def toggleMaxTumble():
-    Workspace.variables['ENABLE_MAXTUMBLE'] = not eval(Workspace.variables['ENABLE_MAXTUMBLE'])
+    global _enabled
+    _enabled = not _enabled
+    Workspace.variables['ENABLE_MAXTUMBLE'] = _enabled
     Workspace.save()
-    if eval(Workspace.variables['ENABLE_MAXTUMBLE']):
+    if _enabled:
+        _scheduler.trigger(force=True)
         mel.eval('print "MaxTumble Enabled"')
     else:
+        _engine.tracker.reset()
+        _engine.backend.release()
         mel.eval('print "MaxTumble Disabled"')
         
 
 def init():
+    global _enabled
     if 'ENABLE_MAXTUMBLE' not in Workspace.variables.keys():
         Workspace.variables['ENABLE_MAXTUMBLE'] = False
         Workspace.save()
-    tumblePivotScriptJobSelect = scriptJob(e=['SelectionChanged', Callback(avgSelPoint)], protected=1)
-    tumblePivotScriptJobToolChange = scriptJob(e=['ToolChanged', Callback(avgSelPoint)], protected=1)
+    _enabled = bool(eval(Workspace.variables['ENABLE_MAXTUMBLE']))
+    tumblePivotScriptJobSelect = scriptJob(e=['SelectionChanged', Callback(onSelectionChanged)], protected=1)
+    tumblePivotScriptJobToolChange = scriptJob(e=['ToolChanged', Callback(onToolChanged)], protected=1)
     tumbleCtx(n='tumbleContext', lt=0, ac=1)
@@ -0,0 +1,191 @@
+"""
+meshTopology.py
+
+Face adjacency and planar region growing for the modeling tools.  The
+topology is built once per mesh from the face vertex counts and vertex
+indices (as returned by Mesh.getVertices) into CSR arrays, so flood
+fills never go back to Maya.  Pure python, usable outside of Maya.
+"""
+
+import array
+import hashlib
+import math
+
+_CACHE_SIZE = 16
+_regionCache = {}
+_topologyCache = {}
+
+def topologyKey(faceCounts, faceConnects):
+	digest = hashlib.sha1(faceCounts)
+	digest.update(faceConnects)
+	return digest.hexdigest()
+
+class MeshTopology(object):
+	def __init__(self, faceCounts, faceConnects):
+		self.faceCounts = array.array('i', faceCounts)
+		self.faceConnects = array.array('i', faceConnects)
+		self.faceOffsets = array.array('i', [0])
+		for count in self.faceCounts:
+			self.faceOffsets.append(self.faceOffsets[-1] + count)
+		self.adjacencyOffsets, self.adjacency = self._buildAdjacency()
+		self.key = topologyKey(self.faceCounts, self.faceConnects)
+
+	def __repr__(self):
+		return 'MeshTopology({0} faces)'.format(self.numFaces)
+
+	@property
+	def numFaces(self):
+		return len(self.faceCounts)
+
+	def faceVertices(self, face):
+		return self.faceConnects[self.faceOffsets[face]:self.faceOffsets[face + 1]]
+
+	def edges(self):
+		""" Return a dict of (lowVertex, highVertex) edge -> list of faces using it """
+		edges = {}
+		for face in range(self.numFaces):
+			verts = self.faceVertices(face)
+			for i in range(len(verts)):
+				a, b = verts[i - 1], verts[i]
+				edges.setdefault((min(a, b), max(a, b)), []).append(face)
+		return edges
+
+	def borderVertices(self):
+		""" Return the sorted indices of vertices on open border edges """
+		verts = set()
+		for edge, faces in self.edges().items():
+			if len(faces) == 1:
+				verts.update(edge)
+		return sorted(verts)
+
+	def _buildAdjacency(self):
+		# faces are neighbors when they share an edge, as with MeshFace.connectedFaces
+		neighbors = [set() for x in range(self.numFaces)]
+		for faces in self.edges().values():
+			for a in faces:
+				for b in faces:
+					if a != b:
+						neighbors[a].add(b)
+		offsets = array.array('i', [0])
+		adjacency = array.array('i')
+		for faces in neighbors:
+			adjacency.extend(sorted(faces))
+			offsets.append(len(adjacency))
+		return offsets, adjacency
+
+	def neighbors(self, face):
+		return self.adjacency[self.adjacencyOffsets[face]:self.adjacencyOffsets[face + 1]]
+
+	def faceNormals(self, points):
+		"""
+		Return unit face normals, computed with Newell's method from a flat
+		xyz point array, as a flat array of floats.
+		"""
+		normals = array.array('d')
+		for face in range(self.numFaces):
+			verts = self.faceVertices(face)
+			nx = ny = nz = 0.0
+			for i in range(len(verts)):
+				a = verts[i - 1] * 3
+				b = verts[i] * 3
+				ax, ay, az = points[a], points[a + 1], points[a + 2]
+				bx, by, bz = points[b], points[b + 1], points[b + 2]
+				nx += (ay - by) * (az + bz)
+				ny += (az - bz) * (ax + bx)
+				nz += (ax - bx) * (ay + by)
+			length = math.sqrt(nx * nx + ny * ny + nz * nz)
+			if length:
+				nx, ny, nz = nx / length, ny / length, nz / length
+			normals.extend((nx, ny, nz))
+		return normals
+
+
+def getTopology(faceCounts, faceConnects):
+	"""
+	Return the MeshTopology of the face counts and vertex indices, reusing
+	the one built for the same faces before.  The key is a digest of the
+	arrays, which is much cheaper than building the adjacency.
+	"""
+	faceCounts = array.array('i', faceCounts)
+	faceConnects = array.array('i', faceConnects)
+	key = topologyKey(faceCounts, faceConnects)
+	if key not in _topologyCache:
+		if len(_topologyCache) >= _CACHE_SIZE:
+			_topologyCache.clear()
+		_topologyCache[key] = MeshTopology(faceCounts, faceConnects)
+	return _topologyCache[key]
+
+def pointsKey(points):
+	return hashlib.sha1(array.array('d', points)).hexdigest()
+
+def _isPlanar(normals, a, b, minDot):
+	a *= 3
+	b *= 3
+	return normals[a] * normals[b] + normals[a + 1] * normals[b + 1] + normals[a + 2] * normals[b + 2] >= minDot
+
+def growPlanarRegion(topology, normals, seeds, tol):
+	"""
+	Flood fill out from the seed faces, adding neighbors whose normal is
+	within tol radians of the face they were reached from.
+	"""
+	minDot = math.cos(tol)
+	visited = bytearray(topology.numFaces)
+	region = list(seeds)
+	for face in region:
+		visited[face] = 1
+	open = region[:]
+	while open:
+		face = open.pop()
+		for neighbor in topology.neighbors(face):
+			# a face rejected across a crease may still be reached from another neighbor
+			if not visited[neighbor] and _isPlanar(normals, face, neighbor, minDot):
+				visited[neighbor] = 1
+				open.append(neighbor)
+				region.append(neighbor)
+	return region
+
+def segmentPlanarRegions(topology, normals, tol):
+	""" Split every face of the mesh into coplanar regions.  Returns a region label per face """
+	minDot = math.cos(tol)
+	labels = array.array('i', [-1]) * topology.numFaces
+	region = 0
+	for seed in range(topology.numFaces):
+		if labels[seed] != -1:
+			continue
+		labels[seed] = region
+		open = [seed]
+		while open:
+			face = open.pop()
+			for neighbor in topology.neighbors(face):
+				if labels[neighbor] == -1 and _isPlanar(normals, face, neighbor, minDot):
+					labels[neighbor] = region
+					open.append(neighbor)
+		region += 1
+	return labels
+
+def planarRegions(topology, points, tol):
+	""" Return a list of face index lists, one per coplanar region, cached on topology and points """
+	key = (topology.key, pointsKey(points), tol)
+	if key not in _regionCache:
+		if len(_regionCache) >= _CACHE_SIZE:
+			_regionCache.clear()
+		labels = segmentPlanarRegions(topology, topology.faceNormals(points), tol)
+		regions = {}
+		for face, label in enumerate(labels):
+			regions.setdefault(label, []).append(face)
+		_regionCache[key] = [regions[x] for x in sorted(regions)]
+	return _regionCache[key]
+
+def clearCache():
+	_regionCache.clear()
+	_topologyCache.clear()
+
+def indexRanges(indices):
+	""" Collapse indices into sorted (start, end) inclusive ranges """
+	ranges = []
+	for i in sorted(set(indices)):
+		if ranges and ranges[-1][1] == i - 1:
+			ranges[-1][1] = i
+		else:
+			ranges.append([i, i])
+	return [tuple(x) for x in ranges]
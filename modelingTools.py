@@ -7,12 +7,20 @@ __email__ = 'clewis1@c.ringling.edu'
 from pymel.core import *
 from pymel.core.datatypes import *
 
+import multiprocessing
+from contextlib import contextmanager
+
+import meshTopology
+import pointBuffer
+import pointMath
+import spatialIndex
+
 _SNAPTO_VALUES = ('first', 'last', 'average')
 _AXIS_VALUES = ('min', 'max', 'average')
 _FLATTEN_INSTRUCTIONS = """1) Select the vertices, edges, and faces you want to flatten
 2) Choose the axes and type of flattening you want
 3) Click the "Flatten Selection" button"""
-_SNAP_INSTRUCTIONS = """1) Select the two objects you want to snap to each other
+_SNAP_INSTRUCTIONS = """1) Select the objects you want to snap to each other
 2) Choose the type of snapping and threshold
 3) Click the "Snap Meshes" button"""
 _SLOPE_INSTRUCTIONS = """1) Select an edge that you want to use as the slope.
@@ -24,28 +32,52 @@ def average(values):
 	return sum(values) / float(len(values))
 
 def getAxisValue(points, axis, value):
-	if value not in _AXIS_VALUES:
-		raise ValueError
-	if value == 'min':
-		return min([x[axis] for x in points])
-	elif value == 'average':
-		return average([x[axis] for x in points])
-	elif value == 'max':
-		return max([x[axis] for x in points])
+	return pointMath.axisValue(points, axis, value)
 		
 def flattenPoints(points, axes):
 	if not len(points):
 		return
-	if axes[0]:
-		avgX = getAxisValue(points, 0, axes[0])
-		points = [dt.Point(avgX, x.y, x.z) for x in points]
-	if axes[1]:
-		avgY = getAxisValue(points, 1, axes[1])
-		points = [dt.Point(x.x, avgY, x.z) for x in points]
-	if axes[2]:
-		avgZ = getAxisValue(points, 2, axes[2])
-		points = [dt.Point(x.x, x.y, avgZ) for x in points]
+	return pointMath.flatten(points, axes)
+
+@contextmanager
+def undoChunk():
+	undoInfo(openChunk=True)
+	try:
+		yield
+	finally:
+		undoInfo(closeChunk=True)
+
+def componentVertexIndices(components):
+	""" Return a list of (mesh, vertexIndices) for the given mesh components """
+	comps = [x for x in components if isinstance(x, (MeshVertex, MeshEdge, MeshFace))]
+	if not comps:
+		return []
+	meshes = []
+	indices = {}
+	for comp in ls(polyListComponentConversion(comps, tv=1)):
+		mesh = comp.node()
+		if mesh not in indices:
+			meshes.append(mesh)
+			indices[mesh] = set()
+		indices[mesh].update(comp.indices())
+	return [(x, sorted(indices[x])) for x in meshes]
+
+def selectedVertexIndices():
+	return componentVertexIndices(ls(sl=1))
+
+def gatherPoints(buffer, group):
+	""" Return the buffered points of a list of (mesh, vertexIndices) as one list """
+	points = []
+	for mesh, indices in group:
+		points.extend(buffer.getPoints(mesh, indices))
 	return points
+
+def scatterPoints(buffer, group, points):
+	""" Write points gathered with gatherPoints back into the buffer """
+	i = 0
+	for mesh, indices in group:
+		buffer.setPoints(mesh, indices, points[i:i + len(indices)])
+		i += len(indices)
 		
 def flattenSelection(**kwargs):
 	axes = [None for x in range(3)]
@@ -55,41 +87,52 @@ def flattenSelection(**kwargs):
 		axes[1] = kwargs['y']
 	if 'z' in kwargs.keys():
 		axes[2] = kwargs['z']
-	points = []
-	for node in ls(sl=1, fl=1):
-		if isinstance(node, MeshEdge) or isinstance(node, MeshFace):
-			for x in range(len(node.connectedVertices())):
-				points.append(node.getPoint(x, space='world'))
-		elif isinstance(node, MeshVertex):
-			points.append(node.getPosition(space='world'))
-	points = flattenPoints(points, axes)
-	i = 0
-	for node in ls(sl=1, fl=1):
-		if isinstance(node, MeshEdge) or isinstance(node, MeshFace):
-			for x in range(len(node.connectedVertices())):
-				points.append(node.getPoint(x, space='world'))
-				node.setPoint(points[i], x, space='world')
-		elif isinstance(node, MeshVertex):
-			node.setPosition(points[i], space='world')
-		i += 1
+	selection = selectedVertexIndices()
+	buffer = pointBuffer.MeshPointBuffer([x[0] for x in selection])
+	points = flattenPoints(gatherPoints(buffer, selection), axes)
+	if points is None:
+		return
+	scatterPoints(buffer, selection, points)
+	with undoChunk():
+		buffer.commit()
 
-def closestVert(mainVert, verts, threshold):
-	mainPoint = mainVert.getPosition(space='world')
-	minLength, minIndex = min([((x.getPosition(space='world') - mainPoint).length(), i)
+def closestVert(mainVert, verts, threshold, buffer=None):
+	if buffer is None:
+		buffer = pointBuffer.MeshPointBuffer(set([mainVert.node()] + [x.node() for x in verts]))
+	mainPoint = buffer.getPoint(mainVert.node(), mainVert.index())
+	minLength, minIndex = min([(spatialIndex.distanceSquared(buffer.getPoint(x.node(), x.index()), mainPoint), i)
 							  for i, x in enumerate(verts)])
-	if minLength <= threshold:
+	if minLength <= threshold * threshold:
 		return verts[minIndex]
 
-def snapVerts(first, last, snapTo):
+def snapPoints(buffer, first, last, snapTo):
+	""" Snap the buffered (mesh, index) points first and last together """
+	firstPoint = buffer.getPoint(*first)
+	lastPoint = buffer.getPoint(*last)
 	if snapTo == 'first':
-		last.setPosition(first.getPosition(space='world'), space='world')
+		buffer.setPoint(last[0], last[1], firstPoint)
 	elif snapTo == 'last':
-		first.setPosition(last.getPosition(space='world'), space='world')
+		buffer.setPoint(first[0], first[1], lastPoint)
 	elif snapTo == 'average':
-		verts = [first.getPosition(space='world'), last.getPosition(space='world')]
-		avgVert = sum(verts) / float(len(verts))
-		first.setPosition(avgVert, space='world')
-		last.setPosition(avgVert, space='world')
+		avgPoint = [(a + b) / 2.0 for a, b in zip(firstPoint, lastPoint)]
+		buffer.setPoint(first[0], first[1], avgPoint)
+		buffer.setPoint(last[0], last[1], avgPoint)
+
+def snapVerts(first, last, snapTo, buffer=None):
+	points = buffer
+	if points is None:
+		points = pointBuffer.MeshPointBuffer(set([first.node(), last.node()]))
+	snapPoints(points, (first.node(), first.index()), (last.node(), last.index()), snapTo)
+	if buffer is None:
+		with undoChunk():
+			points.commit()
+
+def getMesh(node):
+	if isinstance(node, nt.Transform):
+		node = node.getShape()
+	if not isinstance(node, nt.Mesh):
+		raise ValueError('{0} is not a mesh'.format(node))
+	return node
 
 def snapObjects(**kwargs):
 	soargs = {'snapTo':'average', 'threshold':0.1}
@@ -97,15 +140,65 @@ def snapObjects(**kwargs):
 	if soargs['snapTo'] not in _SNAPTO_VALUES:
 		raise ValueError
 	args = selected()
-	if len(args) != 2:
-		raise ValueError('Must have exactly 2 meshes selected')
-	verts1 = {}.fromkeys(ls(args[0].vtx, fl=1))
-	verts2 = ls(args[1].vtx, fl=1)
-	for i, vert in enumerate(verts1.keys()):
-		cv = closestVert(vert, verts2, soargs['threshold'])
-		if cv and cv not in verts1.values():
-			verts1[vert] = cv
-			snapVerts(vert, cv, soargs['snapTo'])
+	if len(args) < 2:
+		raise ValueError('Must have at least 2 meshes selected')
+	if len(args) > 2:
+		return snapMeshes(args, **soargs)
+	mesh1, mesh2 = [getMesh(x) for x in args]
+	# fetch each mesh's points once and match them through a spatial index
+	buffer = pointBuffer.MeshPointBuffer([mesh1, mesh2])
+	points1 = buffer.getPoints(mesh1)
+	points2 = buffer.getPoints(mesh2)
+	matches = spatialIndex.matchPoints(points1, points2, soargs['threshold'])
+	for i, j in matches:
+		snapPoints(buffer, (mesh1, i), (mesh2, j), soargs['snapTo'])
+	with undoChunk():
+		buffer.commit()
+	return {(mesh1, mesh2): len(matches)}
+
+def snapMeshes(meshes, snapTo='average', threshold=0.1, borderOnly=True, processes=None):
+	"""
+	Weld any number of meshes along their shared borders.  All candidate
+	vertices go into one spatial index and every cross mesh pair under the
+	threshold is found in a single sweep, split across a process pool when
+	running headless.  Returns a dict of (meshA, meshB) -> pairs snapped.
+	"""
+	if snapTo not in _SNAPTO_VALUES:
+		raise ValueError
+	meshes = [getMesh(x) for x in meshes]
+	if processes is None:
+		processes = multiprocessing.cpu_count() if about(batch=1) else 1
+	buffer = pointBuffer.MeshPointBuffer(meshes)
+	points = []
+	owners = []
+	verts = []
+	for owner, mesh in enumerate(meshes):
+		if borderOnly:
+			indices = getTopology(mesh).borderVertices()
+		else:
+			indices = range(buffer.count(mesh))
+		points.extend(buffer.getPoints(mesh, indices))
+		owners.extend([owner] * len(indices))
+		verts.extend([(mesh, i) for i in indices])
+	pairs = spatialIndex.crossPairs(points, owners, threshold, processes)
+	# snap each connected cluster of pairs to one point, so corners shared
+	# by several meshes end up in the same place
+	for cluster in spatialIndex.clusterPairs(pairs):
+		if snapTo == 'first':
+			target = points[min(cluster, key=lambda x: owners[x])]
+		elif snapTo == 'last':
+			target = points[max(cluster, key=lambda x: owners[x])]
+		else:
+			target = [sum([points[x][axis] for x in cluster]) / float(len(cluster)) for axis in range(3)]
+		for x in cluster:
+			buffer.setPoint(verts[x][0], verts[x][1], target)
+	with undoChunk():
+		buffer.commit()
+	summary = {}
+	for i, j in pairs:
+		key = (meshes[owners[i]], meshes[owners[j]])
+		summary[key] = summary.get(key, 0) + 1
+	return summary
 
 def getSlope(rise, run):
 	args = ls(sl=1, fl=1)
@@ -127,39 +220,56 @@ def getSlope(rise, run):
 	else:
 		raise ZeroDivisionError()
 
-def slopeVerts(slope, rise, run, highestAxis, reverse=1):
-	verts = ls(sl=1, fl=1)
-	highestVert = verts[0]
-	for vert in verts:
-		highestPosition = highestVert.getPosition(space='world')
-		curPosition = vert.getPosition(space='world')
-		if curPosition[highestAxis] > highestPosition[highestAxis] * reverse:
-			highestVert = vert
-	highestPosition = highestVert.getPosition(space='world')
-	for vert in verts:
-		curPosition = vert.getPosition(space='world')
-		delta = curPosition - highestPosition
-		curPosition[rise] += delta[run] * slope
-		vert.setPosition(curPosition, space='world')
+def slopeGroups(groups, slope, rise, run, highestAxis, reverse=1):
+	"""
+	Slope each group of (mesh, vertexIndices) independently, each around
+	its own anchor vertex, and write every mesh back as one undo step.
+	"""
+	buffer = pointBuffer.MeshPointBuffer([mesh for group in groups for mesh, indices in group])
+	for group in groups:
+		points = gatherPoints(buffer, group)
+		if points:
+			scatterPoints(buffer, group, pointMath.slope(points, slope, rise, run, highestAxis, reverse))
+	with undoChunk():
+		buffer.commit()
+
+def slopeVerts(slope, rise, run, highestAxis, reverse=1, perMesh=False):
+	selection = selectedVertexIndices()
+	if perMesh:
+		groups = [[x] for x in selection]
+	else:
+		groups = [selection]
+	slopeGroups(groups, slope, rise, run, highestAxis, reverse)
+
+def slopeSelections(selections, slope, rise, run, highestAxis, reverse=1):
+	""" Slope several lists of components in one call, each with its own anchor """
+	slopeGroups([componentVertexIndices(x) for x in selections], slope, rise, run, highestAxis, reverse)
+
+def getTopology(mesh):
+	faceCounts, faceConnects = mesh.getVertices()
+	return meshTopology.getTopology(faceCounts, faceConnects)
+
+def faceComponents(mesh, faces):
+	return ['{0}.f[{1}:{2}]'.format(mesh, a, b) for a, b in meshTopology.indexRanges(faces)]
 
 def selectPlane(tol=0.0001):
-	open = ls(selected(), fl=1)
-	closed = open[:]
-	planar = open[:]
-	while open:
-		currentFace = open.pop()
-		currentNormal = currentFace.getNormal(space='world')
-		for neighbor in currentFace.connectedFaces():
-			if neighbor in closed:
-				continue
-			neighborNormal = neighbor.getNormal(space='world')
-			diff = math.acos(currentNormal.dot(neighborNormal))
-			if diff <= tol:
-				open.append(neighbor)
-				planar.append(neighbor)
-			closed.append(neighbor)
+	seeds = {}
+	for face in ls(sl=1):
+		if isinstance(face, MeshFace):
+			seeds.setdefault(face.node(), []).extend(face.indices())
+	planar = []
+	for mesh, faces in seeds.items():
+		topology = getTopology(mesh)
+		normals = topology.faceNormals(pointBuffer.PymelBackend().readPoints(mesh))
+		planar.extend(faceComponents(mesh, meshTopology.growPlanarRegion(topology, normals, faces, tol)))
 	select(planar)
 
+def getPlanarRegions(mesh, tol=0.0001):
+	""" Return every coplanar region of mesh as a list of face index lists """
+	mesh = getMesh(mesh)
+	points = pointBuffer.PymelBackend().readPoints(mesh)
+	return meshTopology.planarRegions(getTopology(mesh), points, tol)
+
 
 class ModGUI(object):
 
@@ -290,8 +400,10 @@ class ModGUI(object):
 			sokwargs['snapTo'] = _SNAPTO_VALUES[2]
 		else:
 			Exception('Invalid Snap To value')
-		snapObjects(**sokwargs)
-		mel.eval('print "Heck yes!  You snapped two objects together!"')
+		summary = snapObjects(**sokwargs)
+		pairs = ', '.join(['{0} -> {1}: {2}'.format(first, last, count) for (first, last), count in sorted(summary.items())])
+		mel.eval('print "Heck yes!  You snapped {0} objects together! ({1} verts: {2})"'.format(
+			len(selected()), sum(summary.values()), pairs))
 		
 	def getSlope(self):
 		for i in range(len(self.riseRadio)):
@@ -3,11 +3,18 @@ __init__.py
 Created by Chris Lewis on 9/26/2012
 """
 
+import catalog
 import core
+import farm
+import fileTree
 import gui
+import history
+import tagIndex
 import tagging
 import versions
+import watcher
 
 def reloadAll():
-	for mod in (core, gui, tagging, versions):
+	tagging.releaseIndex()
+	for mod in (catalog, core, farm, fileTree, gui, history, tagIndex, tagging, versions, watcher):
 		reload(mod)
@@ -0,0 +1,246 @@
+"""
+catalog.py
+
+SQLite catalog of the files in the assets tree, for queries across
+packages without walking every folder.  The catalog is refreshed
+incrementally: every known folder is stat'ed, and only folders whose
+mtime changed are listed again.  Overwriting a file doesn't change its
+folder's mtime, so queries that depend on file sizes or mtimes stat the
+files they cover again.  The database lives on the local disk, since
+SQLite locking isn't reliable on network shares.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import fileTree
+import versions
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS dirs (
+	path TEXT PRIMARY KEY,
+	parent TEXT,
+	package TEXT,
+	subdir TEXT,
+	mtime REAL
+);
+CREATE INDEX IF NOT EXISTS dirsParent ON dirs (parent);
+CREATE TABLE IF NOT EXISTS files (
+	path TEXT PRIMARY KEY,
+	dir TEXT,
+	package TEXT,
+	subdir TEXT,
+	name TEXT,
+	key TEXT,
+	baseName TEXT,
+	version INTEGER,
+	size INTEGER,
+	mtime REAL
+);
+CREATE INDEX IF NOT EXISTS filesDir ON files (dir);
+CREATE INDEX IF NOT EXISTS filesSubdir ON files (subdir, package, key, version);
+'''
+
+_FILE_COLUMNS = ('path', 'dir', 'package', 'subdir', 'name', 'key', 'baseName', 'version', 'size', 'mtime')
+
+def defaultDbPath(assetsPath):
+	digest = hashlib.sha1(os.path.normcase(os.path.abspath(assetsPath)).encode('utf-8')).hexdigest()
+	return os.path.join(os.path.expanduser('~'), '.thesisPipeline', 'catalog_{0}.db'.format(digest[:12]))
+
+def scanDirectory(path):
+	""" Return ([(name, size, mtime)] for files, [name] for dirs) of path """
+	files = []
+	dirs = []
+	if fileTree.scandir is not None:
+		for entry in fileTree.scandir(path):
+			if entry.is_dir():
+				dirs.append(entry.name)
+			elif entry.is_file():
+				st = entry.stat()
+				files.append((entry.name, st.st_size, st.st_mtime))
+	else:
+		for name in os.listdir(path):
+			full = os.path.join(path, name)
+			if os.path.isdir(full):
+				dirs.append(name)
+			elif os.path.isfile(full):
+				st = os.stat(full)
+				files.append((name, st.st_size, st.st_mtime))
+	return files, dirs
+
+
+class Catalog(object):
+	"""
+	Packages, subdirs and files of an assets folder.  Queries call
+	refresh() first unless the last refresh is less than ttl seconds old.
+	"""
+	def __init__(self, assetsPath, dbPath=None, ttl=2.0):
+		self.assetsPath = os.path.normpath(assetsPath)
+		self.dbPath = defaultDbPath(self.assetsPath) if dbPath is None else dbPath
+		self.ttl = ttl
+		self.refreshed = None
+		self.lock = threading.RLock()
+		if self.dbPath != ':memory:' and not os.path.isdir(os.path.dirname(self.dbPath)):
+			os.makedirs(os.path.dirname(self.dbPath))
+		self.connection = sqlite3.connect(self.dbPath, check_same_thread=False)
+		self.connection.executescript(_SCHEMA)
+
+	def __repr__(self):
+		return 'Catalog({0})'.format(self.assetsPath)
+
+	def close(self):
+		self.connection.close()
+
+	def _location(self, path):
+		""" Return the (package, subdir) of a folder under the assets folder """
+		rel = os.path.relpath(path, self.assetsPath)
+		if rel == os.curdir:
+			return None, None
+		parts = rel.split(os.sep)
+		return parts[0], '/'.join(parts[1:])
+
+	def refresh(self):
+		""" Bring the catalog up to date.  Returns the number of folders that were listed again """
+		with self.lock:
+			with self.connection:
+				count = self._refresh()
+			self.refreshed = time.time()
+			return count
+
+	def ensureFresh(self):
+		if self.refreshed is None or time.time() - self.refreshed >= self.ttl:
+			self.refresh()
+
+	def invalidate(self):
+		""" Make the next query refresh the catalog """
+		self.refreshed = None
+
+	def _refresh(self):
+		db = self.connection
+		known = dict(db.execute('SELECT path, mtime FROM dirs').fetchall())
+		seen = set()
+		count = 0
+		stack = [self.assetsPath]
+		while stack:
+			path = stack.pop()
+			try:
+				mtime = os.stat(path).st_mtime
+			except OSError:
+				continue
+			seen.add(path)
+			if path in known and known[path] == mtime:
+				stack.extend([x[0] for x in db.execute('SELECT path FROM dirs WHERE parent = ?', (path,))])
+				continue
+			try:
+				files, dirs = scanDirectory(path)
+			except OSError:
+				continue
+			count += 1
+			package, subdir = self._location(path)
+			# an mtime this recent may not show later changes, so check again next time
+			if time.time() - mtime < fileTree._MTIME_RESOLUTION:
+				mtime = None
+			db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?)',
+				(path, os.path.dirname(path) if package else None, package, subdir, mtime))
+			db.execute('DELETE FROM files WHERE dir = ?', (path,))
+			if package is not None:
+				rows = []
+				for name, size, fileMtime in files:
+					rows.append((os.path.join(path, name), path, package, subdir, name,
+						versions.removeVersion(name), name.split('.')[0], versions.getVersion(name), size, fileMtime))
+				db.executemany('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+			childDirs = [os.path.join(path, x) for x in dirs]
+			# forget folders that were removed since the last listing
+			for child in [x[0] for x in db.execute('SELECT path FROM dirs WHERE parent = ?', (path,))]:
+				if child not in childDirs:
+					self._removeDir(child)
+			stack.extend(childDirs)
+		for path in set(known) - seen:
+			self._removeDir(path)
+		return count
+
+	def _removeDir(self, path):
+		prefix = os.path.join(path, '')
+		pattern = prefix.replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%'
+		for table, column in (('dirs', 'path'), ('files', 'dir')):
+			self.connection.execute("DELETE FROM {0} WHERE {1} = ? OR {1} LIKE ? ESCAPE '!'".format(table, column), (path, pattern))
+
+	def restatFiles(self, where, args=()):
+		"""
+		Stat the catalogued files matching the sql condition where again,
+		updating files that were overwritten in place and dropping files
+		that are gone.  Returns the number of rows changed.
+		"""
+		self.ensureFresh()
+		with self.lock:
+			with self.connection:
+				db = self.connection
+				count = 0
+				for path, size, mtime in db.execute('SELECT path, size, mtime FROM files WHERE ' + where, args).fetchall():
+					try:
+						st = os.stat(path)
+					except OSError:
+						db.execute('DELETE FROM files WHERE path = ?', (path,))
+						count += 1
+						continue
+					if st.st_size != size or st.st_mtime != mtime:
+						db.execute('UPDATE files SET size = ?, mtime = ? WHERE path = ?', (st.st_size, st.st_mtime, path))
+						count += 1
+				return count
+
+	def query(self, sql, args=()):
+		""" Run sql against the refreshed catalog and return all rows """
+		self.ensureFresh()
+		with self.lock:
+			return self.connection.execute(sql, args).fetchall()
+
+	def packages(self):
+		return [x[0] for x in self.query('SELECT package FROM dirs WHERE subdir = ? ORDER BY package', ('',))]
+
+	def files(self, subdir=None, package=None):
+		""" Return file rows, as dicts of _FILE_COLUMNS, optionally limited to a subdir and package """
+		where = '1'
+		args = []
+		for column, value in (('subdir', subdir), ('package', package)):
+			if value is not None:
+				where += ' AND {0} = ?'.format(column)
+				args.append(value)
+		self.restatFiles(where, args)
+		sql = 'SELECT {0} FROM files WHERE {1} ORDER BY path'.format(', '.join(_FILE_COLUMNS), where)
+		return [dict(zip(_FILE_COLUMNS, x)) for x in self.query(sql, args)]
+
+	def latestPaths(self, subdir, package=None):
+		""" Return the path of the latest version of every file in subdir of every package (or of one package) """
+		sql = '''
+			SELECT f.path FROM files f JOIN (
+				SELECT dir, key, MAX(version) AS version FROM files
+				WHERE subdir = ? {0} GROUP BY dir, key
+			) latest ON f.dir = latest.dir AND f.key = latest.key AND f.version = latest.version
+			ORDER BY f.path'''.format('AND package = ?' if package is not None else '')
+		args = [subdir] if package is None else [subdir, package]
+		return [x[0] for x in self.query(sql, args)]
+
+	def latestVersion(self, subdir, package, name):
+		""" Return the latest version number of name in a package subdir, or 0 """
+		row = self.query('SELECT MAX(version) FROM files WHERE subdir = ? AND package = ? AND key = ?',
+			(subdir, package, versions.removeVersion(name)))
+		return row[0][0] or 0
+
+	def newerPackages(self, subdir, thanSubdir):
+		"""
+		Return the packages whose newest file in subdir is newer than their
+		newest file in thanSubdir (or that have nothing in thanSubdir)
+		"""
+		sql = '''
+			SELECT a.package FROM
+				(SELECT package, MAX(mtime) AS mtime FROM files WHERE subdir = ? GROUP BY package) a
+			LEFT JOIN
+				(SELECT package, MAX(mtime) AS mtime FROM files WHERE subdir = ? GROUP BY package) b
+			ON a.package = b.package
+			WHERE b.mtime IS NULL OR a.mtime > b.mtime
+			ORDER BY a.package'''
+		self.restatFiles('subdir IN (?, ?)', (subdir, thanSubdir))
+		return [x[0] for x in self.query(sql, (subdir, thanSubdir))]
@@ -3,11 +3,23 @@ core.py
 Created by Chris Lewis on 9/26/2012
 """
 
+import array
+import errno
+import hashlib
 import os
 import shutil
 import re
+import tarfile
+import threading
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
+import maya.utils
 import pymel.core as pm
+import catalog
+import farm
+import fileTree
+import history
 import tagging
 import versions
 
@@ -15,6 +27,11 @@ _PROJECT_ROOT = 'Z:\\THESIS'
 _UDK_TAG = 'udkExport'
 _ZBRUSH_TAG = 'zbrushExport'
 _XNORMAL_TAG = 'xnormalExport'
+_EXPORT_FORMATS = {
+	_UDK_TAG : ('udk', '.fbx'),
+	_ZBRUSH_TAG : ('zbrush', '.obj'),
+	_XNORMAL_TAG : ('xnormal', '.obj'),
+}
 _PACKAGE_SUBDIRS = [
 	'maya', 
 	'photoshop', 
@@ -31,59 +48,287 @@ _PACKAGE_SUBDIRS = [
 	'zbrush/history',
 ]
 
+_BULK_WORKERS = 8
+
 def makedirs(path):
+	""" Make path and its parents, succeeding if it already exists """
 	try:
 		os.makedirs(path)
-	except:
-		pass
+	except OSError as e:
+		if e.errno != errno.EEXIST or not os.path.isdir(path):
+			raise
 
 def cleanJoin(*args):
 	return os.path.normpath(os.path.join(*args))
 
+def isValidName(name):
+	return re.match('^\w+$', name) is not None
+
+
+class OperationReport(object):
+	"""
+	The outcome of a bulk package operation: the planned (action, path)
+	steps, the paths that were done and (path, error) failures.  Nothing
+	is done for a dry run, so only the plan is filled in.
+	"""
+	def __init__(self, dryrun=False):
+		self.dryrun = dryrun
+		self.planned = []
+		self.done = []
+		self.failed = []
+
+	def __repr__(self):
+		return 'OperationReport({0} planned, {1} done, {2} failed)'.format(
+			len(self.planned), len(self.done), len(self.failed))
+
+	def merge(self, other):
+		self.planned.extend(other.planned)
+		self.done.extend(other.done)
+		self.failed.extend(other.failed)
+
+class _StepError(Exception):
+	pass
+
+def _runStep(step):
+	action, path, func, args = step
+	try:
+		func(*args)
+	except (OSError, IOError, shutil.Error, tarfile.TarError) as e:
+		return path, e
+	except _StepError as e:
+		return path, e.args[0]
+	return path, None
+
+def runSteps(steps, dryrun=False, workers=_BULK_WORKERS):
+	"""
+	Run (action, path, func, args) steps concurrently on a thread pool,
+	which hides the latency of each call on network shares.  Returns an
+	OperationReport.
+	"""
+	report = OperationReport(dryrun)
+	report.planned = [(x[0], x[1]) for x in steps]
+	if dryrun or not steps:
+		return report
+	pool = ThreadPool(min(workers, len(steps)))
+	try:
+		results = pool.map(_runStep, steps)
+	finally:
+		pool.close()
+		pool.join()
+	for path, error in results:
+		if error is None:
+			report.done.append(path)
+		else:
+			report.failed.append((path, error))
+	return report
+
 class PackageManager(object):
-	def __init__(self, root=_PROJECT_ROOT):
+	def __init__(self, root=_PROJECT_ROOT, tree=None):
 		self.root = root
 		self.assetsPath = cleanJoin(self.root, 'assets')
+		# cached listings, shared with the packages and files handed out
+		self.tree = fileTree.getTree() if tree is None else tree
+		self._catalog = None
 
 	def __repr__(self):
 		return 'PackageManager({0})'.format(self.root)
 
 	def addPackage(self, name):
-		packagePath = cleanJoin(self.assetsPath, name)
-		for subdir in _PACKAGE_SUBDIRS:
-			makedirs(cleanJoin(packagePath, subdir))
+		return self.addPackages([name])
 
 	def removePackage(self, name):
-		shutil.rmtree(cleanJoin(self.assetsPath, name))
+		return self.removePackages([name])
+
+	def addPackages(self, names, dryrun=False, workers=_BULK_WORKERS):
+		""" Create packages with all of their subdirectories.  Returns an OperationReport """
+		steps = []
+		invalid = []
+		for name in names:
+			if not isValidName(name):
+				invalid.append((cleanJoin(self.assetsPath, name), 'invalid package name'))
+				continue
+			packagePath = cleanJoin(self.assetsPath, name)
+			for subdir in _PACKAGE_SUBDIRS:
+				steps.append(('mkdir', cleanJoin(packagePath, subdir), makedirs, (cleanJoin(packagePath, subdir),)))
+		report = runSteps(steps, dryrun, workers)
+		report.failed.extend(invalid)
+		self._invalidatePackages(names)
+		return report
+
+	def removePackages(self, names, dryrun=False, workers=_BULK_WORKERS):
+		"""
+		Delete packages.  The top level entries of every package are removed
+		concurrently, then the emptied package folders.  Returns an OperationReport.
+		"""
+		report = OperationReport(dryrun)
+		steps = []
+		packagePaths = []
+		for name in names:
+			packagePath = cleanJoin(self.assetsPath, name)
+			if not self.tree.isDir(packagePath):
+				report.failed.append((packagePath, 'no such package'))
+				continue
+			packagePaths.append(packagePath)
+			for entry in self.tree.dirs(packagePath):
+				path = cleanJoin(packagePath, entry)
+				steps.append(('rmtree', path, _rmtree, (path,)))
+			for entry in self.tree.files(packagePath):
+				path = cleanJoin(packagePath, entry)
+				steps.append(('remove', path, os.remove, (path,)))
+		report.merge(runSteps(steps, dryrun, workers))
+		failed = set([x[0] for x in report.failed])
+		# only remove package folders whose contents are all gone
+		steps = [('rmdir', x, os.rmdir, (x,)) for x in packagePaths
+			if not [y for y in failed if y.startswith(os.path.join(x, ''))]]
+		report.merge(runSteps(steps, dryrun, workers))
+		self._invalidatePackages(names)
+		return report
+
+	def renamePackages(self, names, dryrun=False, workers=_BULK_WORKERS):
+		""" Rename packages from a dict of oldName -> newName.  Returns an OperationReport """
+		report = OperationReport(dryrun)
+		steps = []
+		targets = set()
+		for oldName, newName in sorted(names.items()):
+			oldPath = cleanJoin(self.assetsPath, oldName)
+			newPath = cleanJoin(self.assetsPath, newName)
+			if not isValidName(newName):
+				report.failed.append((oldPath, 'invalid package name {0}'.format(newName)))
+			elif not self.tree.isDir(oldPath):
+				report.failed.append((oldPath, 'no such package'))
+			elif newName in targets or self.tree.isDir(newPath):
+				report.failed.append((oldPath, '{0} already exists'.format(newName)))
+			else:
+				targets.add(newName)
+				steps.append(('rename', oldPath, _renameNew, (oldPath, newPath)))
+		report.merge(runSteps(steps, dryrun, workers))
+		self._invalidatePackages(list(names.keys()) + list(names.values()))
+		return report
+
+	def archivePackages(self, names, archiveDir, dryrun=False, workers=_BULK_WORKERS):
+		"""
+		Write each package to archiveDir/name.tar.gz, streaming the files
+		straight into the archive.  Files that can't be read are reported
+		and left out.  Returns an OperationReport.
+		"""
+		report = OperationReport(dryrun)
+		steps = []
+		errors = []
+		for name in names:
+			packagePath = cleanJoin(self.assetsPath, name)
+			if not self.tree.isDir(packagePath):
+				report.failed.append((packagePath, 'no such package'))
+				continue
+			archivePath = cleanJoin(archiveDir, '{0}.tar.gz'.format(name))
+			steps.append(('archive', archivePath, archivePackage, (packagePath, archivePath, errors)))
+		if steps and not dryrun:
+			makedirs(archiveDir)
+		report.merge(runSteps(steps, dryrun, workers))
+		report.failed.extend(errors)
+		self.tree.invalidate(archiveDir)
+		return report
+
+	def invalidateCatalog(self):
+		""" Make the next catalog query refresh the catalog, if it is in use """
+		if self._catalog is not None:
+			self._catalog.invalidate()
+
+	def _invalidatePackages(self, names):
+		self.invalidateCatalog()
+		self.tree.invalidate(self.assetsPath)
+		for name in names:
+			self.tree.invalidate(cleanJoin(self.assetsPath, name), recursive=True)
 
 	def getPackage(self, name):
-		packageStrings = os.listdir(self.assetsPath)
-		if name in packageStrings:
-			return Package(cleanJoin(self.assetsPath, name))
+		if self.tree.isDir(cleanJoin(self.assetsPath, name)):
+			return Package(cleanJoin(self.assetsPath, name), self.tree)
+
+	@property
+	def catalog(self):
+		""" The SQLite catalog of the assets folder, see catalog.py """
+		if self._catalog is None:
+			self._catalog = catalog.Catalog(self.assetsPath)
+		return self._catalog
+
+	def findFiles(self, subdir=None, package=None):
+		""" Return MayaFiles for every catalogued file, optionally limited to a subdir and package """
+		return [MayaFile(x['path'], self.tree) for x in self.catalog.files(subdir, package)]
+
+	def latestFiles(self, subdir, package=None):
+		""" Return MayaFiles for the latest version of each file in subdir, across packages or in one package """
+		return [MayaFile(x, self.tree) for x in self.catalog.latestPaths(subdir, package)]
+
+	def newerPackages(self, subdir, thanSubdir):
+		"""
+		Return the packages with files in subdir newer than their newest
+		file in thanSubdir, e.g. newerPackages('maya', 'udk') for packages
+		whose udk export is out of date
+		"""
+		return [Package(cleanJoin(self.assetsPath, x), self.tree) for x in self.catalog.newerPackages(subdir, thanSubdir)]
 
 	@property
 	def packages(self):
-		return [Package(x) for x in self.packagePaths]
+		return [Package(x, self.tree) for x in self.packagePaths]
 		
 	@property
 	def packagePaths(self):
-		packageStrings = os.listdir(self.assetsPath)
-		return [cleanJoin(self.assetsPath, x) for x in sorted(packageStrings)]
-
+		return [cleanJoin(self.assetsPath, x) for x in self.tree.dirs(self.assetsPath)]
+
+
+
+def _rmtree(path):
+	errors = []
+	shutil.rmtree(path, onerror=lambda func, p, excInfo: errors.append((p, excInfo[1])))
+	if errors:
+		raise _StepError('; '.join(['{0}: {1}'.format(p, e) for p, e in errors]))
+
+def _renameNew(oldPath, newPath):
+	# os.rename replaces an existing folder on some platforms
+	if os.path.exists(newPath):
+		raise _StepError('{0} already exists'.format(newPath))
+	os.rename(oldPath, newPath)
+
+def archivePackage(packagePath, archivePath, errors=None):
+	"""
+	Stream packagePath into a gzipped tarball at archivePath.  Files that
+	can't be read are skipped, and appended to errors as (path, error).
+	"""
+	if errors is None:
+		errors = []
+	root = os.path.dirname(packagePath)
+	tempPath = archivePath + '.tmp'
+	tar = tarfile.open(tempPath, 'w:gz')
+	try:
+		for dirPath, dirs, files in os.walk(packagePath):
+			dirs.sort()
+			for name in [dirPath] + [os.path.join(dirPath, x) for x in sorted(files)]:
+				try:
+					tar.add(name, os.path.relpath(name, root), recursive=False)
+				except (OSError, IOError) as e:
+					errors.append((name, e))
+	except:
+		tar.close()
+		os.remove(tempPath)
+		raise
+	tar.close()
+	if os.path.exists(archivePath):
+		os.remove(archivePath)
+	os.rename(tempPath, archivePath)
 
 
 class Package(object):
-	def __init__(self, path):
+	def __init__(self, path, tree=None):
 		self.path = path
+		self.tree = fileTree.getTree() if tree is None else tree
 
 	def __repr__(self):
 		return 'Package({0})'.format(self.path)
 
 	@property
 	def manager(self):
-		assetsPath = os.path.split(path)[0]
+		assetsPath = os.path.split(self.path)[0]
 		root = os.path.split(assetsPath)[0]
-		return PackageManager(root)
+		return PackageManager(root, self.tree)
 
 	@property
 	def name(self):
@@ -92,15 +337,16 @@ class Package(object):
 	def name(self, value):
 		assert re.match('\w+', value), 'invalid name'
 		os.rename(self.path, cleanJoin(os.path.split(self.path)[0], value))
+		self.tree.invalidate(os.path.split(self.path)[0])
+		self.tree.invalidate(self.path, recursive=True)
 
 	def subdirFiles(self, subdir):
 		path = self.subdirPath(subdir)
-		files = [MayaFile(cleanJoin(path, x)) for x in sorted(os.listdir(path))]
-		return [x for x in files if os.path.isfile(x.path)]
+		return [MayaFile(cleanJoin(path, x), self.tree) for x in self.tree.files(path)]
 
 	def getLatestSubdirFiles(self, subdir):
-		files = [MayaFile(x) for x in versions.getLatestVersions(self.subdirPath(subdir))]
-		return [x for x in files if os.path.isfile(x.path)]
+		paths = versions.getLatestVersions(self.subdirPath(subdir))
+		return [MayaFile(x, self.tree) for x in paths if self.tree.isFile(x)]
 
 	def subdirPath(self, subdir):
 		return cleanJoin(self.path, subdir)
@@ -108,8 +354,9 @@ class Package(object):
 
 
 class MayaFile(object):
-	def __init__(self, path):
+	def __init__(self, path, tree=None):
 		self.path = path
+		self.tree = fileTree.getTree() if tree is None else tree
 		self.name = os.path.split(path)[1]
 		self.baseName = self.name.split('.')[0]
 		self.version = versions.getVersion(path)
@@ -125,7 +372,7 @@ class MayaFile(object):
 			if path == '':
 				raise ValueError
 		path = os.path.split(path)[0]
-		return Package(path)
+		return Package(path, self.tree)
 
 	def openFile(self):
 		pm.openFile(self.path, force=1)
@@ -135,7 +382,20 @@ class MayaFile(object):
 
 
 class ExportSettings(object):
-	pass
+	# skip the export when the node's fingerprint matches the last export
+	onlyIfChanged = False
+
+class ExportReport(object):
+	""" The nodes an export exported, skipped as unchanged or failed on, and any history failures """
+	def __init__(self):
+		self.exported = []
+		self.skipped = []
+		self.failed = []
+		self.historyErrors = []
+
+	def __repr__(self):
+		return 'ExportReport({0} exported, {1} skipped, {2} failed)'.format(
+			len(self.exported), len(self.skipped), len(self.failed))
 
 class ExportManager(object):
 	def __init__(self, settings=None):
@@ -143,64 +403,234 @@ class ExportManager(object):
 			self.settings = ExportSettings()
 		else:
 			self.settings = settings
-
-	def exportAll(self, tag, moveToOrigin=True):
+		self.historyQueue = history.CopyQueue(copyFunc=storeHistory)
+		self._stores = {}
+		self._materialCache = {}
+		self.farmThread = None
+
+	def exportAll(self, tag, moveToOrigin=True, force=False):
+		"""
+		Export every node tagged with tag in one batch: the exporter is set
+		up once, all paths are resolved up front, and viewport refresh and
+		undo are suspended until the end.  With settings.onlyIfChanged,
+		unchanged nodes are skipped unless force is set.  A node that fails
+		to export is added to the report's failed list, and the batch goes
+		on with the next node.  Returns an ExportReport.
+		"""
+		subdir, ext = _EXPORT_FORMATS[tag]
+		sceneFile = MayaFile(pm.sceneName())
+		reserved = {}
+		jobs = [(x,) + self._getExportPaths(x, subdir, ext, sceneFile, reserved) for x in self.nodes(tag)]
+		self._configureExport(tag)
+		self._resetStores()
+		report = ExportReport()
+		sel = pm.selected()
+		try:
+			with suspendRefreshAndUndo():
+				for node, path, historyPath in jobs:
+					try:
+						exported = self._exportNode(node, tag, path, historyPath, moveToOrigin, force)
+					except Exception as e:
+						pm.warning('could not export {0}: {1}'.format(node, e))
+						report.failed.append((node, str(e)))
+						continue
+					if exported:
+						report.exported.append(node)
+					else:
+						report.skipped.append(node)
+		finally:
+			pm.select(sel)
+			self._saveStores()
+			report.historyErrors = self.waitForHistory()
+		return report
+
+	def exportFarm(self, tag, moveToOrigin=True, force=False, workers=4, retries=1, command=None, progress=None, callback=None):
+		"""
+		Export every node tagged with tag on a pool of headless mayapy workers
+		(see farm.py) and merge the exports into history.  The workers open
+		the scene from disk, so it must be saved first.  Unchanged nodes are
+		skipped here, before any work is sent out.  The farm runs on a
+		background thread, so Maya stays usable; progress is called with
+		each worker event, and callback with an ExportReport of node names
+		when the farm is done, both on the main thread.  Returns the thread.
+		"""
+		if self.farmThread is not None and self.farmThread.is_alive():
+			raise RuntimeError('a farm export is already running')
+		scenePath = pm.sceneName()
+		if not scenePath or pm.cmds.file(q=1, modified=1):
+			raise RuntimeError('save the scene before exporting on the farm')
+		subdir, ext = _EXPORT_FORMATS[tag]
+		sceneFile = MayaFile(scenePath)
+		self._resetStores()
+		report = ExportReport()
+		jobs = []
+		fingerprints = {}
+		reserved = {}
 		for node in self.nodes(tag):
-			self.exportNode(node, tag, moveToOrigin)
-
-	def exportNode(self, node, tag, moveToOrigin=True):
-		pm.mel.eval('print "Exporting {0}"'.format(node))
+			path, historyPath = self._getExportPaths(node, subdir, ext, sceneFile, reserved)
+			fingerprint, unchanged = self._checkFingerprint(node, path, historyPath, moveToOrigin, force)
+			if unchanged:
+				report.skipped.append(node.longName())
+				continue
+			jobs.append({'node' : node.longName(), 'path' : path, 'historyPath' : historyPath})
+			fingerprints[node.longName()] = fingerprint
+		exportFarm = farm.ExportFarm(command, workers, retries)
+		def deferProgress(event):
+			maya.utils.executeDeferred(progress, event)
+		def run():
+			try:
+				results = exportFarm.run(str(scenePath), tag, jobs, moveToOrigin, deferProgress if progress else None)
+			except Exception as e:
+				results = {}
+				for job in jobs:
+					results[job['node']] = {'event' : 'error', 'node' : job['node'], 'message' : str(e)}
+			maya.utils.executeDeferred(self._finishFarm, jobs, fingerprints, results, report, callback)
+		self.farmThread = threading.Thread(target=run)
+		self.farmThread.daemon = True
+		self.farmThread.start()
+		return self.farmThread
+
+	def _finishFarm(self, jobs, fingerprints, results, report, callback):
+		# runs on the main thread once the farm is done
+		try:
+			for job in jobs:
+				result = results[job['node']]
+				if result['event'] == 'exported':
+					report.exported.append(job['node'])
+					self._copyToHistory(job['path'], job['historyPath'])
+					self._setFingerprint(job['path'], job['historyPath'], fingerprints[job['node']])
+				else:
+					report.failed.append((job['node'], result.get('message')))
+		finally:
+			self._saveStores()
+			report.historyErrors = self.waitForHistory()
+		if callback is not None:
+			callback(report)
+
+	def waitForHistory(self):
+		""" Wait for pending history copies, warning about and returning any failures """
+		errors = self.historyQueue.flush()
+		for src, dst, e in errors:
+			pm.warning('could not copy {0} to history: {1}'.format(src, e))
+		return errors
+
+	def exportNode(self, node, tag, moveToOrigin=True, force=False):
+		""" Export a single node.  Returns False if it was skipped as unchanged """
+		subdir, ext = _EXPORT_FORMATS[tag]
+		path, historyPath = self._getExportPaths(node, subdir, ext)
+		self._configureExport(tag)
+		self._resetStores()
+		sel = pm.selected()
 		pm.refresh()
+		try:
+			return self._exportNode(node, tag, path, historyPath, moveToOrigin, force)
+		finally:
+			pm.select(sel)
+			self._saveStores()
+
+	def _exportNode(self, node, tag, path, historyPath, moveToOrigin, force=False):
+		# historyPath is None when the caller takes care of history (farm workers)
+		fingerprint, unchanged = self._checkFingerprint(node, path, historyPath, moveToOrigin, force)
+		if unchanged:
+			pm.mel.eval('print "Skipping unchanged {0}"'.format(node))
+			return False
+		pm.mel.eval('print "Exporting {0}"'.format(node))
 		# zero node transforms and select node
 		if moveToOrigin:
 			wm = getWorldMatrix(node)
 			setWorldMatrix(node, pm.dt.TransformationMatrix(), scale=False)
-		sel = pm.selected()
-		pm.select(node)
-		exportFuncs = {
-			_UDK_TAG : self._exportNodeUDK,
-			_ZBRUSH_TAG : self._exportNodeZbrush,
-			_XNORMAL_TAG : self._exportNodeXnormal,
-		}
-		exportFuncs[tag](node)
-		# move node back to original position and reset selection
-		if moveToOrigin:
-			setWorldMatrix(node, wm, scale=False)
-		pm.select(sel)
-
-	def _exportNodeUDK(self, node):
-		pm.mel.FBXExportSmoothMesh(v=1)
-		pm.mel.FBXExportFileVersion('FBX201300')
-		pm.mel.FBXExportTriangulate(v=1)
-		pm.mel.FBXExportUpAxis('z')
-		path, historyPath = self._getExportPaths(node, 'udk', '.fbx')
+		try:
+			pm.select(node)
+			exportFuncs = {
+				_UDK_TAG : self._exportNodeUDK,
+				_ZBRUSH_TAG : self._exportNodeZbrush,
+				_XNORMAL_TAG : self._exportNodeXnormal,
+			}
+			history.breakLink(path)
+			exportFuncs[tag](node, path)
+		finally:
+			# move node back to original position, even if the export failed,
+			# since undo may be off and couldn't bring it back
+			if moveToOrigin:
+				setWorldMatrix(node, wm, scale=False)
+		if historyPath is not None:
+			self._copyToHistory(path, historyPath)
+		self._setFingerprint(path, historyPath, fingerprint)
+		return True
+
+	def _checkFingerprint(self, node, path, historyPath, moveToOrigin, force=False):
+		"""
+		Return node's fingerprint and whether it matches the last export, or
+		(None, False) when changes aren't being tracked
+		"""
+		if not self.settings.onlyIfChanged or historyPath is None:
+			return None, False
+		fingerprint = nodeFingerprint(node, moveToOrigin, self._materialCache)
+		if force or not os.path.isfile(path):
+			return fingerprint, False
+		store = self._getStore(historyPath)
+		return fingerprint, store.getFingerprint(os.path.basename(path)) == fingerprint
+
+	def _setFingerprint(self, path, historyPath, fingerprint):
+		if fingerprint is not None:
+			self._getStore(historyPath).setFingerprint(os.path.basename(path), fingerprint, save=False)
+
+	def _getStore(self, historyPath):
+		historyDir = os.path.dirname(historyPath)
+		if historyDir not in self._stores:
+			self._stores[historyDir] = history.HistoryStore(historyDir)
+		return self._stores[historyDir]
+
+	def _resetStores(self):
+		# manifests and materials are re-read at the start of each export pass
+		self._stores = {}
+		self._materialCache = {}
+
+	def _saveStores(self):
+		for store in self._stores.values():
+			if store.isModified:
+				store.saveManifest()
+
+	def _configureExport(self, tag):
+		if tag == _UDK_TAG:
+			pm.mel.FBXExportSmoothMesh(v=1)
+			pm.mel.FBXExportFileVersion('FBX201300')
+			pm.mel.FBXExportTriangulate(v=1)
+			pm.mel.FBXExportUpAxis('z')
+		elif tag == _XNORMAL_TAG:
+			pm.loadPlugin('objExport.mll', qt=1)
+
+	def _exportNodeUDK(self, node, path):
 		pm.mel.FBXExport(f=path, s=1)
-		shutil.copyfile(path, historyPath)
 
-	def _exportNodeZbrush(self, node):
+	def _exportNodeZbrush(self, node, path):
 		#pm.loadPlugin('objExport.mll', qt=1)
-		path, historyPath = self._getExportPaths(node, 'zbrush', '.obj')
 		options = 'groups=1;ptgroups=1;materials=1;smoothing=1;normals=1'
 		pm.exportSelected(path, force=1, type='OBJexport', op=options)
-		shutil.copyfile(path, historyPath)
 
-	def _exportNodeXnormal(self, node):
-		pm.loadPlugin('objExport.mll', qt=1)
-		path, historyPath = self._getExportPaths(node, 'xnormal', '.obj')
+	def _exportNodeXnormal(self, node, path):
 		options = 'groups=1;ptgroups=1;materials=1;smoothing=1;normals=1'
 		pm.exportSelected(path, force=1, type='OBJexport', op=options)
-		shutil.copyfile(path, historyPath)
 
-	def _getExportPaths(self, node, subdir, ext):
+	def _copyToHistory(self, path, historyPath):
+		self.historyQueue.put(path, historyPath)
+
+	def _getExportPaths(self, node, subdir, ext, sceneFile=None, reserved=None):
+		# reserved maps history base paths to the last version handed out in
+		# a batch, so nodes with the same name get their own history versions
 		# get export path
-		mf = MayaFile(pm.sceneName())
-		exportDir = mf.package.subdirPath(subdir)
+		mf = MayaFile(pm.sceneName()) if sceneFile is None else sceneFile
+		package = mf.package
+		exportDir = package.subdirPath(subdir)
 		exportName = '{0}_{1}{2}'.format(mf.baseName, node.nodeName(), ext)
 		exportPath = cleanJoin(exportDir, exportName)
 		# get export history path
-		exportHistoryDir = mf.package.subdirPath('{0}/history'.format(subdir))
+		exportHistoryDir = package.subdirPath('{0}/history'.format(subdir))
 		exportHistoryBasePath = cleanJoin(exportHistoryDir, exportName)
 		historyVersion = versions.getLatestVersion(exportHistoryBasePath) + 1
+		if reserved is not None:
+			historyVersion = max(historyVersion, reserved.get(exportHistoryBasePath, 0) + 1)
+			reserved[exportHistoryBasePath] = historyVersion
 		exportHistoryPath = versions.setVersion(exportHistoryBasePath, historyVersion)
 		return exportPath, exportHistoryPath
 
@@ -208,6 +638,11 @@ class ExportManager(object):
 		node = self._getTransform(node)
 		tagging.addTag(node, tag)
 
+	def addNodes(self, nodes, tag):
+		""" Tag many nodes at once.  Returns the number of nodes newly tagged """
+		transforms = [self._getTransform(x) for x in nodes]
+		return tagging.addTags([x for x in transforms if x is not None], [tag])
+
 	def nodes(self, tag):
 		return tagging.ls(tag, tr=1)
 
@@ -216,8 +651,7 @@ class ExportManager(object):
 		tagging.removeTag(node, tag)
 
 	def clearNodes(self, tag):
-		for node in self.nodes(tag):
-			tagging.removeTag(node, tag)
+		return tagging.removeTags(self.nodes(tag), [tag])
 
 	def _getTransform(self, node):
 		if isinstance(node, pm.nt.Transform):
@@ -232,6 +666,25 @@ class ExportManager(object):
 				return node
 
 
+@contextmanager
+def suspendRefreshAndUndo():
+	""" Suspend viewport refresh and undo recording, restoring both afterwards """
+	undoState = pm.undoInfo(q=1, state=1)
+	pm.refresh(suspend=True)
+	pm.undoInfo(stateWithoutFlush=False)
+	try:
+		yield
+	finally:
+		pm.undoInfo(stateWithoutFlush=undoState)
+		pm.refresh(suspend=False)
+		pm.refresh()
+
+def storeHistory(src, dst):
+	""" Store src as the history version dst, and record it in the cached version index """
+	before = versions.directoryMtime(dst)
+	history.storeFile(src, dst)
+	versions.registerVersion(dst, before)
+
 def getWorldMatrix(node):
 	if isinstance(node, pm.nt.Transform):
 		return node.worldMatrix.get()
@@ -248,6 +701,73 @@ def setWorldMatrix(node, matrix, translate=True, rotate=True, scale=True):
 		matrix[3] = t
 	node.setMatrix(matrix * node.parentInverseMatrix.get())
 
+def nodeFingerprint(node, moveToOrigin=True, materialCache=None):
+	"""
+	Return a hash of the points, topology, transforms and materials of
+	every mesh under node, relative to node, plus node's world matrix if
+	it is exported in place.  materialCache is an optional dict that keeps
+	material hashes between calls.
+	"""
+	if materialCache is None:
+		materialCache = {}
+	digest = hashlib.sha1()
+	if not moveToOrigin:
+		digest.update(array.array('d', _matrixValues(getWorldMatrix(node))))
+	shapes = pm.listRelatives(node, ad=1, type='mesh', ni=1, f=1) or []
+	inverse = node.worldInverseMatrix.get()
+	for shape in sorted(shapes, key=lambda x: x.longName()):
+		digest.update(shape.longName())
+		matrix = shape.getParent().worldMatrix.get() * inverse
+		digest.update(array.array('d', _matrixValues(matrix)))
+		counts, connects = shape.getVertices()
+		digest.update(array.array('i', counts))
+		digest.update(array.array('i', connects))
+		points = array.array('d')
+		for point in shape.getPoints(space='object'):
+			points.extend((point[0], point[1], point[2]))
+		digest.update(points)
+		for shadingGroup, faces in shadingAssignments(shape):
+			digest.update(repr((shadingGroup, faces)))
+			if shadingGroup not in materialCache:
+				materialCache[shadingGroup] = shadingFingerprint(shadingGroup)
+			digest.update(materialCache[shadingGroup])
+	return digest.hexdigest()
+
+def shadingAssignments(shape):
+	"""
+	Return sorted (shadingGroup, faces) assignments of shape, where faces
+	is a list of face ranges, or empty for a whole object assignment
+	"""
+	conns = pm.cmds.listConnections(shape.longName() + '.instObjGroups', c=1, type='shadingEngine') or []
+	assignments = []
+	for plug, shadingGroup in zip(conns[::2], conns[1::2]):
+		faces = []
+		if '.objectGroups[' in plug:
+			faces = sorted(pm.cmds.getAttr(plug + '.objectGrpCompList') or [])
+		assignments.append((shadingGroup, faces))
+	return sorted(assignments)
+
+def shadingFingerprint(shadingGroup):
+	""" Return a hash of the settings of a shading group's shaders and their inputs, including texture paths """
+	digest = hashlib.sha1()
+	nodes = []
+	for attr in ('surfaceShader', 'volumeShader', 'displacementShader'):
+		for shader in pm.cmds.listConnections('{0}.{1}'.format(shadingGroup, attr), s=1, d=0) or []:
+			nodes.extend(pm.cmds.listHistory(shader, pdo=1) or [])
+	for node in sorted(set(nodes)):
+		digest.update(node)
+		digest.update(pm.cmds.nodeType(node))
+		for attr in sorted(pm.cmds.listAttr(node, scalar=1, settable=1) or []):
+			try:
+				value = pm.cmds.getAttr('{0}.{1}'.format(node, attr))
+			except (RuntimeError, ValueError):
+				continue
+			digest.update('{0}={1!r}'.format(attr, value))
+	return digest.hexdigest()
+
+def _matrixValues(matrix):
+	return [value for row in matrix for value in row]
+
 def getScaleMatrix(matrix):
 	""" Return the scale matrix of the given TransformationMatrix """
 	s = pm.dt.TransformationMatrix(matrix).getScale('world')
@@ -0,0 +1,230 @@
+"""
+farm.py
+
+Headless export farm.  The tagged nodes of a saved scene are split into
+shards and exported by a pool of mayapy worker processes, each of which
+opens the scene once and reports back one JSON object per line on
+stdout.  Run this file under mayapy to act as a worker:
+
+	mayapy farm.py JOBFILE
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import Queue
+
+_WORKER_SCRIPT = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+# maya.standalone doesn't load the exporters' plugins by itself
+_WORKER_PLUGINS = ('fbxmaya', 'objExport')
+
+def mayapyPath():
+	""" Return the mayapy next to the running Maya executable """
+	name = 'mayapy.exe' if sys.platform == 'win32' else 'mayapy'
+	return os.path.join(os.path.dirname(sys.executable), name)
+
+def workerCommand():
+	return [mayapyPath(), _WORKER_SCRIPT]
+
+def shard(jobs, count):
+	""" Split jobs round robin into at most count non-empty shards """
+	shards = [jobs[x::count] for x in range(max(count, 1))]
+	return [x for x in shards if x]
+
+def writeJobFile(path, scenePath, tag, jobs, moveToOrigin=True):
+	data = {
+		'scene' : scenePath,
+		'tag' : tag,
+		'moveToOrigin' : moveToOrigin,
+		'jobs' : jobs,
+	}
+	with open(path, 'w') as f:
+		json.dump(data, f, indent=1)
+
+def readJobFile(path):
+	with open(path) as f:
+		return json.load(f)
+
+def parseEvent(line):
+	""" Return the event dict for a line of worker output, or a log event for anything else """
+	try:
+		event = json.loads(line)
+	except ValueError:
+		event = None
+	if not isinstance(event, dict) or 'event' not in event:
+		event = {'event' : 'log', 'message' : line}
+	return event
+
+def emit(event, stream=None):
+	stream = stream or sys.stdout
+	stream.write(json.dumps(event) + '\n')
+	stream.flush()
+
+
+class ExportFarm(object):
+	"""
+	Runs export jobs on a pool of worker processes.  Jobs are dicts with
+	'node', 'path' and 'historyPath' keys.  command is the worker command
+	line, which gets a job file as its last argument; any program that
+	reports the same JSON lines can stand in for mayapy.  Jobs that fail,
+	or are never reported because their worker died, are retried up to
+	retries times in a new round of workers.  A worker that can't set
+	itself up (open the scene, load the exporters) fails all of its jobs
+	with a single 'setupError' event, and those jobs aren't retried.  A
+	worker that reports nothing for timeout seconds (hung on a file, or on
+	opening the scene) is killed; the job it was on fails, and its other
+	jobs are retried like those of a crashed worker.
+	"""
+	def __init__(self, command=None, workers=4, retries=1, timeout=900):
+		self.command = list(command) if command else workerCommand()
+		self.workers = workers
+		self.retries = retries
+		self.timeout = timeout
+
+	def __repr__(self):
+		return 'ExportFarm({0} workers)'.format(self.workers)
+
+	def run(self, scenePath, tag, jobs, moveToOrigin=True, progress=None):
+		"""
+		Export jobs and return a dict of node -> final 'exported' or 'error'
+		event.  progress, if given, is called with every event as it arrives.
+		"""
+		results = {}
+		pending = list(jobs)
+		tempDir = tempfile.mkdtemp(prefix='exportFarm')
+		try:
+			for attempt in range(self.retries + 1):
+				if not pending:
+					break
+				self._runRound(tempDir, attempt, scenePath, tag, pending, moveToOrigin, results, progress)
+				pending = [x for x in pending if not self._isFinal(results.get(x['node']))]
+		finally:
+			shutil.rmtree(tempDir, ignore_errors=True)
+		for job in pending:
+			if job['node'] not in results:
+				results[job['node']] = {'event' : 'error', 'node' : job['node'], 'message' : 'no result from worker'}
+		return results
+
+	def _isFinal(self, result):
+		return result is not None and (result['event'] == 'exported' or result.get('setup'))
+
+	def _runRound(self, tempDir, attempt, scenePath, tag, jobs, moveToOrigin, results, progress):
+		events = Queue.Queue()
+		procs = []
+		shards = shard(jobs, self.workers)
+		for i, jobShard in enumerate(shards):
+			jobFile = os.path.join(tempDir, 'shard{0}_{1}.json'.format(attempt, i))
+			writeJobFile(jobFile, scenePath, tag, jobShard, moveToOrigin)
+			proc = subprocess.Popen(self.command + [jobFile], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+			thread = threading.Thread(target=self._read, args=(i, proc, events))
+			thread.daemon = True
+			thread.start()
+			procs.append(proc)
+		running = len(procs)
+		# worker -> (deadline, node it is exporting)
+		deadlines = {}
+		if self.timeout is not None:
+			for i in range(len(procs)):
+				deadlines[i] = (time.time() + self.timeout, None)
+		while running:
+			try:
+				if deadlines:
+					event = events.get(timeout=max(min([x[0] for x in deadlines.values()]) - time.time(), 0))
+				else:
+					event = events.get()
+			except Queue.Empty:
+				self._killExpired(procs, deadlines, attempt, results, progress)
+				continue
+			if event is None:
+				running -= 1
+				continue
+			worker = event['worker']
+			if event['event'] == 'exit':
+				deadlines.pop(worker, None)
+			elif worker in deadlines:
+				node = event.get('node') if event['event'] == 'start' else None
+				deadlines[worker] = (time.time() + self.timeout, node)
+			event['attempt'] = attempt
+			if event['event'] in ('exported', 'error') and 'node' in event:
+				results[event['node']] = event
+			elif event['event'] == 'setupError':
+				message = 'worker setup failed: {0}'.format(event.get('message'))
+				for job in shards[event['worker']]:
+					results[job['node']] = {'event' : 'error', 'node' : job['node'], 'message' : message, 'setup' : True, 'attempt' : attempt}
+			if progress is not None:
+				progress(event)
+
+	def _killExpired(self, procs, deadlines, attempt, results, progress):
+		now = time.time()
+		for worker, (deadline, node) in deadlines.items():
+			if deadline > now:
+				continue
+			del deadlines[worker]
+			try:
+				procs[worker].kill()
+			except OSError:
+				pass
+			event = {'event' : 'timeout', 'worker' : worker, 'attempt' : attempt}
+			if node is not None:
+				event['node'] = node
+				results[node] = {'event' : 'error', 'node' : node, 'attempt' : attempt,
+					'message' : 'worker timed out after {0} seconds'.format(self.timeout)}
+			if progress is not None:
+				progress(event)
+
+	def _read(self, worker, proc, events):
+		for line in iter(proc.stdout.readline, b''):
+			line = line.decode('utf-8', 'replace').strip()
+			if line:
+				event = parseEvent(line)
+				event['worker'] = worker
+				events.put(event)
+		events.put({'event' : 'exit', 'worker' : worker, 'code' : proc.wait()})
+		events.put(None)
+
+
+def setupWorker(data):
+	""" Start Maya, load the exporters and open the job's scene.  Returns an ExportManager """
+	import maya.standalone
+	maya.standalone.initialize()
+	import pymel.core as pm
+	import core
+	for plugin in _WORKER_PLUGINS:
+		pm.loadPlugin(plugin, qt=1)
+	pm.openFile(data['scene'], force=1)
+	pm.undoInfo(state=False)
+	manager = core.ExportManager()
+	manager._configureExport(data['tag'])
+	return manager
+
+def runWorker(jobFile):
+	""" Open the job file's scene once and export each of its nodes, reporting as JSON lines """
+	data = readJobFile(jobFile)
+	tag = data['tag']
+	try:
+		manager = setupWorker(data)
+	except Exception as e:
+		emit({'event' : 'setupError', 'message' : str(e)})
+		return
+	import pymel.core as pm
+	emit({'event' : 'open', 'scene' : data['scene']})
+	for job in data['jobs']:
+		emit({'event' : 'start', 'node' : job['node']})
+		try:
+			node = pm.PyNode(job['node'])
+			# history is merged by the scheduler once the worker is done
+			manager._exportNode(node, tag, job['path'], None, data['moveToOrigin'])
+		except Exception as e:
+			emit({'event' : 'error', 'node' : job['node'], 'message' : str(e)})
+		else:
+			emit({'event' : 'exported', 'node' : job['node'], 'path' : job['path'], 'historyPath' : job['historyPath']})
+	emit({'event' : 'done'})
+
+
+if __name__ == '__main__':
+	runWorker(sys.argv[1])
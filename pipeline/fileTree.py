@@ -0,0 +1,140 @@
+"""
+fileTree.py
+
+Cached directory listings shared by the package model and the gui.
+Listings come from scandir where it is available (os.scandir, or the
+scandir backport), so the type of each entry comes back with the listing
+instead of costing a stat per file.  A cached listing is trusted for ttl
+seconds, then revalidated with a single stat of the directory and only
+listed again if its mtime has changed.
+"""
+
+import os
+import threading
+import time
+
+try:
+	from os import scandir
+except ImportError:
+	try:
+		from scandir import scandir
+	except ImportError:
+		scandir = None
+
+# directory mtimes this close to the time of the listing can't be trusted,
+# since more changes may land within the filesystem's mtime resolution
+_MTIME_RESOLUTION = 2.0
+
+def listDirectory(path):
+	""" Return sorted lists of the file names and directory names in path """
+	files = []
+	dirs = []
+	if scandir is not None:
+		for entry in scandir(path):
+			if entry.is_dir():
+				dirs.append(entry.name)
+			elif entry.is_file():
+				files.append(entry.name)
+	else:
+		for name in os.listdir(path):
+			full = os.path.join(path, name)
+			if os.path.isdir(full):
+				dirs.append(name)
+			elif os.path.isfile(full):
+				files.append(name)
+	files.sort()
+	dirs.sort()
+	return files, dirs
+
+
+class Listing(object):
+	def __init__(self, path, mtime, files, dirs):
+		self.path = path
+		self.mtime = mtime
+		self.files = files
+		self.dirs = dirs
+		self.fileSet = frozenset(files)
+		self.dirSet = frozenset(dirs)
+		self.checked = time.time()
+		self.racy = self.checked - mtime < _MTIME_RESOLUTION
+
+	def __repr__(self):
+		return 'Listing({0}, {1} files, {2} dirs)'.format(self.path, len(self.files), len(self.dirs))
+
+
+class FileTree(object):
+	"""
+	Directory listings cached by path.  Use invalidate() after changing
+	the filesystem from the pipeline so the change shows up immediately,
+	rather than after the ttl runs out.
+	"""
+	def __init__(self, ttl=2.0):
+		self.ttl = ttl
+		self.listings = {}
+		self.lock = threading.RLock()
+
+	def __repr__(self):
+		return 'FileTree({0} listings)'.format(len(self.listings))
+
+	def listing(self, path):
+		""" Return the Listing of directory path, or None if it doesn't exist """
+		path = os.path.normpath(path)
+		now = time.time()
+		with self.lock:
+			listing = self.listings.get(path)
+			if listing is not None and now - listing.checked < self.ttl:
+				return listing
+			try:
+				mtime = os.stat(path).st_mtime
+			except OSError:
+				self.listings.pop(path, None)
+				return None
+			if listing is None or listing.racy or listing.mtime != mtime:
+				try:
+					files, dirs = listDirectory(path)
+				except OSError:
+					self.listings.pop(path, None)
+					return None
+				listing = self.listings[path] = Listing(path, mtime, files, dirs)
+			listing.checked = now
+			return listing
+
+	def files(self, path):
+		listing = self.listing(path)
+		return list(listing.files) if listing is not None else []
+
+	def dirs(self, path):
+		listing = self.listing(path)
+		return list(listing.dirs) if listing is not None else []
+
+	def isFile(self, path):
+		head, tail = os.path.split(os.path.normpath(path))
+		listing = self.listing(head)
+		return listing is not None and tail in listing.fileSet
+
+	def isDir(self, path):
+		head, tail = os.path.split(os.path.normpath(path))
+		listing = self.listing(head)
+		return listing is not None and tail in listing.dirSet
+
+	def invalidate(self, path=None, recursive=False):
+		"""
+		Drop the cached listing of path, and of everything below it with
+		recursive, or every listing if no path is given
+		"""
+		with self.lock:
+			if path is None:
+				self.listings.clear()
+				return
+			path = os.path.normpath(path)
+			self.listings.pop(path, None)
+			if recursive:
+				prefix = os.path.join(path, '')
+				for key in [x for x in self.listings if x.startswith(prefix)]:
+					del self.listings[key]
+
+_tree = FileTree()
+
+def getTree():
+	""" Return the FileTree shared by the pipeline """
+	return _tree
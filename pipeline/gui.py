@@ -4,12 +4,15 @@ Created by Chris Lewis on 9/26/2012
 """
 
 import math
+import os
 import subprocess
 
+import maya.utils
 import pymel.core as pm
 import core
 import tagging
 import versions
+import watcher
 
 _LIGHT_BGC = (0.4, 0.4, 0.4)
 _DARK_BGC = (0.2, 0.2, 0.2)
@@ -20,6 +23,7 @@ class Gui(object):
 		self.build()
 		self.update()
 		self.setAssetsView(self.tag.get())
+		self.startWatcher()
 
 	def initData(self):
 		self.manager = core.PackageManager()
@@ -28,7 +32,9 @@ class Gui(object):
 		self.program = OptionVar('ThesisPipelineProgram', 'maya')
 		self.latestVersions = OptionVar('ThesisPipelineLatest', 0)
 		self.moveToOrigin = OptionVar('ThesisPipelineOrigin', 0)
+		self.onlyIfChanged = OptionVar('ThesisPipelineOnlyChanged', 0)
 		self.exportManager = core.ExportManager()
+		self.exportManager.settings.onlyIfChanged = bool(self.onlyIfChanged.get())
 
 	def build(self):
 		self.winName = 'gameArtPipelineGui'
@@ -60,7 +66,7 @@ class Gui(object):
 				with gridFormLayout(numberOfColumns=2):
 					pm.button(l='+', c=pm.Callback(self.addPackage))
 					pm.button(l='-', c=pm.Callback(self.removePackage))
-					pm.button(l='Refresh', c=pm.Callback(self.updatePackageLayout))
+					pm.button(l='Refresh', c=pm.Callback(self.refreshPackages))
 					pm.button(l='Explore', c=pm.Callback(self.explorePackage))
 
 	def buildFilesLayout(self):
@@ -79,7 +85,7 @@ class Gui(object):
 					pm.button(l='Import', c=pm.Callback(self.importFile))
 					pm.button(l='Increment', c=pm.Callback(self.incrementFile))
 					pm.button(l='Save As', c=pm.Callback(self.saveAsFile))
-					pm.button(l='Refresh', c=pm.Callback(self.updateFilesLayout))
+					pm.button(l='Refresh', c=pm.Callback(self.refreshFiles))
 					pm.button(l='Explore', c=pm.Callback(self.exploreFiles))
 
 	def buildAssetsLayout(self):
@@ -96,9 +102,14 @@ class Gui(object):
 					pm.button(l='-', c=pm.Callback(self.removeAsset))
 					pm.button(l='x', c=pm.Callback(self.clearAssets))
 				self.originCb = pm.checkBox(l='Move to origin on export', cc=pm.Callback(self.setMoveToOrigin), value=self.moveToOrigin.get())
+				self.onlyChangedCb = pm.checkBox(l='Only export changed', cc=pm.Callback(self.setOnlyIfChanged), value=self.onlyIfChanged.get())
 				with gridFormLayout(numberOfRows=1):
 					pm.button(l='Export Selected', c=pm.Callback(self.exportSelected))
 					pm.button(l='Export All', c=pm.Callback(self.exportAll))
+					pm.button(l='Farm Export', c=pm.Callback(self.exportFarm))
+				with gridFormLayout(numberOfRows=1):
+					pm.button(l='Force Export Selected', c=pm.Callback(self.exportSelected, True))
+					pm.button(l='Force Export All', c=pm.Callback(self.exportAll, True))
 
 	def update(self):
 		self.updatePackageLayout()
@@ -116,35 +127,65 @@ class Gui(object):
 		if curPackage is not None:
 			return self.manager.getPackage(curPackage)
 
+	def startWatcher(self):
+		""" Watch the assets folder and the current files folder, updating the lists as they change """
+		self.watcher = watcher.Watcher(self.watchedPaths(), self.queueChanges, tree=self.manager.tree)
+		self.watcher.start()
+		pm.scriptJob(uiDeleted=(self.winName, self.watcher.stop), runOnce=1)
+
+	def watchedPaths(self):
+		paths = [self.manager.assetsPath]
+		curPackage = self.getCurPackage()
+		if curPackage is not None:
+			paths.append(curPackage.subdirPath(self.program.get()))
+		return paths
+
+	def queueChanges(self, changes):
+		# called from the watcher thread
+		maya.utils.executeDeferred(self.applyChanges, changes)
+
+	def applyChanges(self, changes):
+		if not pm.window(self.winName, ex=1):
+			return
+		self.manager.invalidateCatalog()
+		directories = set([x.directory for x in changes])
+		if self.manager.assetsPath in directories:
+			self.updatePackageLayout()
+		if directories - set([self.manager.assetsPath]):
+			self.updateFilesLayout()
+
 	def updatePackageLayout(self):
-		sel = self.getSelItem(self.packageTsl)
 		packages = [x.name for x in self.manager.packages]
-		self.packageTsl.removeAll()
-		self.packageTsl.extend(packages)
-		if sel is not None:
-			self.packageTsl.setSelectItem(sel)
+		syncList(self.packageTsl, packages)
+
+	def refreshPackages(self):
+		self.manager.tree.invalidate()
+		self.manager.invalidateCatalog()
+		self.updatePackageLayout()
+		self.updateFilesLayout()
+
+	def refreshFiles(self):
+		curPackage = self.getCurPackage()
+		if curPackage is not None:
+			self.manager.tree.invalidate(curPackage.path, recursive=True)
+		self.manager.invalidateCatalog()
+		self.updateFilesLayout()
 
 	def updateFilesLayout(self):
-		sel = self.getSelItem(self.filesTsl)
-		self.filesTsl.removeAll()
 		curPackage = self.getCurPackage()
+		if getattr(self, 'watcher', None) is not None:
+			self.watcher.setPaths(self.watchedPaths())
 		if curPackage is None:
-			return
-		if self.latestVersions.get():
+			files = []
+		elif self.latestVersions.get():
 			files = [x.name for x in curPackage.getLatestSubdirFiles(self.program.get())]
 		else:
 			files = [x.name for x in curPackage.subdirFiles(self.program.get())]
-		self.filesTsl.extend(files)
-		if sel is not None and sel in files:
-			self.filesTsl.setSelectItem(sel)
+		syncList(self.filesTsl, files)
 
 	def updateAssetsLayout(self):
-		sel = self.getSelItem(self.assetsTsl)
 		assets = [x.nodeName() for x in tagging.ls(self.tag.get())]
-		self.assetsTsl.removeAll()
-		self.assetsTsl.extend(assets)
-		if sel is not None and sel in assets:
-			self.assetsTsl.setSelectItem(sel)
+		syncList(self.assetsTsl, assets)
 
 	def selectAsset(self):
 		sel = self.getSelItem(self.assetsTsl)
@@ -166,7 +207,7 @@ class Gui(object):
 		if self.manager.getPackage(name) is not None:
 			pm.warning('package with name {0} already exists'.format(name))
 			return
-		self.manager.addPackage(name)
+		warnFailures(self.manager.addPackage(name))
 		self.updatePackageLayout()
 		self.updateFilesLayout()
 
@@ -183,7 +224,7 @@ class Gui(object):
 			 dismissString='No',		
 		)
 		if result == 'Yes':
-			self.manager.removePackage(curPackage.name)
+			warnFailures(self.manager.removePackage(curPackage.name))
 			self.updatePackageLayout()
 			self.updateFilesLayout()
 
@@ -215,6 +256,10 @@ class Gui(object):
 	def setMoveToOrigin(self):
 		self.moveToOrigin.set(self.originCb.getValue())
 
+	def setOnlyIfChanged(self):
+		self.onlyIfChanged.set(int(self.onlyChangedCb.getValue()))
+		self.exportManager.settings.onlyIfChanged = bool(self.onlyIfChanged.get())
+
 	def getSelFilePath(self):
 		name = self.getSelItem(self.filesTsl)
 		curPackage = self.getCurPackage()
@@ -238,6 +283,8 @@ class Gui(object):
 	def incrementFile(self):
 		path = pm.sceneName()
 		pm.saveAs(versions.incVersion(path), force=1)
+		self.manager.tree.invalidate(os.path.dirname(path))
+		self.manager.invalidateCatalog()
 		self.updateFilesLayout()
 
 	def saveAsFile(self):
@@ -249,6 +296,7 @@ class Gui(object):
 
 	def setAssetsView(self, tag):
 		self.tag.set(tag)
+		tagging.rebuildIndex()
 		btnDict = {
 			core._UDK_TAG:self.udkBtn, 
 			core._ZBRUSH_TAG:self.zbrushBtn, 
@@ -271,9 +319,7 @@ class Gui(object):
 		self.updateFilesLayout()
 
 	def addAsset(self):
-		sel = pm.selected()
-		for node in sel:
-			self.exportManager.addNode(node, self.tag.get())
+		self.exportManager.addNodes(pm.selected(), self.tag.get())
 		self.updateAssetsLayout()
 
 	def removeAsset(self):
@@ -287,16 +333,80 @@ class Gui(object):
 		self.exportManager.clearNodes(self.tag.get())
 		self.updateAssetsLayout()
 
-	def exportSelected(self):
+	def exportSelected(self, force=False):
 		sel = pm.selected()
+		report = core.ExportReport()
 		for node in sel:
-			self.exportManager.exportNode(node, self.tag.get(), self.moveToOrigin.get())
-		pm.mel.eval('print "Finished exporting {0} nodes."'.format(len(sel)))
-
-	def exportAll(self):
-		self.exportManager.exportAll(self.tag.get(), self.moveToOrigin.get())
-		numNodes = len(tagging.ls(self.tag.get(), tr=1))
-		pm.mel.eval('print "Finished exporting {0} nodes."'.format(numNodes))
+			if self.exportManager.exportNode(node, self.tag.get(), self.moveToOrigin.get(), force):
+				report.exported.append(node)
+			else:
+				report.skipped.append(node)
+		self.exportManager.waitForHistory()
+		self.printReport(report)
+
+	def exportAll(self, force=False):
+		report = self.exportManager.exportAll(self.tag.get(), self.moveToOrigin.get(), force)
+		self.printReport(report)
+
+	def exportFarm(self, force=False):
+		self.exportManager.exportFarm(self.tag.get(), self.moveToOrigin.get(), force,
+			progress=self.farmProgress, callback=self.farmFinished)
+		pm.mel.eval('print "Farm export started."')
+
+	def farmFinished(self, report):
+		for node, message in report.failed:
+			pm.warning('could not export {0}: {1}'.format(node, message))
+		# the window may have been closed while the farm was running
+		if pm.window(self.winName, ex=1):
+			self.printReport(report)
+
+	def printReport(self, report):
+		self.refreshFiles()
+		if report.skipped:
+			print('Skipped unchanged: {0}'.format(', '.join([str(x) for x in report.skipped])))
+		pm.mel.eval('print "Finished exporting {0} nodes, skipped {1} unchanged."'.format(len(report.exported), len(report.skipped)))
+
+	def farmProgress(self, event):
+		if event['event'] in ('exported', 'error'):
+			print('[worker {0}] {1} {2}'.format(event['worker'], event['event'], event['node']))
+
+
+def warnFailures(report):
+	for path, error in report.failed:
+		pm.warning('{0}: {1}'.format(path, error))
+
+def syncList(tsl, items):
+	"""
+	Make the textScrollList show items, in order, by removing and inserting
+	only the rows that differ.  Selected rows that remain stay selected.
+	Rows that would have to move (e.g. after a rename) make the list be
+	rebuilt instead.
+	"""
+	items = list(items)
+	wanted = set(items)
+	current = tsl.getAllItems() or []
+	currentSet = set(current)
+	if [x for x in current if x in wanted] != [x for x in items if x in currentSet]:
+		rebuildList(tsl, items)
+		return
+	for item in current:
+		if item not in wanted:
+			tsl.removeItem(item)
+	for i, item in enumerate(items):
+		if item not in currentSet:
+			tsl.appendPosition((i + 1, item))
+	if (tsl.getAllItems() or []) != items:
+		rebuildList(tsl, items)
+
+def rebuildList(tsl, items):
+	""" Fill the textScrollList with items, keeping the selection of the ones that remain """
+	wanted = set(items)
+	selected = [x for x in tsl.getSelectItem() or [] if x in wanted]
+	tsl.removeAll()
+	for item in items:
+		tsl.append(item)
+	for item in selected:
+		tsl.setSelectItem(item)
 
 
 def gridFormLayout(numberOfRows=None, numberOfColumns=None, offset=2, **kwargs):
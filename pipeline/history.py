@@ -0,0 +1,257 @@
+"""
+history.py
+
+Background copies of exports into their history folders.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import Queue
+
+_FICLONE = 0x40049409
+_STORE_DIR = '.store'
+_MANIFEST = 'fingerprints.json'
+_CHUNK_SIZE = 1 << 20
+
+def sameFilesystem(src, dst):
+	try:
+		return os.stat(src).st_dev == os.stat(os.path.dirname(dst) or '.').st_dev
+	except OSError:
+		return False
+
+def hardlink(src, dst):
+	if hasattr(os, 'link'):
+		os.link(src, dst)
+	elif sys.platform == 'win32':
+		import ctypes
+		if not ctypes.windll.kernel32.CreateHardLinkW(unicode(dst), unicode(src), None):
+			raise OSError('could not link {0} to {1}'.format(src, dst))
+	else:
+		raise OSError('hardlinks are not supported')
+
+def clone(src, dst):
+	""" Make a copy-on-write clone of src at the new file dst, where the filesystem supports it """
+	import fcntl
+	with open(src, 'rb') as s:
+		# never open an existing dst, it may share its data with other files
+		fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0))
+		with os.fdopen(fd, 'wb') as d:
+			try:
+				fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+			except IOError:
+				d.close()
+				os.remove(dst)
+				raise OSError('could not clone {0} to {1}'.format(src, dst))
+
+def tempPath(dst):
+	return '{0}.{1}.{2}.tmp'.format(dst, os.getpid(), threading.current_thread().ident)
+
+def replaceFile(src, dst):
+	""" Rename src over dst, replacing the directory entry rather than the data of an existing dst """
+	try:
+		os.rename(src, dst)
+	except OSError:
+		if sys.platform != 'win32' or not os.path.exists(dst):
+			raise
+		os.remove(dst)
+		os.rename(src, dst)
+
+def _copyInto(src, dst, methods):
+	if sameFilesystem(src, dst):
+		for method, func in methods:
+			try:
+				func(src, dst)
+				return method
+			except (OSError, IOError, ImportError):
+				pass
+	shutil.copyfile(src, dst)
+	return 'copy'
+
+def _putFile(src, dst, methods):
+	temp = tempPath(dst)
+	try:
+		method = _copyInto(src, temp, methods)
+		replaceFile(temp, dst)
+	except:
+		if os.path.exists(temp):
+			os.remove(temp)
+		raise
+	return method
+
+def linkOrCopy(src, dst):
+	"""
+	Put a copy of src at dst, as a hardlink or a copy-on-write clone when
+	both are on the same filesystem.  The copy is made under a temporary
+	name and renamed into place, so an existing dst is replaced rather
+	than written into.  Returns how the copy was made.
+	"""
+	return _putFile(src, dst, (('link', hardlink), ('clone', clone)))
+
+def cloneOrCopy(src, dst):
+	"""
+	Put an independent copy of src at dst, cloned where the filesystem
+	supports it.  Unlike linkOrCopy, changing src in place later can't
+	change dst.  Returns how the copy was made.
+	"""
+	return _putFile(src, dst, (('clone', clone),))
+
+def breakLink(path):
+	"""
+	Remove path if it shares its data with a history file, so exporting
+	over it can't change the history copy.
+	"""
+	try:
+		if os.stat(path).st_nlink > 1:
+			os.remove(path)
+	except OSError:
+		pass
+
+def hashFile(path):
+	digest = hashlib.sha1()
+	with open(path, 'rb') as f:
+		chunk = f.read(_CHUNK_SIZE)
+		while chunk:
+			digest.update(chunk)
+			chunk = f.read(_CHUNK_SIZE)
+	return digest.hexdigest()
+
+
+class HistoryStore(object):
+	"""
+	Content addressed storage for a history folder.  Each distinct export
+	is kept once as a blob in the folder's .store directory, and the
+	versioned history names are hardlinks to the blobs (or copies, where
+	links aren't possible).  Blobs are copies of the exports, never links
+	to them.  The store also keeps the fingerprint of the
+	last export of each name, for skipping unchanged exports.
+	"""
+	def __init__(self, historyDir):
+		self.historyDir = historyDir
+		self.storeDir = os.path.join(historyDir, _STORE_DIR)
+		self.manifestPath = os.path.join(self.storeDir, _MANIFEST)
+		self._manifest = None
+		self.isModified = False
+
+	def __repr__(self):
+		return 'HistoryStore({0})'.format(self.historyDir)
+
+	def blobPath(self, digest):
+		return os.path.join(self.storeDir, digest)
+
+	def addFile(self, src, dst):
+		""" Store src and make dst a reference to it.  Returns the content hash """
+		if not os.path.isdir(self.storeDir):
+			try:
+				os.makedirs(self.storeDir)
+			except OSError:
+				if not os.path.isdir(self.storeDir):
+					raise
+		digest = hashFile(src)
+		blob = self.blobPath(digest)
+		if not os.path.exists(blob):
+			# the blob must not share data with src, which other tools may save over in place
+			cloneOrCopy(src, blob)
+		linkOrCopy(blob, dst)
+		return digest
+
+	@property
+	def manifest(self):
+		if self._manifest is None:
+			try:
+				with open(self.manifestPath) as f:
+					self._manifest = json.load(f)
+			except (IOError, ValueError):
+				self._manifest = {}
+		return self._manifest
+
+	def getFingerprint(self, name):
+		return self.manifest.get(name)
+
+	def setFingerprint(self, name, fingerprint, save=True):
+		""" Record the fingerprint of name's export.  With save=False it is kept until saveManifest() """
+		self.manifest[name] = fingerprint
+		self.isModified = True
+		if save:
+			self.saveManifest()
+
+	def saveManifest(self):
+		if not os.path.isdir(self.storeDir):
+			os.makedirs(self.storeDir)
+		with open(self.manifestPath, 'w') as f:
+			json.dump(self.manifest, f, indent=1, sort_keys=True)
+		self.isModified = False
+
+def storeFile(src, dst):
+	""" Copy src to the history path dst through dst's HistoryStore """
+	return HistoryStore(os.path.dirname(dst)).addFile(src, dst)
+
+
+class CopyQueue(object):
+	"""
+	Copies files on a pool of worker threads.  put() blocks once
+	maxInFlight copies are pending, and flush() waits for everything
+	queued so far and returns the failures.
+	"""
+	def __init__(self, workers=4, maxInFlight=16, copyFunc=linkOrCopy):
+		self.workers = workers
+		self.copyFunc = copyFunc
+		self.queue = Queue.Queue()
+		self.slots = threading.BoundedSemaphore(maxInFlight)
+		self.lock = threading.Lock()
+		self.errors = []
+		self.threads = []
+
+	def __repr__(self):
+		return 'CopyQueue({0} workers)'.format(self.workers)
+
+	def _start(self):
+		while len(self.threads) < self.workers:
+			thread = threading.Thread(target=self._work)
+			thread.daemon = True
+			thread.start()
+			self.threads.append(thread)
+
+	def _work(self):
+		while True:
+			item = self.queue.get()
+			if item is None:
+				self.queue.task_done()
+				return
+			src, dst, callback = item
+			try:
+				self.copyFunc(src, dst)
+				if callback is not None:
+					callback(dst)
+			except Exception as e:
+				with self.lock:
+					self.errors.append((src, dst, e))
+			finally:
+				self.slots.release()
+				self.queue.task_done()
+
+	def put(self, src, dst, callback=None):
+		self._start()
+		self.slots.acquire()
+		self.queue.put((src, dst, callback))
+
+	def flush(self):
+		""" Wait for all queued copies.  Returns a list of (src, dst, exception) failures """
+		self.queue.join()
+		with self.lock:
+			errors = self.errors
+			self.errors = []
+		return errors
+
+	def close(self):
+		""" Finish pending copies and stop the worker threads """
+		errors = self.flush()
+		for thread in self.threads:
+			self.queue.put(None)
+		for thread in self.threads:
+			thread.join()
+		self.threads = []
+		return errors
@@ -0,0 +1,107 @@
+"""
+tagIndex.py
+
+Cached mapping of tag -> node UUIDs.  The index only talks to the scene
+through a scene object (see tagging.PymelScene), so it can be used with
+a stand-in scene outside of Maya.
+"""
+
+# past this many nodes added since the last query, rebuilding is cheaper
+_MAX_PENDING = 1000
+
+class TagIndex(object):
+	"""
+	scene must provide taggedNodes(), returning (uuid, tags) for every
+	tagged node, nodes(uuids), returning the nodes that still exist, and
+	nodeTags(nodes), returning (uuid, tags) for the tagged ones of nodes
+	passed to added().
+	"""
+	def __init__(self, scene):
+		self.scene = scene
+		self.tags = None
+		self.nodeTags = None
+		self.pending = []
+
+	def __repr__(self):
+		if self.tags is None:
+			return 'TagIndex(unbuilt)'
+		return 'TagIndex({0} tags, {1} nodes)'.format(len(self.tags), len(self.nodeTags))
+
+	@property
+	def isBuilt(self):
+		return self.tags is not None
+
+	def rebuild(self):
+		self.tags = {}
+		self.nodeTags = {}
+		self.pending = []
+		for uuid, tags in self.scene.taggedNodes():
+			self._set(uuid, tags)
+
+	def invalidate(self):
+		""" Drop the index; it is rebuilt on the next query """
+		self.tags = None
+		self.nodeTags = None
+		self.pending = []
+
+	def _ensure(self):
+		if self.tags is None:
+			self.rebuild()
+		elif self.pending:
+			nodes = self.pending
+			self.pending = []
+			for uuid, tags in self.scene.nodeTags(nodes):
+				self._set(uuid, tags)
+
+	def added(self, node):
+		"""
+		Note a node created since the index was built, e.g. by a duplicate.
+		Its tags are read on the next query, once they have been copied.
+		"""
+		if self.tags is None:
+			return
+		if len(self.pending) >= _MAX_PENDING:
+			self.invalidate()
+		else:
+			self.pending.append(node)
+
+	def _set(self, uuid, tags):
+		old = self.nodeTags.pop(uuid, set())
+		for tag in old:
+			uuids = self.tags[tag]
+			uuids.discard(uuid)
+			if not uuids:
+				del self.tags[tag]
+		tags = set(tags)
+		if tags:
+			self.nodeTags[uuid] = tags
+		for tag in tags:
+			self.tags.setdefault(tag, set()).add(uuid)
+
+	def update(self, uuid, tags):
+		""" Record the full tag list of a node after its tags have been changed """
+		if self.tags is not None:
+			self._set(uuid, tags)
+
+	def discard(self, uuid):
+		""" Forget a node, e.g. after it has been deleted """
+		if self.tags is not None:
+			self._set(uuid, ())
+
+	def getTags(self, uuid):
+		self._ensure()
+		return set(self.nodeTags.get(uuid, ()))
+
+	def uuids(self, tag):
+		self._ensure()
+		return set(self.tags.get(tag, ()))
+
+	def nodes(self, tag):
+		uuids = self.uuids(tag)
+		if not uuids:
+			return []
+		return self.scene.nodes(sorted(uuids))
+
+	def allTags(self):
+		self._ensure()
+		return sorted(self.tags)
@@ -3,9 +3,15 @@ tagging.py
 Created by Chris Lewis on 9/26/2012
 """
 
+from contextlib import contextmanager
+
+import maya.OpenMaya as om
 import pymel.core as pm
+import tagIndex
 
 _TAG_ATTR = 'META_TAGS'
+_index = None
+_callbackIds = []
 
 def _getTagAttr(node):
 	if not node.hasAttr(_TAG_ATTR):
@@ -27,16 +33,144 @@ def addTag(node, tag):
 	if tag not in tags:
 		tags.append(tag)
 	_getTagAttr(node).set(tags)
+	_updateIndex(node, tags)
 
 def removeTag(node, tag):
 	tags = getTags(node)
 	if tag in tags:
 		tags.remove(tag)
 	_getTagAttr(node).set(tags)
+	_updateIndex(node, tags)
 
 def clearTags(node):
 	_getTagAttr(node).set([])
+	_updateIndex(node, [])
+
+def addTags(nodes, tags):
+	""" Add tags to every node, as one undo step.  Returns the number of nodes modified """
+	return _applyTags(nodes, lambda current: current + [x for x in tags if x not in current])
+
+def removeTags(nodes, tags):
+	""" Remove tags from every node, as one undo step.  Returns the number of nodes modified """
+	return _applyTags(nodes, lambda current: [x for x in current if x not in tags])
+
+def setTags(nodes, tags):
+	""" Replace the tags of every node, as one undo step.  Returns the number of nodes modified """
+	return _applyTags(nodes, lambda current: list(tags))
+
+def _applyTags(nodes, func):
+	nodes = list(nodes)
+	if not nodes:
+		return 0
+	nodes = pm.ls(nodes)
+	index = getIndex()
+	modified = 0
+	with undoChunk():
+		for node, uuid in zip(nodes, pm.ls(nodes, uuid=1)):
+			# the index knows the current tags, so unchanged nodes cost nothing
+			current = index.getTags(uuid)
+			if set(func(sorted(current))) == current:
+				continue
+			tags = func(getTags(node))
+			_getTagAttr(node).set(tags)
+			index.update(uuid, tags)
+			modified += 1
+	return modified
+
+@contextmanager
+def undoChunk():
+	pm.undoInfo(openChunk=True)
+	try:
+		yield
+	finally:
+		pm.undoInfo(closeChunk=True)
 
 def ls(tag, *args, **kwargs):
-	nodes = pm.ls(*args, **kwargs)
-	return [x for x in nodes if hasTag(x, tag)]
\ No newline at end of file
+	nodes = getIndex().nodes(tag)
+	if not nodes:
+		return []
+	if args:
+		uuids = getIndex().uuids(tag)
+		candidates = pm.ls(*args, **kwargs)
+		if not candidates:
+			return []
+		return [x for x, uuid in zip(candidates, pm.ls(candidates, uuid=1)) if uuid in uuids]
+	return pm.ls(nodes, **kwargs)
+
+
+class PymelScene(object):
+	"""Scene queries and callbacks used by the tag index."""
+	def taggedNodes(self):
+		# one attribute existence query instead of a hasAttr per node
+		nodes = pm.ls('*.{0}'.format(_TAG_ATTR), o=1, r=1)
+		if not nodes:
+			return []
+		uuids = pm.ls(nodes, uuid=1)
+		return [(uuid, node.attr(_TAG_ATTR).get() or []) for uuid, node in zip(uuids, nodes)]
+
+	def nodes(self, uuids):
+		return pm.ls(uuids)
+
+	def nodeTags(self, handles):
+		""" Return (uuid, tags) for the nodes of handles that still exist and are tagged """
+		result = []
+		for handle in handles:
+			if not handle.isValid():
+				continue
+			fn = om.MFnDependencyNode(handle.object())
+			if fn.hasAttribute(_TAG_ATTR):
+				uuid = fn.uuid().asString()
+				result.append((uuid, pm.ls(uuid)[0].attr(_TAG_ATTR).get() or []))
+		return result
+
+	def addCallbacks(self, index):
+		def nodeAdded(obj, *args):
+			# duplicated and imported nodes may carry tags
+			index.added(om.MObjectHandle(obj))
+		def nodeRemoved(obj, *args):
+			index.discard(om.MFnDependencyNode(obj).uuid().asString())
+		def invalidate(*args):
+			index.invalidate()
+		ids = [
+			om.MDGMessage.addNodeAddedCallback(nodeAdded),
+			om.MDGMessage.addNodeRemovedCallback(nodeRemoved),
+		]
+		for message in (
+				om.MSceneMessage.kAfterOpen,
+				om.MSceneMessage.kAfterNew,
+				om.MSceneMessage.kAfterImport,
+				om.MSceneMessage.kAfterCreateReference,
+				om.MSceneMessage.kAfterRemoveReference):
+			ids.append(om.MSceneMessage.addCallback(message, invalidate))
+		# undo and redo can change tags behind the index's back
+		for event in ('Undo', 'Redo'):
+			ids.append(om.MEventMessage.addEventCallback(event, invalidate))
+		return ids
+
+	def removeCallbacks(self, ids):
+		for id in ids:
+			om.MMessage.removeCallback(id)
+
+
+def getIndex():
+	""" Return the scene's TagIndex, creating it and its callbacks on first use """
+	global _index
+	if _index is None:
+		scene = PymelScene()
+		_index = tagIndex.TagIndex(scene)
+		_callbackIds.extend(scene.addCallbacks(_index))
+	return _index
+
+def rebuildIndex():
+	getIndex().rebuild()
+
+def releaseIndex():
+	global _index
+	if _index is not None:
+		_index.scene.removeCallbacks(_callbackIds)
+		del _callbackIds[:]
+		_index = None
+
+def _updateIndex(node, tags):
+	if _index is not None:
+		_index.update(pm.ls(node, uuid=1)[0], tags)
@@ -5,9 +5,18 @@ Created by Chris Lewis on 9/26/2012
 
 import os
 import re
+import shutil
+import sys
+import threading
+import time
+from bisect import bisect_left
 
-_VERSION_NUMBER = re.compile('(?<=\.v)\d{3}')
-_VERSION = re.compile('\.v\d{3}')
+import fileTree
+
+# versions are at least three digits wide, but may grow past .v999
+_VERSION_WIDTH = 3
+_VERSION_NUMBER = re.compile('(?<=\.v)\d{3,}')
+_VERSION = re.compile('\.v\d{3,}')
 
 def cleanJoin(*args):
     return os.path.normpath(os.path.join(*args))
@@ -28,54 +37,196 @@ def removeVersion(path):
         return path
     return _VERSION.sub('', path)
 
+class VersionIndex(object):
+    """
+    Versions of every file in a directory, grouped by base name, from a
+    single listdir.  The index is rescanned when the directory's mtime
+    changes, or when the mtime was too recent to be trusted, and can be
+    updated in place with add() after writing a new version.
+    """
+    def __init__(self, directory):
+        self.directory = os.path.normpath(directory)
+        self.scan()
+
+    def __repr__(self):
+        return 'VersionIndex({0})'.format(self.directory)
+
+    def scan(self):
+        self._setMtime(os.path.getmtime(self.directory))
+        self.versions = {}
+        self.names = {}
+        for name in os.listdir(self.directory):
+            self._add(name)
+
+    def _setMtime(self, mtime):
+        self.mtime = mtime
+        # more changes may land within the mtime resolution without changing it
+        self.racy = time.time() - mtime < fileTree._MTIME_RESOLUTION
+
+    def _add(self, name):
+        key = removeVersion(name)
+        version = getVersion(name)
+        versions = self.versions.setdefault(key, [])
+        i = bisect_left(versions, version)
+        if i == len(versions) or versions[i] != version:
+            versions.insert(i, version)
+        self.names[(key, version)] = name
+
+    def isStale(self):
+        try:
+            return self.racy or os.path.getmtime(self.directory) != self.mtime
+        except OSError:
+            return True
+
+    def refresh(self):
+        if self.isStale():
+            self.scan()
+
+    def add(self, path, before=None):
+        """
+        Add a newly written file to the index.  before is the directory's
+        mtime from just before the write.  If it isn't given, or doesn't
+        match the index, something else may have changed the directory too,
+        and the index is left to be rescanned on its next lookup instead.
+        """
+        if before is None or self.racy or before != self.mtime:
+            self.mtime = None
+            return
+        self._add(os.path.basename(path))
+        # the write itself is accounted for, so the new mtime is trusted
+        try:
+            self.mtime = os.path.getmtime(self.directory)
+        except OSError:
+            self.mtime = None
+
+    def has(self, name, version):
+        versions = self.versions.get(removeVersion(name), [])
+        i = bisect_left(versions, version)
+        return i < len(versions) and versions[i] == version
+
+    def latest(self, name):
+        versions = self.versions.get(removeVersion(name))
+        return versions[-1] if versions else 0
+
+    def nextVersion(self, name):
+        return self.latest(name) + 1
+
+    def all(self, name):
+        key = removeVersion(name)
+        return [cleanJoin(self.directory, self.names[(key, x)]) for x in self.versions.get(key, [])]
+
+    def latestPaths(self):
+        return sorted([cleanJoin(self.directory, self.names[(key, versions[-1])])
+                       for key, versions in self.versions.items()])
+
+_indexes = {}
+# history copies register their versions from worker threads
+_indexLock = threading.RLock()
+
+def getIndex(directory):
+    """ Return the cached VersionIndex for directory, rescanning it if it has changed """
+    directory = os.path.normpath(directory)
+    with _indexLock:
+        index = _indexes.get(directory)
+        if index is None:
+            index = _indexes[directory] = VersionIndex(directory)
+        else:
+            index.refresh()
+        return index
+
+def clearIndexes():
+    _indexes.clear()
+
 def getAllVersions(path):
 	head, tail = os.path.split(path)
-	baseTail = removeVersion(tail)
-	dirContents = os.listdir(head)
-	versions = [cleanJoin(head, x) for x in dirContents if removeVersion(x) == baseTail]
-	versions.sort()
-	return versions	
+	return getIndex(head).all(tail)
 
 def getLatestVersion(path):
-    allVersions = getAllVersions(path)
-    latestVersion = 0
-    for item in allVersions:
-        latestVersion = max(latestVersion, getVersion(item))
-    return latestVersion
+    head, tail = os.path.split(path)
+    return getIndex(head).latest(tail)
 
 def getLatestVersions(path):
-	dirContents = os.listdir(path)
-	versions = {}
-	for item in dirContents:
-		key = removeVersion(item)
-		value = getVersion(item)
-		if key in versions:
-			versions[key] = max(versions[key], value)
-		else:
-			versions[key] = value
-	versionNames = []
-	for key, value in versions.items():
-		if value > 0:
-			versionNames.append(cleanJoin(path, setVersion(key, value)))
-		else:
-			versionNames.append(cleanJoin(path, key))
-	versionNames.sort()
-	return versionNames
+	return getIndex(path).latestPaths()
+
+def directoryMtime(path):
+    """ Return the mtime of path's directory, to pass to registerVersion after writing path """
+    try:
+        return os.path.getmtime(os.path.dirname(path))
+    except OSError:
+        return None
+
+def registerVersion(path, before=None):
+    """
+    Record a newly written version in its directory's cached index.
+    before is directoryMtime(path) from just before the write
+    """
+    head, tail = os.path.split(path)
+    with _indexLock:
+        index = _indexes.get(os.path.normpath(head))
+        if index is not None:
+            index.add(tail, before)
+
+def formatVersion(version, width=_VERSION_WIDTH):
+    return str(version).zfill(width)
 
 def addVersion(path, version):
     base, ext = os.path.splitext(path)
-    return '{0}.v{1}{2}'.format(base, str(version).zfill(3), ext)
+    return '{0}.v{1}{2}'.format(base, formatVersion(version), ext)
 
 def incVersion(path, dryrun=True):
     version = getLatestVersion(path)
     return setVersion(path, version + 1, dryrun)
 
 def setVersion(path, version, dryrun=True):
-    assert version <= 999 and version > 0, 'version overflow'
+    assert version > 0, 'invalid version'
     if hasVersion(path):
-        newpath = _VERSION_NUMBER.sub(str(version).zfill(3), path)
+        width = len(_VERSION_NUMBER.findall(path)[0])
+        newpath = _VERSION_NUMBER.sub(formatVersion(version, width), path)
     else:
         newpath = addVersion(path, version)
     if not dryrun:
         shutil.copyfile(path, newpath)
-    return newpath
\ No newline at end of file
+    return newpath
+
+def repadVersions(directory, width=None, dryrun=True):
+    """
+    Rename the versioned files in directory so their version numbers all
+    have the same width, by default the widest one found, so they also
+    sort correctly by name outside of the pipeline.  Returns a list of
+    (oldPath, newPath) renames.
+    """
+    names = [x for x in os.listdir(directory) if hasVersion(x)]
+    if not names:
+        return []
+    if width is None:
+        width = max([len(_VERSION_NUMBER.findall(x)[0]) for x in names])
+    renames = []
+    for name in sorted(names):
+        digits = _VERSION_NUMBER.findall(name)[0]
+        if len(digits) >= width:
+            continue
+        newName = _VERSION_NUMBER.sub(formatVersion(int(digits), width), name)
+        oldPath = cleanJoin(directory, name)
+        newPath = cleanJoin(directory, newName)
+        if os.path.exists(newPath):
+            raise ValueError('cannot repad {0}, {1} already exists'.format(oldPath, newPath))
+        renames.append((oldPath, newPath))
+    if not dryrun:
+        for oldPath, newPath in renames:
+            os.rename(oldPath, newPath)
+    return renames
+
+def repadHistory(root, width=None, dryrun=True):
+    """ Repad every history folder under root.  Returns all (oldPath, newPath) renames """
+    renames = []
+    for path, dirs, files in os.walk(root):
+        if os.path.basename(path) == 'history':
+            renames.extend(repadVersions(path, width, dryrun))
+    return renames
+
+
+if __name__ == '__main__':
+    # python versions.py ROOT [--apply]
+    dryrun = '--apply' not in sys.argv[2:]
+    for oldPath, newPath in repadHistory(sys.argv[1], dryrun=dryrun):
+        print '{0} -> {1}'.format(oldPath, newPath)
@@ -0,0 +1,310 @@
+"""
+watcher.py
+
+Background watcher for directories of the pipeline tree.  Changes are
+picked up with inotify where it is available and the directory is on a
+local filesystem, and by polling directory mtimes otherwise (network
+shares, Windows).  Bursts of events are coalesced, and the affected
+directories are listed again through a FileTree, so the watcher and the
+gui agree on what is on disk.  Nothing here depends on Maya.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+import fileTree
+
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_NONBLOCK = 0x00000800
+_IN_CLOEXEC = 0x00080000
+_WATCH_MASK = (_IN_CREATE | _IN_DELETE | _IN_MOVED_FROM | _IN_MOVED_TO |
+	_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct('iIII')
+_NETWORK_FILESYSTEMS = ('cifs', 'smb', 'smbfs', 'smb2', 'nfs', 'nfs4', 'afs', 'fuse.sshfs', '9p')
+
+
+class Change(object):
+	""" An entry added to or removed from a watched directory """
+	def __init__(self, kind, directory, name, isDir):
+		self.kind = kind
+		self.directory = directory
+		self.name = name
+		self.isDir = isDir
+
+	def __repr__(self):
+		return 'Change({0} {1}{2})'.format(self.kind, self.path, os.sep if self.isDir else '')
+
+	def __eq__(self, other):
+		return isinstance(other, Change) and self.key() == other.key()
+
+	def __ne__(self, other):
+		return not self == other
+
+	def key(self):
+		return (self.directory, self.name, self.kind, self.isDir)
+
+	@property
+	def path(self):
+		return os.path.join(self.directory, self.name)
+
+
+def snapshot(paths, tree):
+	""" Return a dict of directory -> (files, dirs) name sets for each existing directory in paths """
+	result = {}
+	for path in paths:
+		listing = tree.listing(path)
+		if listing is not None:
+			result[os.path.normpath(path)] = (listing.fileSet, listing.dirSet)
+	return result
+
+def diffSnapshots(old, new):
+	""" Return the sorted Changes that turn snapshot old into snapshot new """
+	empty = (frozenset(), frozenset())
+	changes = []
+	for path in set(old) | set(new):
+		oldFiles, oldDirs = old.get(path, empty)
+		newFiles, newDirs = new.get(path, empty)
+		for names, kind, isDir in (
+			(newFiles - oldFiles, 'added', False),
+			(oldFiles - newFiles, 'removed', False),
+			(newDirs - oldDirs, 'added', True),
+			(oldDirs - newDirs, 'removed', True),
+		):
+			changes.extend([Change(kind, path, x, isDir) for x in names])
+	changes.sort(key=Change.key)
+	return changes
+
+def isNetworkPath(path):
+	""" Return True if path is on a filesystem that inotify can't see remote changes on """
+	if not sys.platform.startswith('linux'):
+		return True
+	path = os.path.realpath(path)
+	best = ('', '')
+	try:
+		with open('/proc/mounts') as f:
+			for line in f:
+				fields = line.split()
+				if len(fields) < 3:
+					continue
+				mount = fields[1]
+				if (path == mount or path.startswith(os.path.join(mount, ''))) and len(mount) > len(best[0]):
+					best = (mount, fields[2])
+	except IOError:
+		return True
+	return best[1] in _NETWORK_FILESYSTEMS
+
+
+class PollingBackend(object):
+	""" Reports directories whose mtime has changed since the last poll """
+	def __init__(self):
+		self.mtimes = {}
+		self.recent = set()
+
+	def __repr__(self):
+		return 'PollingBackend({0} paths)'.format(len(self.mtimes))
+
+	def setPaths(self, paths):
+		mtimes = {}
+		for path in paths:
+			mtimes[path] = self.mtimes.get(path, self._mtime(path))
+		self.mtimes = mtimes
+
+	def _mtime(self, path):
+		try:
+			return os.stat(path).st_mtime
+		except OSError:
+			return None
+
+	def wait(self, timeout):
+		time.sleep(timeout)
+		now = time.time()
+		changed = set()
+		for path, old in self.mtimes.items():
+			mtime = self._mtime(path)
+			if mtime != old:
+				changed.add(path)
+				# a recent mtime may hide further changes within the mtime
+				# resolution, so report the directory once more afterwards
+				if mtime is not None and now - mtime < fileTree._MTIME_RESOLUTION:
+					self.recent.add(path)
+				else:
+					self.recent.discard(path)
+			elif path in self.recent and (mtime is None or now - mtime >= fileTree._MTIME_RESOLUTION):
+				self.recent.discard(path)
+				changed.add(path)
+			self.mtimes[path] = mtime
+		return changed
+
+	def close(self):
+		pass
+
+
+class InotifyBackend(object):
+	""" Reports directories with inotify events, through ctypes """
+	def __init__(self):
+		self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+		self.fd = self.libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+		self.paths = {}
+		self.watches = {}
+
+	def __repr__(self):
+		return 'InotifyBackend({0} paths)'.format(len(self.paths))
+
+	def setPaths(self, paths):
+		paths = set(paths)
+		for path in [x for x in self.paths if x not in paths]:
+			wd = self.paths.pop(path)
+			self.watches.pop(wd, None)
+			self.libc.inotify_rm_watch(self.fd, wd)
+		for path in paths:
+			if path in self.paths:
+				continue
+			name = path.encode(sys.getfilesystemencoding() or 'utf-8') if not isinstance(path, bytes) else path
+			wd = self.libc.inotify_add_watch(self.fd, ctypes.c_char_p(name), _WATCH_MASK)
+			if wd >= 0:
+				self.paths[path] = wd
+				self.watches[wd] = path
+
+	def wait(self, timeout):
+		ready = select.select([self.fd], [], [], timeout)[0]
+		if not ready:
+			return set()
+		try:
+			data = os.read(self.fd, 65536)
+		except OSError as e:
+			if e.errno == errno.EAGAIN:
+				return set()
+			raise
+		changed = set()
+		offset = 0
+		while offset + _EVENT_HEADER.size <= len(data):
+			wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+			offset += _EVENT_HEADER.size + length
+			if mask & _IN_Q_OVERFLOW:
+				changed.update(self.paths)
+				continue
+			path = self.watches.get(wd)
+			if path is None:
+				continue
+			changed.add(path)
+			if mask & _IN_IGNORED:
+				# the directory went away; watch it again if it comes back
+				del self.watches[wd]
+				del self.paths[path]
+		return changed
+
+	def close(self):
+		if self.fd >= 0:
+			os.close(self.fd)
+			self.fd = -1
+
+def createBackend(paths):
+	""" Return an InotifyBackend if every path is local and inotify works, else a PollingBackend """
+	if not [x for x in paths if isNetworkPath(x)]:
+		try:
+			return InotifyBackend()
+		except (OSError, AttributeError):
+			pass
+	return PollingBackend()
+
+
+class Watcher(object):
+	"""
+	Watches a set of directories on a background thread and calls
+	callback with a list of Changes from that thread.  Events are
+	collected until there have been none for coalesce seconds (or for at
+	most maxDelay seconds), then the affected directories are listed
+	again and diffed against the last snapshot.  poll() runs one round on
+	the calling thread.
+	"""
+	def __init__(self, paths, callback=None, backend=None, tree=None, interval=1.0, coalesce=0.2, maxDelay=2.0):
+		self.callback = callback
+		self.tree = fileTree.getTree() if tree is None else tree
+		self.interval = interval
+		self.coalesce = coalesce
+		self.maxDelay = maxDelay
+		self.paths = sorted(set([os.path.normpath(x) for x in paths]))
+		self.backend = createBackend(self.paths) if backend is None else backend
+		self.lock = threading.RLock()
+		self.snap = snapshot(self.paths, self.tree)
+		self.backend.setPaths(self.paths)
+		self.thread = None
+		self.stopped = threading.Event()
+
+	def __repr__(self):
+		return 'Watcher({0} paths, {1!r})'.format(len(self.paths), self.backend)
+
+	def setPaths(self, paths):
+		""" Change the watched directories, taking a new snapshot of the ones that weren't watched yet """
+		paths = sorted(set([os.path.normpath(x) for x in paths]))
+		with self.lock:
+			added = [x for x in paths if x not in self.snap]
+			snap = snapshot(added, self.tree)
+			for path in paths:
+				if path in self.snap:
+					snap[path] = self.snap[path]
+			self.snap = snap
+			self.paths = paths
+			self.backend.setPaths(paths)
+
+	def poll(self, timeout=0):
+		""" Wait up to timeout for events and return the resulting Changes """
+		changed = self.backend.wait(timeout)
+		if not changed:
+			return []
+		start = time.time()
+		while time.time() - start < self.maxDelay:
+			more = self.backend.wait(self.coalesce)
+			if not more:
+				break
+			changed.update(more)
+		with self.lock:
+			changed = [x for x in changed if x in self.paths]
+			for path in changed:
+				self.tree.invalidate(path)
+			old = {}
+			for path in changed:
+				if path in self.snap:
+					old[path] = self.snap.pop(path)
+			new = snapshot(changed, self.tree)
+			self.snap.update(new)
+			# directories that were recreated need a new watch
+			self.backend.setPaths(self.paths)
+		return diffSnapshots(old, new)
+
+	def start(self):
+		if self.thread is None:
+			self.stopped.clear()
+			self.thread = threading.Thread(target=self._run)
+			self.thread.daemon = True
+			self.thread.start()
+
+	def stop(self):
+		self.stopped.set()
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		self.backend.close()
+
+	def _run(self):
+		while not self.stopped.is_set():
+			changes = self.poll(self.interval)
+			if changes and self.callback is not None and not self.stopped.is_set():
+				self.callback(changes)
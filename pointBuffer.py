@@ -0,0 +1,147 @@
+"""
+pointBuffer.py
+
+Bulk vertex position access for the modeling tools.  The points of each
+mesh are read once into a flat float array, edited there, and only the
+meshes with dirty indices are written back, only at those indices.
+"""
+
+import array
+
+import meshTopology
+
+class PymelBackend(object):
+	"""
+	Reads mesh points through pymel's Mesh.getPoints.  Dirty points are
+	written back as vertex tweaks (the mesh's pnts attribute), one setAttr
+	per contiguous range of indices, which unlike MFnMesh.setPoints is
+	undoable.
+	"""
+	def __init__(self, space='world'):
+		self.space = space
+
+	def readPoints(self, mesh):
+		points = array.array('d')
+		for point in mesh.getPoints(space=self.space):
+			points.extend((point[0], point[1], point[2]))
+		return points
+
+	def writePoints(self, mesh, points, indices):
+		import maya.cmds as cmds
+		import pymel.core.datatypes as dt
+		# tweaks are object space offsets, so move them by the change of each point
+		current = self.readPoints(mesh)
+		inverse = mesh.worldInverseMatrix[0].get() if self.space == 'world' else None
+		name = mesh.name()
+		for start, end in meshTopology.indexRanges(indices):
+			plug = '{0}.pnts[{1}:{2}]'.format(name, start, end)
+			values = []
+			for index, tweak in zip(range(start, end + 1), cmds.getAttr(plug)):
+				i = index * 3
+				delta = dt.Vector(points[i] - current[i], points[i + 1] - current[i + 1], points[i + 2] - current[i + 2])
+				if inverse is not None:
+					# a vector, so only the rotation and scale apply
+					delta = delta * inverse
+				values.extend((tweak[0] + delta[0], tweak[1] + delta[1], tweak[2] + delta[2]))
+			cmds.setAttr(plug, *values)
+
+
+class MemoryBackend(object):
+	"""Stand-in backend holding points in memory, for use outside of Maya."""
+	def __init__(self, meshes=None):
+		self.meshes = {}
+		self.reads = []
+		self.writes = []
+		if meshes is not None:
+			for mesh, points in meshes.items():
+				self.meshes[mesh] = [tuple(float(c) for c in p) for p in points]
+
+	def readPoints(self, mesh):
+		self.reads.append(mesh)
+		points = array.array('d')
+		for point in self.meshes[mesh]:
+			points.extend(point)
+		return points
+
+	def writePoints(self, mesh, points, indices):
+		self.writes.append((mesh, list(indices)))
+		for i in indices:
+			self.meshes[mesh][i] = tuple(points[i * 3:i * 3 + 3])
+
+
+class MeshPointBuffer(object):
+	def __init__(self, meshes=(), backend=None):
+		self.backend = PymelBackend() if backend is None else backend
+		self.meshes = []
+		self.points = {}
+		self.dirty = {}
+		for mesh in meshes:
+			self.add(mesh)
+
+	def __repr__(self):
+		return 'MeshPointBuffer({0})'.format(self.meshes)
+
+	def __contains__(self, mesh):
+		return mesh in self.points
+
+	def add(self, mesh):
+		""" Read all points of mesh into the buffer, if not already loaded """
+		if mesh in self.points:
+			return
+		points = self.backend.readPoints(mesh)
+		self.meshes.append(mesh)
+		self.points[mesh] = points
+		self.dirty[mesh] = bytearray(len(points) // 3)
+
+	def count(self, mesh):
+		return len(self.points[mesh]) // 3
+
+	def getPoint(self, mesh, index):
+		points = self.points[mesh]
+		i = index * 3
+		return (points[i], points[i + 1], points[i + 2])
+
+	def setPoint(self, mesh, index, point):
+		points = self.points[mesh]
+		i = index * 3
+		points[i] = point[0]
+		points[i + 1] = point[1]
+		points[i + 2] = point[2]
+		self.dirty[mesh][index] = 1
+
+	def getPoints(self, mesh, indices=None):
+		if indices is None:
+			indices = range(self.count(mesh))
+		return [self.getPoint(mesh, i) for i in indices]
+
+	def setPoints(self, mesh, indices, points):
+		for index, point in zip(indices, points):
+			self.setPoint(mesh, index, point)
+
+	def dirtyIndices(self, mesh):
+		return [i for i, d in enumerate(self.dirty[mesh]) if d]
+
+	def isDirty(self, mesh=None):
+		meshes = self.meshes if mesh is None else [mesh]
+		return any(any(self.dirty[x]) for x in meshes)
+
+	def commit(self):
+		""" Write dirty points back, only at their indices.  Returns the number of points written """
+		written = 0
+		for mesh in self.meshes:
+			indices = self.dirtyIndices(mesh)
+			if not indices:
+				continue
+			self.backend.writePoints(mesh, self.points[mesh], indices)
+			self.dirty[mesh] = bytearray(len(self.dirty[mesh]))
+			written += len(indices)
+		return written
+
+	def revert(self):
+		""" Discard edits by re-reading every mesh """
+		meshes = self.meshes
+		self.meshes = []
+		self.points = {}
+		self.dirty = {}
+		for mesh in meshes:
+			self.add(mesh)
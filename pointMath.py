@@ -0,0 +1,154 @@
+"""
+pointMath.py
+
+Vectorized point operations for the modeling tools.  Works on (N, 3)
+arrays without building a python object per point, and runs headless.
+Uses numpy when it is available and falls back to plain python lists
+of tuples otherwise.
+
+Run this file directly to benchmark flatten against the old per point
+implementation.
+"""
+
+import time
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+AXIS_VALUES = ('min', 'max', 'average', 'median')
+
+def asArray(points):
+	""" Return points as an (N, 3) float array, or a list of tuples without numpy """
+	if numpy is not None:
+		return numpy.array(points, dtype=float).reshape(-1, 3)
+	return [(float(p[0]), float(p[1]), float(p[2])) for p in points]
+
+def _median(values):
+	values = sorted(values)
+	mid = len(values) // 2
+	if len(values) % 2:
+		return values[mid]
+	return (values[mid - 1] + values[mid]) / 2.0
+
+def axisValue(points, axis, value):
+	""" Return the min, max, average or median of points along axis """
+	if value not in AXIS_VALUES:
+		raise ValueError('invalid axis value: {0}'.format(value))
+	if numpy is not None:
+		column = asArray(points)[:, axis]
+		return float({
+			'min': numpy.min,
+			'max': numpy.max,
+			'average': numpy.mean,
+			'median': numpy.median,
+		}[value](column))
+	column = [p[axis] for p in points]
+	if value == 'min':
+		return min(column)
+	elif value == 'max':
+		return max(column)
+	elif value == 'average':
+		return sum(column) / float(len(column))
+	return _median(column)
+
+def flatten(points, axes):
+	"""
+	Flatten points along each axis.  axes is a sequence of three items,
+	each None (leave the axis alone), one of AXIS_VALUES, or a number to
+	flatten to.  Returns a new array.
+	"""
+	points = asArray(points)
+	if not len(points):
+		return points
+	targets = []
+	for axis, value in enumerate(axes):
+		if value is None or value is False:
+			continue
+		if not isinstance(value, (int, float)) or isinstance(value, bool):
+			value = axisValue(points, axis, value)
+		targets.append((axis, float(value)))
+	if numpy is not None:
+		for axis, value in targets:
+			points[:, axis] = value
+		return points
+	result = []
+	for point in points:
+		point = list(point)
+		for axis, value in targets:
+			point[axis] = value
+		result.append(tuple(point))
+	return result
+
+def flattenToPlane(points, origin, normal):
+	""" Project points onto the plane through origin with the given normal """
+	length = sum([x * x for x in normal]) ** 0.5
+	if not length:
+		raise ValueError('plane normal has zero length')
+	normal = [x / length for x in normal]
+	points = asArray(points)
+	if numpy is not None:
+		normal = numpy.array(normal)
+		distances = (points - numpy.array(origin, dtype=float)).dot(normal)
+		return points - numpy.outer(distances, normal)
+	result = []
+	for point in points:
+		d = sum([(point[i] - origin[i]) * normal[i] for i in range(3)])
+		result.append(tuple([point[i] - d * normal[i] for i in range(3)]))
+	return result
+
+def slope(points, slope, rise, run, anchorAxis, reverse=1):
+	"""
+	Offset points along rise by slope times their run distance from the
+	anchor, the point furthest along anchorAxis (or the least far, with
+	reverse=-1).  Returns a new array.
+	"""
+	points = asArray(points)
+	if not len(points):
+		return points
+	if numpy is not None:
+		anchorRun = points[numpy.argmax(points[:, anchorAxis] * reverse), run]
+		points[:, rise] += (points[:, run] - anchorRun) * slope
+		return points
+	anchor = max(points, key=lambda p: p[anchorAxis] * reverse)
+	result = []
+	for point in points:
+		point = list(point)
+		point[rise] += (point[run] - anchor[run]) * slope
+		result.append(tuple(point))
+	return result
+
+
+def _legacyFlatten(points, axes):
+	# the original modelingTools implementation, minus the pymel Point class
+	for axis, value in enumerate(axes):
+		if not value:
+			continue
+		column = [p[axis] for p in points]
+		target = {'min': min, 'max': max}.get(value, lambda x: sum(x) / float(len(x)))(column)
+		points = [tuple(target if i == axis else p[i] for i in range(3)) for p in points]
+	return points
+
+def benchmark(sizes=(1000, 100000, 1000000), axes=('min', 'average', None)):
+	import random
+	results = []
+	for size in sizes:
+		points = [(random.random(), random.random(), random.random()) for x in range(size)]
+		start = time.time()
+		_legacyFlatten(points, axes)
+		legacy = time.time() - start
+		array = asArray(points)
+		start = time.time()
+		flatten(array, axes)
+		vectorized = time.time() - start
+		results.append((size, legacy, vectorized))
+		print('{0:>8} points: legacy {1:.4f}s, flatten {2:.4f}s, {3:.1f}x'.format(
+			size, legacy, vectorized, legacy / max(vectorized, 1e-9)))
+	return results
+
+
+if __name__ == '__main__':
+	if numpy is None:
+		print('numpy is not available, benchmarking the python fallback')
+	benchmark()
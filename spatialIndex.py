@@ -0,0 +1,251 @@
+"""
+spatialIndex.py
+
+Radius limited nearest neighbour lookups used by the modeling tools.
+Pure python so it can be imported (and tested) outside of Maya.
+"""
+
+import math
+import multiprocessing
+
+# average number of points per occupied grid cell before the grid is
+# considered degenerate and a kd-tree is used instead
+_MAX_CELL_OCCUPANCY = 32
+_LEAF_SIZE = 8
+
+def toPoints(points):
+	return [(float(p[0]), float(p[1]), float(p[2])) for p in points]
+
+def distanceSquared(a, b):
+	dx = a[0] - b[0]
+	dy = a[1] - b[1]
+	dz = a[2] - b[2]
+	return dx * dx + dy * dy + dz * dz
+
+
+class GridIndex(object):
+	"""Uniform grid hash, bucketed by cell size (usually the snap threshold)."""
+	def __init__(self, points, cellSize):
+		if cellSize <= 0:
+			raise ValueError('cell size must be greater than 0')
+		self.points = toPoints(points)
+		self.cellSize = float(cellSize)
+		self.cells = {}
+		for i, point in enumerate(self.points):
+			self.cells.setdefault(self.cellKey(point), []).append(i)
+
+	def __repr__(self):
+		return 'GridIndex({0} points, {1} cells)'.format(len(self.points), len(self.cells))
+
+	def __len__(self):
+		return len(self.points)
+
+	@property
+	def occupancy(self):
+		if not self.cells:
+			return 0.0
+		return len(self.points) / float(len(self.cells))
+
+	def cellKey(self, point):
+		s = self.cellSize
+		return (int(math.floor(point[0] / s)),
+				int(math.floor(point[1] / s)),
+				int(math.floor(point[2] / s)))
+
+	def within(self, point, radius):
+		""" Return a sorted list of (distanceSquared, index) within radius of point """
+		point = toPoints([point])[0]
+		reach = int(math.ceil(radius / self.cellSize))
+		cx, cy, cz = self.cellKey(point)
+		radiusSq = radius * radius
+		result = []
+		for x in range(cx - reach, cx + reach + 1):
+			for y in range(cy - reach, cy + reach + 1):
+				for z in range(cz - reach, cz + reach + 1):
+					for i in self.cells.get((x, y, z), ()):
+						d = distanceSquared(point, self.points[i])
+						if d <= radiusSq:
+							result.append((d, i))
+		result.sort()
+		return result
+
+	def nearest(self, point, radius):
+		""" Return the index of the closest point within radius, or None """
+		result = self.within(point, radius)
+		if result:
+			return result[0][1]
+
+
+class KDTree(object):
+	"""Static kd-tree, used when the grid would be too sparse or too crowded."""
+	def __init__(self, points):
+		self.points = toPoints(points)
+		self.root = self._build(list(range(len(self.points))), 0)
+
+	def __repr__(self):
+		return 'KDTree({0} points)'.format(len(self.points))
+
+	def __len__(self):
+		return len(self.points)
+
+	def _build(self, indices, depth):
+		# leaves are lists of point indices, branches are (axis, split, left, right)
+		if len(indices) <= _LEAF_SIZE:
+			return indices
+		axis = depth % 3
+		indices.sort(key=lambda i: self.points[i][axis])
+		mid = len(indices) // 2
+		split = self.points[indices[mid]][axis]
+		return (axis, split, self._build(indices[:mid], depth + 1), self._build(indices[mid:], depth + 1))
+
+	def within(self, point, radius):
+		""" Return a sorted list of (distanceSquared, index) within radius of point """
+		point = toPoints([point])[0]
+		radiusSq = radius * radius
+		result = []
+		stack = [self.root]
+		while stack:
+			node = stack.pop()
+			if isinstance(node, list):
+				for i in node:
+					d = distanceSquared(point, self.points[i])
+					if d <= radiusSq:
+						result.append((d, i))
+				continue
+			axis, split, left, right = node
+			delta = point[axis] - split
+			if delta - radius <= 0:
+				stack.append(left)
+			if delta + radius >= 0:
+				stack.append(right)
+		result.sort()
+		return result
+
+	def nearest(self, point, radius):
+		""" Return the index of the closest point within radius, or None """
+		point = toPoints([point])[0]
+		best = [radius * radius, None]
+		self._nearest(self.root, point, best)
+		return best[1]
+
+	def _nearest(self, node, point, best):
+		if isinstance(node, list):
+			for i in node:
+				d = distanceSquared(point, self.points[i])
+				if d <= best[0]:
+					if best[1] is None or d < best[0] or i < best[1]:
+						best[0], best[1] = d, i
+			return
+		axis, split, left, right = node
+		delta = point[axis] - split
+		near, far = (left, right) if delta < 0 else (right, left)
+		self._nearest(near, point, best)
+		if delta * delta <= best[0]:
+			self._nearest(far, point, best)
+
+
+def buildIndex(points, radius):
+	""" Return a GridIndex bucketed by radius, or a KDTree if the grid would degenerate """
+	if radius > 0:
+		grid = GridIndex(points, radius)
+		if grid.occupancy <= _MAX_CELL_OCCUPANCY:
+			return grid
+	return KDTree(points)
+
+def matchPoints(source, target, threshold, index=None):
+	"""
+	Greedily pair each source point with a unique target point within
+	threshold, closest pairs first.  Returns a list of (sourceIndex, targetIndex).
+	"""
+	if index is None:
+		index = buildIndex(target, threshold)
+	candidates = []
+	for i, point in enumerate(toPoints(source)):
+		for d, j in index.within(point, threshold):
+			candidates.append((d, i, j))
+	candidates.sort()
+	usedSource = set()
+	usedTarget = set()
+	matches = []
+	for d, i, j in candidates:
+		if i in usedSource or j in usedTarget:
+			continue
+		usedSource.add(i)
+		usedTarget.add(j)
+		matches.append((i, j))
+	matches.sort()
+	return matches
+
+_workerState = {}
+
+def _initPairWorker(points, owners, threshold):
+	_workerState['points'] = points
+	_workerState['owners'] = owners
+	_workerState['threshold'] = threshold
+	_workerState['index'] = buildIndex(points, threshold)
+
+def _findPairs(indices):
+	points = _workerState['points']
+	owners = _workerState['owners']
+	threshold = _workerState['threshold']
+	index = _workerState['index']
+	pairs = []
+	for i in indices:
+		for d, j in index.within(points[i], threshold):
+			if i < j and owners[i] != owners[j]:
+				pairs.append((d, i, j))
+	return pairs
+
+def crossPairs(points, owners, threshold, processes=1, chunkSize=4096):
+	"""
+	Find pairs of points owned by different owners (usually meshes) within
+	threshold of each other, in one sweep over a single index.  Each point
+	is paired at most once per other owner, closest pairs first.  The
+	search is split across a process pool when processes > 1.
+	Returns a list of (i, j) with i < j.
+	"""
+	points = toPoints(points)
+	owners = list(owners)
+	chunks = [range(x, min(x + chunkSize, len(points))) for x in range(0, len(points), chunkSize)]
+	if processes > 1 and len(chunks) > 1:
+		pool = multiprocessing.Pool(processes, _initPairWorker, (points, owners, threshold))
+		try:
+			results = pool.map(_findPairs, chunks)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		_initPairWorker(points, owners, threshold)
+		results = [_findPairs(x) for x in chunks]
+		_workerState.clear()
+	candidates = [pair for result in results for pair in result]
+	candidates.sort()
+	used = set()
+	pairs = []
+	for d, i, j in candidates:
+		if (i, owners[j]) in used or (j, owners[i]) in used:
+			continue
+		used.add((i, owners[j]))
+		used.add((j, owners[i]))
+		pairs.append((i, j))
+	pairs.sort()
+	return pairs
+
+def clusterPairs(pairs):
+	""" Group paired indices into connected clusters, returned as sorted lists """
+	parents = {}
+	def find(i):
+		root = parents.setdefault(i, i)
+		while parents[root] != root:
+			root = parents[root]
+		while parents[i] != root:
+			parents[i], i = root, parents[i]
+		return root
+	for i, j in pairs:
+		a, b = find(i), find(j)
+		if a != b:
+			parents[max(a, b)] = min(a, b)
+	clusters = {}
+	for i in parents:
+		clusters.setdefault(find(i), []).append(i)
+	return sorted([sorted(x) for x in clusters.values()])
@@ -0,0 +1,40 @@
+"""
+Stand-in for a mayapy farm worker, for tests/test_farm.py.  What it does
+with a job depends on the node name: 'crash' kills the worker the first
+time, 'fail' reports an error, 'hang' never finishes and 'broken' makes
+the worker fail to set up.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pipeline'))
+
+import farm
+
+def main(jobFile):
+	data = farm.readJobFile(jobFile)
+	if [x for x in data['jobs'] if x['node'] == 'broken']:
+		farm.emit({'event' : 'setupError', 'message' : 'no fbxmaya'})
+		return
+	print('maya startup noise')
+	farm.emit({'event' : 'open', 'scene' : data['scene']})
+	for job in data['jobs']:
+		farm.emit({'event' : 'start', 'node' : job['node']})
+		if job['node'] == 'crash':
+			marker = os.path.join(os.path.dirname(jobFile), 'crashed')
+			if not os.path.exists(marker):
+				open(marker, 'w').close()
+				sys.exit(1)
+		elif job['node'] == 'hang':
+			time.sleep(60)
+		elif job['node'] == 'fail':
+			farm.emit({'event' : 'error', 'node' : job['node'], 'message' : 'boom'})
+			continue
+		farm.emit({'event' : 'exported', 'node' : job['node'], 'path' : job['path'], 'historyPath' : job['historyPath']})
+	farm.emit({'event' : 'done'})
+
+
+if __name__ == '__main__':
+	main(sys.argv[1])
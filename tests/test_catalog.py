@@ -0,0 +1,77 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pipeline'))
+
+import catalog
+
+
+class CatalogTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.write('chair/models/chair.v001.ma', mtime=100)
+		self.write('chair/models/chair.v002.ma', mtime=200)
+		self.write('chair/exports/chair.v001.fbx', mtime=300)
+		self.write('table/models/table.v001.ma', mtime=400)
+		self.age()
+		self.catalog = catalog.Catalog(self.dir, dbPath=':memory:', ttl=0)
+
+	def tearDown(self):
+		self.catalog.close()
+		shutil.rmtree(self.dir)
+
+	def path(self, name):
+		return os.path.join(self.dir, *name.split('/'))
+
+	def write(self, name, data='', mtime=None):
+		path = self.path(name)
+		if not os.path.isdir(os.path.dirname(path)):
+			os.makedirs(os.path.dirname(path))
+		with open(path, 'w') as f:
+			f.write(data)
+		if mtime is not None:
+			os.utime(path, (mtime, mtime))
+
+	def age(self):
+		# old folder mtimes, so the listings can be trusted
+		for root, dirs, files in os.walk(self.dir):
+			os.utime(root, (1000, 1000))
+
+	def test_queries(self):
+		self.assertEqual(self.catalog.packages(), ['chair', 'table'])
+		self.assertEqual(self.catalog.latestPaths('models'),
+			[self.path('chair/models/chair.v002.ma'), self.path('table/models/table.v001.ma')])
+		self.assertEqual(self.catalog.latestPaths('models', 'table'), [self.path('table/models/table.v001.ma')])
+		self.assertEqual(self.catalog.latestVersion('models', 'chair', 'chair.ma'), 2)
+		self.assertEqual(self.catalog.latestVersion('models', 'chair', 'stool.ma'), 0)
+		self.assertEqual([x['name'] for x in self.catalog.files('models', 'chair')], ['chair.v001.ma', 'chair.v002.ma'])
+
+	def test_refreshListsChangedFoldersOnly(self):
+		self.assertEqual(self.catalog.refresh(), 6)
+		self.assertEqual(self.catalog.refresh(), 0)
+		self.write('chair/models/chair.v003.ma')
+		os.utime(self.path('chair/models'), (2000, 2000))
+		self.assertEqual(self.catalog.refresh(), 1)
+		self.assertEqual(self.catalog.latestVersion('models', 'chair', 'chair.ma'), 3)
+
+	def test_removedFoldersAreForgotten(self):
+		self.catalog.refresh()
+		shutil.rmtree(self.path('table'))
+		os.utime(self.dir, (2000, 2000))
+		self.assertEqual(self.catalog.packages(), ['chair'])
+		self.assertEqual(self.catalog.files(package='table'), [])
+
+	def test_newerPackagesRestatsOverwrittenFiles(self):
+		self.assertEqual(self.catalog.newerPackages('models', 'exports'), ['table'])
+		# overwriting a file in place leaves its folder's mtime alone
+		self.write('chair/models/chair.v002.ma', 'changed', mtime=500)
+		self.age()
+		self.assertEqual(self.catalog.newerPackages('models', 'exports'), ['chair', 'table'])
+		self.assertEqual(self.catalog.files('models', 'chair')[1]['size'], len('changed'))
+
+
+if __name__ == '__main__':
+	unittest.main()
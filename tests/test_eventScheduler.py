@@ -0,0 +1,100 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import eventScheduler
+
+
+class FakeEventLoop(object):
+	""" Collects deferred calls until process() is called, standing in for Maya's idle queue """
+	def __init__(self):
+		self.queue = []
+
+	def defer(self, func):
+		self.queue.append(func)
+
+	def process(self):
+		""" Run every deferred call.  Returns the number of calls run """
+		queue, self.queue = self.queue, []
+		for func in queue:
+			func()
+		return len(queue)
+
+
+class CoalescingSchedulerTest(unittest.TestCase):
+	def setUp(self):
+		self.loop = FakeEventLoop()
+		self.calls = []
+		self.selection = ['pCube1']
+
+	def scheduler(self, fingerprint=None):
+		return eventScheduler.CoalescingScheduler(lambda: self.calls.append(list(self.selection)), self.loop.defer, fingerprint)
+
+	def test_burstRunsOnceAtIdle(self):
+		scheduler = self.scheduler()
+		for i in range(50):
+			scheduler.trigger()
+		self.assertEqual(self.calls, [])
+		self.assertEqual(len(self.loop.queue), 1)
+		self.assertEqual(self.loop.process(), 1)
+		self.assertEqual(len(self.calls), 1)
+		self.assertEqual((scheduler.triggers, scheduler.runs), (50, 1))
+
+	def test_runSeesLatestState(self):
+		scheduler = self.scheduler()
+		scheduler.trigger()
+		self.selection = ['pCube2']
+		scheduler.trigger()
+		self.loop.process()
+		self.assertEqual(self.calls, [['pCube2']])
+
+	def test_triggerAfterRunDefersAgain(self):
+		scheduler = self.scheduler()
+		scheduler.trigger()
+		self.loop.process()
+		scheduler.trigger()
+		self.assertEqual(self.loop.process(), 1)
+		self.assertEqual(len(self.calls), 2)
+		self.assertEqual(self.loop.process(), 0)
+
+	def test_unchangedFingerprintSkips(self):
+		scheduler = self.scheduler(lambda: tuple(self.selection))
+		scheduler.trigger()
+		self.loop.process()
+		scheduler.trigger()
+		self.loop.process()
+		self.assertEqual(len(self.calls), 1)
+		self.assertEqual(scheduler.skips, 1)
+		self.selection = ['pCube2']
+		scheduler.trigger()
+		self.loop.process()
+		self.assertEqual(len(self.calls), 2)
+
+	def test_forceRunsWithUnchangedFingerprint(self):
+		scheduler = self.scheduler(lambda: tuple(self.selection))
+		scheduler.trigger()
+		self.loop.process()
+		scheduler.trigger()
+		scheduler.trigger(force=True)
+		scheduler.trigger()
+		self.loop.process()
+		self.assertEqual(len(self.calls), 2)
+		# the force only applies to the run it was coalesced into
+		scheduler.trigger()
+		self.loop.process()
+		self.assertEqual(len(self.calls), 2)
+
+	def test_reset(self):
+		scheduler = self.scheduler(lambda: tuple(self.selection))
+		scheduler.trigger()
+		self.loop.process()
+		scheduler.reset()
+		scheduler.trigger()
+		self.loop.process()
+		self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pipeline'))
+
+import farm
+
+_WORKER = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'farmWorker.py')]
+
+def makeJobs(nodes):
+	return [{'node' : x, 'path' : x + '.fbx', 'historyPath' : x + '.v001.fbx'} for x in nodes]
+
+
+class FarmHelpersTest(unittest.TestCase):
+	def test_shard(self):
+		self.assertEqual(farm.shard([1, 2, 3, 4, 5], 2), [[1, 3, 5], [2, 4]])
+		self.assertEqual(farm.shard([1], 4), [[1]])
+		self.assertEqual(farm.shard([], 4), [])
+
+	def test_parseEvent(self):
+		self.assertEqual(farm.parseEvent('{"event": "done"}'), {'event' : 'done'})
+		self.assertEqual(farm.parseEvent('Warning: noise'), {'event' : 'log', 'message' : 'Warning: noise'})
+		self.assertEqual(farm.parseEvent('[1, 2]')['event'], 'log')
+
+
+class ExportFarmTest(unittest.TestCase):
+	def run_farm(self, nodes, **kwargs):
+		self.events = []
+		exportFarm = farm.ExportFarm(_WORKER, **kwargs)
+		return exportFarm.run('scene.ma', 'udkExport', makeJobs(nodes), progress=self.events.append)
+
+	def test_exportsEveryJob(self):
+		results = self.run_farm(['a', 'b', 'c', 'd', 'e'], workers=2)
+		self.assertEqual(sorted(results), ['a', 'b', 'c', 'd', 'e'])
+		self.assertEqual(set([x['event'] for x in results.values()]), set(['exported']))
+		self.assertEqual(set([x['worker'] for x in self.events if x['event'] == 'exported']), set([0, 1]))
+
+	def test_failedJobIsRetriedThenReported(self):
+		results = self.run_farm(['a', 'fail'], workers=1, retries=1)
+		self.assertEqual(results['a']['event'], 'exported')
+		self.assertEqual(results['fail']['event'], 'error')
+		self.assertEqual(results['fail']['attempt'], 1)
+
+	def test_crashedWorkerJobsAreRetried(self):
+		results = self.run_farm(['a', 'crash', 'b'], workers=1, retries=1)
+		for node in ('a', 'crash', 'b'):
+			self.assertEqual(results[node]['event'], 'exported')
+		self.assertEqual(results['crash']['attempt'], 1)
+
+	def test_noRetriesLeavesCrashUnreported(self):
+		results = self.run_farm(['crash'], workers=1, retries=0)
+		self.assertEqual(results['crash']['message'], 'no result from worker')
+
+	def test_setupErrorIsNotRetried(self):
+		results = self.run_farm(['a', 'broken'], workers=1, retries=2)
+		for node in ('a', 'broken'):
+			self.assertEqual(results[node]['event'], 'error')
+			self.assertEqual(results[node]['attempt'], 0)
+			self.assertTrue('no fbxmaya' in results[node]['message'])
+
+	def test_hungWorkerIsKilled(self):
+		start = time.time()
+		results = self.run_farm(['a', 'hang'], workers=1, retries=0, timeout=2)
+		self.assertTrue(time.time() - start < 30)
+		self.assertEqual(results['a']['event'], 'exported')
+		self.assertEqual(results['hang']['event'], 'error')
+		self.assertTrue('timed out' in results['hang']['message'])
+		self.assertEqual([x.get('node') for x in self.events if x['event'] == 'timeout'], ['hang'])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pipeline'))
+
+import fileTree
+
+
+class FileTreeTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		os.mkdir(os.path.join(self.dir, 'sub'))
+		self.write('a.ma')
+		self.age()
+		self.lists = 0
+		listDirectory = fileTree.listDirectory
+		def countingList(path):
+			self.lists += 1
+			return listDirectory(path)
+		fileTree.listDirectory = countingList
+		self.addCleanup(setattr, fileTree, 'listDirectory', listDirectory)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def write(self, name):
+		with open(os.path.join(self.dir, name), 'w') as f:
+			f.write(name)
+
+	def age(self, mtime=1000):
+		# an old mtime, so the listing can be trusted
+		os.utime(self.dir, (mtime, mtime))
+
+	def test_listing(self):
+		tree = fileTree.FileTree()
+		self.assertEqual(tree.files(self.dir), ['a.ma'])
+		self.assertEqual(tree.dirs(self.dir), ['sub'])
+		self.assertTrue(tree.isFile(os.path.join(self.dir, 'a.ma')))
+		self.assertTrue(tree.isDir(os.path.join(self.dir, 'sub')))
+		self.assertFalse(tree.isFile(os.path.join(self.dir, 'sub')))
+		self.assertEqual(tree.files(os.path.join(self.dir, 'missing')), [])
+		self.assertEqual(self.lists, 1)
+
+	def test_unchangedMtimeIsNotListedAgain(self):
+		tree = fileTree.FileTree(ttl=0)
+		tree.files(self.dir)
+		tree.files(self.dir)
+		self.assertEqual(self.lists, 1)
+
+	def test_changedMtimeIsListedAgain(self):
+		tree = fileTree.FileTree(ttl=0)
+		tree.files(self.dir)
+		self.write('b.ma')
+		self.age(2000)
+		self.assertEqual(tree.files(self.dir), ['a.ma', 'b.ma'])
+		self.assertEqual(self.lists, 2)
+
+	def test_racyListingIsListedAgain(self):
+		tree = fileTree.FileTree(ttl=0)
+		self.write('b.ma')
+		self.assertTrue(tree.listing(self.dir).racy)
+		tree.files(self.dir)
+		self.assertEqual(self.lists, 2)
+
+	def test_ttlTrustsListing(self):
+		tree = fileTree.FileTree(ttl=60)
+		tree.files(self.dir)
+		self.write('b.ma')
+		self.assertEqual(tree.files(self.dir), ['a.ma'])
+		tree.invalidate(self.dir)
+		self.assertEqual(tree.files(self.dir), ['a.ma', 'b.ma'])
+
+	def test_invalidateRecursive(self):
+		tree = fileTree.FileTree(ttl=60)
+		sub = os.path.join(self.dir, 'sub')
+		tree.files(self.dir)
+		tree.files(sub)
+		tree.invalidate(sub)
+		self.assertEqual(sorted(tree.listings), [os.path.normpath(self.dir)])
+		tree.files(sub)
+		tree.invalidate(self.dir, recursive=True)
+		self.assertEqual(tree.listings, {})
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,72 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lightList
+
+def applyEdits(rows, edits):
+	for edit in edits:
+		if edit[0] == 'clear':
+			del rows[:]
+		elif edit[0] == 'remove':
+			del rows[edit[1]]
+		elif edit[0] == 'insert':
+			rows.insert(edit[1], edit[2])
+		else:
+			rows[edit[1]] = edit[2]
+
+def makeItems(names, prefix='[0]'):
+	return [(name, '{0}  {1}'.format(prefix, name)) for name in names]
+
+
+class LightListModelTest(unittest.TestCase):
+	def setUp(self):
+		self.model = lightList.LightListModel()
+		self.rows = []
+
+	def update(self, items):
+		edits = self.model.update(items)
+		applyEdits(self.rows, edits)
+		self.assertEqual(self.rows, [x[1] for x in items])
+		return edits
+
+	def test_onlyChangedRowsAreEdited(self):
+		self.update(makeItems(['a', 'b', 'c', 'd', 'e']))
+		items = makeItems(['a', 'c', 'd', 'e', 'f'])
+		items[2] = ('d', '[X]  d')
+		self.assertEqual(self.update(items), [('remove', 1), ('set', 2, '[X]  d'), ('insert', 4, '[0]  f')])
+		self.assertEqual(self.update(items), [])
+
+	def test_manyChangesClearTheList(self):
+		self.update(makeItems(['a', 'b', 'c']))
+		edits = self.update(makeItems(['a', 'b', 'c'], '[S]'))
+		self.assertEqual(edits[0], ('clear',))
+
+	def test_reorderClearsTheList(self):
+		self.update(makeItems(['a', 'b', 'c', 'd']))
+		edits = self.update(makeItems(['a', 'c', 'b', 'd']))
+		self.assertEqual(edits[0], ('clear',))
+
+	def test_rows(self):
+		self.update(makeItems(['a', 'b']))
+		self.assertEqual(len(self.model), 2)
+		self.assertEqual(self.model.nameAt(1), 'b')
+		self.assertEqual(self.model.row('b'), 1)
+		self.assertEqual(self.model.row('z'), None)
+
+	def test_randomUpdates(self):
+		rand = random.Random(1)
+		names = ['light{0}'.format(x) for x in range(12)]
+		for x in range(300):
+			kept = sorted(rand.sample(names, rand.randint(0, len(names))))
+			items = [(name, '[{0}]  {1}'.format(rand.choice('0X'), name)) for name in kept]
+			if rand.random() < 0.2:
+				rand.shuffle(items)
+			self.update(items)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,62 @@
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import meshTopology
+
+# a 2x1 strip of quads, folded 90 degrees along its middle edge
+#   3---4---5
+#   |   |   |
+#   0---1---2
+_FACE_COUNTS = [4, 4]
+_FACE_CONNECTS = [0, 1, 4, 3, 1, 2, 5, 4]
+_FOLDED = [0, 0, 0, 1, 0, 0, 1, 0, 1, 0, 1, 0, 1, 1, 0, 1, 1, 1]
+_FLAT = [0, 0, 0, 1, 0, 0, 2, 0, 0, 0, 1, 0, 1, 1, 0, 2, 1, 0]
+
+def rotatedNormal(angle):
+	return (0.0, math.sin(angle), math.cos(angle))
+
+
+class MeshTopologyTest(unittest.TestCase):
+	def setUp(self):
+		meshTopology.clearCache()
+
+	def test_adjacency(self):
+		topology = meshTopology.MeshTopology(_FACE_COUNTS, _FACE_CONNECTS)
+		self.assertEqual(list(topology.neighbors(0)), [1])
+		self.assertEqual(list(topology.neighbors(1)), [0])
+		self.assertEqual(topology.borderVertices(), [0, 1, 2, 3, 4, 5])
+
+	def test_planarRegions(self):
+		topology = meshTopology.getTopology(_FACE_COUNTS, _FACE_CONNECTS)
+		self.assertEqual(meshTopology.planarRegions(topology, _FLAT, 0.01), [[0, 1]])
+		self.assertEqual(meshTopology.planarRegions(topology, _FOLDED, 0.01), [[0], [1]])
+
+	def test_topologyIsCached(self):
+		topology = meshTopology.getTopology(_FACE_COUNTS, _FACE_CONNECTS)
+		self.assertTrue(meshTopology.getTopology(list(_FACE_COUNTS), list(_FACE_CONNECTS)) is topology)
+		self.assertFalse(meshTopology.getTopology([4], _FACE_CONNECTS[:4]) is topology)
+
+	def test_growReachesFaceRejectedAcrossCrease(self):
+		# three triangles around vertex 0, each sharing an edge with the other two.
+		# face 1 is too far from the seed, but close enough to face 2
+		topology = meshTopology.MeshTopology([3, 3, 3], [0, 1, 2, 0, 2, 3, 0, 3, 1])
+		tol = 0.1
+		normals = []
+		for angle in (0.0, 0.14, 0.07):
+			normals.extend(rotatedNormal(angle))
+		region = meshTopology.growPlanarRegion(topology, normals, [0], tol)
+		self.assertEqual(sorted(region), [0, 1, 2])
+		labels = meshTopology.segmentPlanarRegions(topology, normals, tol)
+		self.assertEqual(len(set(labels)), 1)
+
+	def test_indexRanges(self):
+		self.assertEqual(meshTopology.indexRanges([5, 1, 2, 3, 7, 6, 2]), [(1, 3), (5, 7)])
+		self.assertEqual(meshTopology.indexRanges([]), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
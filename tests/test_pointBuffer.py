@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import meshTopology
+import pointBuffer
+
+
+class MeshPointBufferTest(unittest.TestCase):
+	def setUp(self):
+		self.backend = pointBuffer.MemoryBackend({
+			'a' : [(0, 0, 0), (1, 0, 0), (2, 0, 0), (3, 0, 0)],
+			'b' : [(0, 1, 0), (1, 1, 0)],
+		})
+		self.buffer = pointBuffer.MeshPointBuffer(['a', 'b'], self.backend)
+
+	def test_readsEachMeshOnce(self):
+		self.buffer.add('a')
+		self.assertEqual(self.backend.reads, ['a', 'b'])
+		self.assertEqual(self.buffer.count('a'), 4)
+		self.assertEqual(self.buffer.getPoints('b'), [(0, 1, 0), (1, 1, 0)])
+
+	def test_commitWritesOnlyDirtyIndices(self):
+		self.buffer.setPoint('a', 1, (5, 5, 5))
+		self.buffer.setPoint('a', 2, (6, 6, 6))
+		self.assertTrue(self.buffer.isDirty('a'))
+		self.assertFalse(self.buffer.isDirty('b'))
+		self.assertEqual(self.buffer.commit(), 2)
+		self.assertEqual(self.backend.writes, [('a', [1, 2])])
+		self.assertEqual(self.backend.meshes['a'][1], (5, 5, 5))
+		self.assertEqual(self.backend.meshes['a'][3], (3, 0, 0))
+		self.assertFalse(self.buffer.isDirty())
+		self.assertEqual(self.buffer.commit(), 0)
+
+	def test_revert(self):
+		self.buffer.setPoint('b', 0, (9, 9, 9))
+		self.buffer.revert()
+		self.assertEqual(self.buffer.getPoint('b', 0), (0, 1, 0))
+		self.assertFalse(self.buffer.isDirty())
+
+	def test_dirtyRanges(self):
+		for index in (3, 0, 1):
+			self.buffer.setPoint('a', index, (0, 0, 0))
+		self.assertEqual(meshTopology.indexRanges(self.buffer.dirtyIndices('a')), [(0, 1), (3, 3)])
+
+
+if __name__ == '__main__':
+	unittest.main()
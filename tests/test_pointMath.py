@@ -0,0 +1,48 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pointMath
+
+_POINTS = [(0, 0, 4), (1, 2, 0), (3, 1, 2), (4, 5, 1)]
+
+def asTuples(points):
+	return [tuple([float(x) for x in p]) for p in points]
+
+
+class PointMathTest(unittest.TestCase):
+	def test_axisValue(self):
+		self.assertEqual(pointMath.axisValue(_POINTS, 0, 'min'), 0.0)
+		self.assertEqual(pointMath.axisValue(_POINTS, 1, 'max'), 5.0)
+		self.assertEqual(pointMath.axisValue(_POINTS, 0, 'average'), 2.0)
+		self.assertEqual(pointMath.axisValue(_POINTS, 2, 'median'), 1.5)
+		self.assertRaises(ValueError, pointMath.axisValue, _POINTS, 0, 'mode')
+
+	def test_flatten(self):
+		result = asTuples(pointMath.flatten(_POINTS, ('min', None, 7)))
+		self.assertEqual(result, [(0.0, y, 7.0) for x, y, z in asTuples(_POINTS)])
+
+	def test_flattenMatchesLegacy(self):
+		for axes in (('min', None, None), (None, 'average', 'max'), ('max', None, 'min')):
+			self.assertEqual(asTuples(pointMath.flatten(_POINTS, axes)),
+				asTuples(pointMath._legacyFlatten(_POINTS, axes)))
+
+	def test_flattenEmpty(self):
+		self.assertEqual(len(pointMath.flatten([], ('min', None, None))), 0)
+
+	def test_flattenToPlane(self):
+		result = asTuples(pointMath.flattenToPlane(_POINTS, (0, 0, 1), (0, 0, 2)))
+		self.assertEqual(result, [(x, y, 1.0) for x, y, z in asTuples(_POINTS)])
+		self.assertRaises(ValueError, pointMath.flattenToPlane, _POINTS, (0, 0, 0), (0, 0, 0))
+
+	def test_slope(self):
+		result = asTuples(pointMath.slope([(0, 0, 0), (2, 0, 0)], 0.5, 1, 0, 0))
+		self.assertEqual(result, [(0.0, -1.0, 0.0), (2.0, 0.0, 0.0)])
+		result = asTuples(pointMath.slope([(0, 0, 0), (2, 0, 0)], 0.5, 1, 0, 0, reverse=-1))
+		self.assertEqual(result, [(0.0, 0.0, 0.0), (2.0, 1.0, 0.0)])
+
+
+if __name__ == '__main__':
+	unittest.main()
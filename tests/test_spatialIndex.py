@@ -0,0 +1,52 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import spatialIndex
+
+def bruteWithin(points, point, radius):
+	return sorted([(spatialIndex.distanceSquared(point, p), i) for i, p in enumerate(points)
+		if spatialIndex.distanceSquared(point, p) <= radius * radius])
+
+
+class SpatialIndexTest(unittest.TestCase):
+	def setUp(self):
+		rand = random.Random(1)
+		self.points = [(rand.uniform(-5, 5), rand.uniform(-5, 5), rand.uniform(-5, 5)) for x in range(500)]
+
+	def test_gridMatchesBruteForce(self):
+		grid = spatialIndex.GridIndex(self.points, 0.5)
+		for point in self.points[:50]:
+			self.assertEqual(grid.within(point, 0.8), bruteWithin(self.points, point, 0.8))
+
+	def test_kdTreeMatchesBruteForce(self):
+		tree = spatialIndex.KDTree(self.points)
+		for point in self.points[:50]:
+			self.assertEqual(tree.within(point, 0.8), bruteWithin(self.points, point, 0.8))
+			self.assertEqual(tree.nearest(point, 0.8), bruteWithin(self.points, point, 0.8)[0][1])
+
+	def test_buildIndexFallsBackToKDTree(self):
+		self.assertTrue(isinstance(spatialIndex.buildIndex(self.points, 0.5), spatialIndex.GridIndex))
+		self.assertTrue(isinstance(spatialIndex.buildIndex(self.points, 0), spatialIndex.KDTree))
+		crowded = [(0, 0, x * 1e-6) for x in range(100)]
+		self.assertTrue(isinstance(spatialIndex.buildIndex(crowded, 1.0), spatialIndex.KDTree))
+
+	def test_matchPointsIsGreedyAndUnique(self):
+		source = [(0, 0, 0), (1, 0, 0), (5, 5, 5)]
+		target = [(1.05, 0, 0), (0.02, 0, 0), (0.04, 0, 0)]
+		self.assertEqual(spatialIndex.matchPoints(source, target, 0.1), [(0, 1), (1, 0)])
+
+	def test_crossPairsSkipsSameOwner(self):
+		points = [(0, 0, 0), (0.01, 0, 0), (0.02, 0, 0), (3, 0, 0)]
+		owners = ['a', 'a', 'b', 'b']
+		self.assertEqual(spatialIndex.crossPairs(points, owners, 0.1), [(1, 2)])
+
+	def test_clusterPairs(self):
+		self.assertEqual(spatialIndex.clusterPairs([(0, 1), (5, 6), (1, 2)]), [[0, 1, 2], [5, 6]])
+
+
+if __name__ == '__main__':
+	unittest.main()
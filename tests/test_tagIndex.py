@@ -0,0 +1,76 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pipeline'))
+
+import tagIndex
+
+
+class FakeScene(object):
+	""" Stand-in scene of uuid -> tags, where the handles given to added() are uuids """
+	def __init__(self, nodes):
+		self.sceneNodes = dict(nodes)
+		self.builds = 0
+
+	def taggedNodes(self):
+		self.builds += 1
+		return [(uuid, tags) for uuid, tags in self.sceneNodes.items() if tags]
+
+	def nodes(self, uuids):
+		return [x for x in uuids if x in self.sceneNodes]
+
+	def nodeTags(self, handles):
+		return [(x, self.sceneNodes[x]) for x in handles if self.sceneNodes.get(x)]
+
+
+class TagIndexTest(unittest.TestCase):
+	def setUp(self):
+		self.scene = FakeScene({'a' : ['udk'], 'b' : ['udk', 'zbrush'], 'c' : []})
+		self.index = tagIndex.TagIndex(self.scene)
+
+	def test_nodes(self):
+		self.assertEqual(self.index.nodes('udk'), ['a', 'b'])
+		self.assertEqual(self.index.nodes('zbrush'), ['b'])
+		self.assertEqual(self.index.allTags(), ['udk', 'zbrush'])
+
+	def test_update(self):
+		self.index.nodes('udk')
+		self.index.update('c', ['udk'])
+		self.index.update('a', [])
+		self.assertEqual(self.index.nodes('udk'), ['b', 'c'])
+		self.assertEqual(self.scene.builds, 1)
+
+	def test_discard(self):
+		self.index.nodes('udk')
+		del self.scene.sceneNodes['b']
+		self.index.discard('b')
+		self.assertEqual(self.index.nodes('udk'), ['a'])
+		self.assertEqual(self.index.allTags(), ['udk'])
+
+	def test_addedNodeIsIndexed(self):
+		self.index.nodes('udk')
+		# a duplicate gets its tags after the node added callback
+		self.scene.sceneNodes['d'] = []
+		self.index.added('d')
+		self.scene.sceneNodes['d'] = ['udk']
+		self.index.added('e')
+		self.assertEqual(self.index.nodes('udk'), ['a', 'b', 'd'])
+		self.assertEqual(self.scene.builds, 1)
+
+	def test_addedBeforeBuildIsIgnored(self):
+		self.index.added('a')
+		self.assertEqual(self.index.pending, [])
+		self.assertEqual(self.index.nodes('udk'), ['a', 'b'])
+
+	def test_tooManyAddedRebuilds(self):
+		self.index.nodes('udk')
+		for i in range(tagIndex._MAX_PENDING + 1):
+			self.index.added('n{0}'.format(i))
+		self.assertFalse(self.index.isBuilt)
+		self.index.nodes('udk')
+		self.assertEqual(self.scene.builds, 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tumblePivot
+
+def makeMesh(count, offset=0):
+	return [(i + offset, 2 * i, 0) for i in range(count)]
+
+def bruteCentroid(points):
+	return tuple([sum([p[i] for p in points]) / float(len(points)) for i in range(3)])
+
+
+class RangesTest(unittest.TestCase):
+	def test_parseComponents(self):
+		ranges = tumblePivot.parseComponents(['a.vtx[2:4]', 'a.vtx[7]', 'b.vtx[*]', 'a.e[3]', 'a.vtx[5:4]'], lambda node: 10)
+		self.assertEqual(ranges, [('a', 2, 4), ('a', 7, 7), ('b', 0, 9)])
+		self.assertEqual(tumblePivot.parseComponents(['b.vtx[*]']), [])
+
+	def test_normalizeAndSubtract(self):
+		self.assertEqual(tumblePivot.normalizeRanges([(5, 9), (0, 2), (3, 4), (8, 12)]), [(0, 12)])
+		self.assertEqual(tumblePivot.subtractRanges([(0, 10), (20, 30)], [(2, 3), (9, 21)]), [(0, 1), (4, 8), (22, 30)])
+
+	def test_sampleRanges(self):
+		self.assertEqual(tumblePivot.sampleRanges([('a', 0, 3)], 10), ['a.vtx[0:3]'])
+		# the stride carries on across ranges
+		samples = tumblePivot.sampleRanges([('a', 0, 4), ('b', 0, 4)], 4)
+		self.assertEqual(samples, ['a.vtx[0]', 'a.vtx[3]', 'b.vtx[1]', 'b.vtx[4]'])
+
+
+class CentroidTrackerTest(unittest.TestCase):
+	def setUp(self):
+		self.mesh = makeMesh(1000)
+		self.backend = tumblePivot.MemoryBackend({'a': self.mesh, 'b': makeMesh(10, 5)})
+		self.tracker = tumblePivot.CentroidTracker(self.backend)
+
+	def check(self, components, points):
+		total, count = self.tracker.update(components)
+		self.assertEqual(count, len(points))
+		self.assertEqual(tuple([x / float(count) for x in total]), bruteCentroid(points))
+
+	def test_readsOnlyTheChange(self):
+		self.check(['a.vtx[0:499]'], self.mesh[:500])
+		self.assertEqual(self.backend.pointsRead, 500)
+		self.check(['a.vtx[0:509]'], self.mesh[:510])
+		self.assertEqual(self.backend.pointsRead, 510)
+		self.check(['a.vtx[5:509]'], self.mesh[5:510])
+		self.assertEqual(self.backend.pointsRead, 515)
+
+	def test_multipleMeshes(self):
+		self.check(['a.vtx[0:9]', 'b.vtx[*]'], self.mesh[:10] + makeMesh(10, 5))
+		self.check(['b.vtx[*]'], makeMesh(10, 5))
+
+	def test_deformedMeshIsSummedAgain(self):
+		self.check(['a.vtx[0:99]'], self.mesh[:100])
+		moved = makeMesh(1000, 3)
+		self.backend.deform('a', moved)
+		self.check(['a.vtx[0:99]'], moved[:100])
+		self.assertEqual(self.backend.pointsRead, 200)
+
+	def test_maxRead(self):
+		self.check(['a.vtx[0:9]'], self.mesh[:10])
+		self.assertEqual(self.tracker.update(['a.vtx[0:999]'], maxRead=100), None)
+		# the tracker is left as it was
+		self.check(['a.vtx[0:19]'], self.mesh[:20])
+		self.assertEqual(self.backend.pointsRead, 20)
+
+
+class PivotEngineTest(unittest.TestCase):
+	def setUp(self):
+		self.mesh = makeMesh(1000)
+		self.backend = tumblePivot.MemoryBackend({'a': self.mesh}, {'loc': (9, 9, 9)})
+
+	def test_centroidAndBounds(self):
+		engine = tumblePivot.PivotEngine(self.backend)
+		self.assertEqual(engine.pivot(['a.vtx[0:9]'], ['loc']), bruteCentroid(self.mesh[:10] + [(9, 9, 9)]))
+		engine = tumblePivot.PivotEngine(self.backend, mode='bounds')
+		self.assertEqual(engine.pivot(['a.vtx[0:10]']), (5.0, 10.0, 0.0))
+		self.assertEqual(engine.pivot([]), None)
+		self.assertRaises(ValueError, tumblePivot.PivotEngine, self.backend, mode='median')
+
+	def test_sampled(self):
+		engine = tumblePivot.PivotEngine(self.backend, maxPoints=100)
+		engine.pivot(['a.vtx[*]'])
+		self.assertEqual(self.backend.pointsRead, 100)
+
+	def test_incrementalMatchesFull(self):
+		engine = tumblePivot.PivotEngine(self.backend, incremental=True)
+		for components in (['a.vtx[0:99]'], ['a.vtx[0:49]', 'a.vtx[60:120]'], ['a.vtx[3]']):
+			points = []
+			for node, start, end in tumblePivot.parseComponents(components):
+				points.extend(self.mesh[start:end + 1])
+			self.assertEqual(engine.pivot(components, ['loc']), bruteCentroid(points + [(9, 9, 9)]))
+
+	def test_incrementalFallsBackToSampling(self):
+		engine = tumblePivot.PivotEngine(self.backend, maxPoints=100, incremental=True)
+		engine.pivot(['a.vtx[*]'])
+		self.assertEqual(self.backend.pointsRead, 100)
+		self.assertEqual(engine.tracker.sums, {})
+
+
+if __name__ == '__main__':
+	unittest.main()
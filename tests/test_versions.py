@@ -0,0 +1,78 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pipeline'))
+
+import versions
+
+
+class VersionIndexTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.write('a.v001.fbx')
+		# an old mtime, so the first scan can be trusted
+		os.utime(self.dir, (1000, 1000))
+		versions.clearIndexes()
+		self.scans = 0
+		scan = versions.VersionIndex.scan
+		def countingScan(index):
+			self.scans += 1
+			scan(index)
+		versions.VersionIndex.scan = countingScan
+		self.addCleanup(setattr, versions.VersionIndex, 'scan', scan)
+
+	def tearDown(self):
+		versions.clearIndexes()
+		shutil.rmtree(self.dir)
+
+	def path(self, name):
+		return os.path.join(self.dir, name)
+
+	def write(self, name):
+		with open(self.path(name), 'w') as f:
+			f.write(name)
+
+	def test_registerDoesNotRescan(self):
+		self.assertEqual(versions.getLatestVersion(self.path('a.fbx')), 1)
+		self.assertEqual(self.scans, 1)
+		before = versions.directoryMtime(self.path('a.v002.fbx'))
+		self.write('a.v002.fbx')
+		versions.registerVersion(self.path('a.v002.fbx'), before)
+		self.assertEqual(versions.getLatestVersion(self.path('a.fbx')), 2)
+		self.assertEqual(versions.getLatestVersion(self.path('a.fbx')), 2)
+		self.assertEqual(self.scans, 1)
+
+	def test_registerAfterOutsideChangeRescans(self):
+		versions.getLatestVersion(self.path('a.fbx'))
+		# written by someone else since the index was scanned
+		self.write('a.v002.fbx')
+		os.utime(self.dir, (2000, 2000))
+		before = versions.directoryMtime(self.path('b.v001.fbx'))
+		self.write('b.v001.fbx')
+		versions.registerVersion(self.path('b.v001.fbx'), before)
+		self.assertEqual(self.scans, 1)
+		# past the mtime resolution, so the rescan can be trusted
+		os.utime(self.dir, (3000, 3000))
+		self.assertEqual(versions.getLatestVersion(self.path('a.fbx')), 2)
+		self.assertEqual(versions.getLatestVersion(self.path('b.fbx')), 1)
+		self.assertEqual(self.scans, 2)
+
+	def test_registerWithoutMtimeRescans(self):
+		versions.getLatestVersion(self.path('a.fbx'))
+		self.write('a.v002.fbx')
+		versions.registerVersion(self.path('a.v002.fbx'))
+		self.assertEqual(versions.getLatestVersion(self.path('a.fbx')), 2)
+		self.assertEqual(self.scans, 2)
+
+	def test_wideVersions(self):
+		self.write('a.v1000.fbx')
+		os.utime(self.dir, (3000, 3000))
+		self.assertEqual(versions.getLatestVersion(self.path('a.fbx')), 1000)
+		self.assertEqual(versions.setVersion(self.path('a.v001.fbx'), 1001), self.path('a.v1001.fbx'))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,364 @@
+"""
+tumblePivot.py
+
+Fast tumble pivot computation for MaxTumble.  Vertex selections are kept
+as the compact ranges Maya returns ('pCubeShape1.vtx[0:4999]') instead
+of being flattened, positions are fetched for all of them in one call,
+and the pivot is the centroid or bounding box centre of the points,
+vectorized with numpy when it is available.  Huge selections are
+sampled evenly down to maxPoints, which bounds the cost of an update.
+"""
+
+import itertools
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MODES = ('centroid', 'bounds')
+_VERTEX_RANGE = re.compile(r'^(.+)\.vtx\[(\*|\d+)(?::(\d+))?\]$')
+
+def parseComponents(components, vertexCount=None):
+    """
+    Parse 'node.vtx[a:b]' strings into a list of (node, start, end)
+    inclusive ranges.  vtx[*] needs vertexCount(node) to resolve its end.
+    Anything else is ignored.
+    """
+    ranges = []
+    for component in components:
+        match = _VERTEX_RANGE.match(component)
+        if match is None:
+            continue
+        node, start, end = match.groups()
+        if start == '*':
+            if vertexCount is None:
+                continue
+            start, end = 0, vertexCount(node) - 1
+        else:
+            start = int(start)
+            end = start if end is None else int(end)
+        if end >= start:
+            ranges.append((node, start, end))
+    return ranges
+
+def rangeCount(ranges):
+    return sum([end - start + 1 for node, start, end in ranges])
+
+def formatRange(node, start, end):
+    if start == end:
+        return '{0}.vtx[{1}]'.format(node, start)
+    return '{0}.vtx[{1}:{2}]'.format(node, start, end)
+
+def sampleRanges(ranges, maxPoints):
+    """
+    Return component strings for the ranges, or for every nth vertex of
+    them when there are more than maxPoints vertices in total
+    """
+    total = rangeCount(ranges)
+    if total <= maxPoints:
+        return [formatRange(*x) for x in ranges]
+    stride = -(-total // maxPoints)
+    components = []
+    # offset of the next sample from the start of the current range
+    offset = 0
+    for node, start, end in ranges:
+        for index in range(start + offset, end + 1, stride):
+            components.append(formatRange(node, index, index))
+        offset = (offset - (end - start + 1)) % stride
+    return components
+
+def normalizeRanges(ranges):
+    """ Sort and merge (start, end) inclusive ranges """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def subtractRanges(a, b):
+    """ Return the parts of normalized ranges a that are not in normalized ranges b """
+    result = []
+    j = 0
+    for start, end in a:
+        while j < len(b) and b[j][1] < start:
+            j += 1
+        k = j
+        while start <= end:
+            if k == len(b) or b[k][0] > end:
+                result.append((start, end))
+                break
+            if b[k][0] > start:
+                result.append((start, b[k][0] - 1))
+            start = max(start, b[k][1] + 1)
+            k += 1
+    return result
+
+def sumPoints(points):
+    """ Return the xyz sum of a flat xyz sequence """
+    if numpy is not None and len(points):
+        return numpy.asarray(points, dtype=float).reshape(-1, 3).sum(axis=0).tolist()
+    return [float(sum(points[i::3])) for i in range(3)]
+
+def centroid(points):
+    """ Return the average of a flat xyz sequence """
+    count = len(points) // 3
+    if not count:
+        return None
+    if numpy is not None:
+        return tuple(numpy.asarray(points, dtype=float).reshape(-1, 3).mean(axis=0).tolist())
+    return tuple([sum(points[i::3]) / float(count) for i in range(3)])
+
+def boundsCenter(points):
+    """ Return the centre of the bounding box of a flat xyz sequence """
+    if len(points) < 3:
+        return None
+    if numpy is not None:
+        array = numpy.asarray(points, dtype=float).reshape(-1, 3)
+        return tuple(((array.min(axis=0) + array.max(axis=0)) / 2.0).tolist())
+    return tuple([(min(points[i::3]) + max(points[i::3])) / 2.0 for i in range(3)])
+
+
+class CmdsBackend(object):
+    """Fetches world space positions with maya.cmds, one xform call for all components."""
+    def __init__(self):
+        self.generations = {}
+        self.callbacks = []
+        self.sceneCallbacks = []
+        # generations are unique across nodes and scenes, so a new node
+        # reusing a name never matches a sum of the old one
+        self.counter = itertools.count(1)
+
+    def readPositions(self, components):
+        import maya.cmds as cmds
+        if not components:
+            return []
+        return cmds.xform(components, q=1, t=1, ws=1) or []
+
+    def readTranslations(self, objects):
+        """ Return the world space translations of objects, skipping anything that isn't a transform """
+        import maya.cmds as cmds
+        points = []
+        for obj in cmds.ls(objects, type='transform') if objects else []:
+            points.extend(cmds.xform(obj, q=1, t=1, ws=1))
+        return points
+
+    def vertexCount(self, node):
+        import maya.cmds as cmds
+        return cmds.polyEvaluate(node, v=1)
+
+    def generation(self, node):
+        """
+        Return a counter that changes whenever node's mesh is dirtied, by an
+        edit, a deformer or a parent transform moving
+        """
+        shape = self._shape(node)
+        watched = self.generations.get(node)
+        if watched is None or not watched[0].isValid() or watched[0].object() != shape:
+            self._watch(node, shape)
+        return self.generations[node][1]
+
+    def _shape(self, node):
+        import maya.OpenMaya as om
+        sel = om.MSelectionList()
+        sel.add(node)
+        dag = om.MDagPath()
+        sel.getDagPath(0, dag)
+        dag.extendToShape()
+        return dag.node()
+
+    def _watch(self, node, shape):
+        import maya.OpenMaya as om
+        if not self.sceneCallbacks:
+            for message in (om.MSceneMessage.kAfterOpen, om.MSceneMessage.kAfterNew):
+                self.sceneCallbacks.append(om.MSceneMessage.addCallback(message, lambda data: self.reset()))
+        self.generations[node] = (om.MObjectHandle(shape), next(self.counter))
+        def dirty(*args):
+            handle = self.generations.get(node, (None,))[0]
+            if handle is not None and handle.isValid() and handle.object() == shape:
+                self.generations[node] = (handle, next(self.counter))
+        self.callbacks.append(om.MNodeMessage.addNodeDirtyCallback(shape, dirty))
+
+    def reset(self):
+        """ Remove the dirty callbacks, e.g. when a scene is opened """
+        import maya.OpenMaya as om
+        for callback in self.callbacks:
+            om.MMessage.removeCallback(callback)
+        self.callbacks = []
+        self.generations = {}
+
+    def release(self):
+        """ Remove every callback """
+        import maya.OpenMaya as om
+        self.reset()
+        for callback in self.sceneCallbacks:
+            om.MMessage.removeCallback(callback)
+        self.sceneCallbacks = []
+
+
+class MemoryBackend(object):
+    """Stand-in backend with meshes held in memory, for use outside of Maya."""
+    def __init__(self, meshes=None, objects=None):
+        self.meshes = meshes or {}
+        self.objects = objects or {}
+        self.generations = {}
+        self.reads = 0
+        self.pointsRead = 0
+
+    def readPositions(self, components):
+        self.reads += 1
+        points = []
+        for node, start, end in parseComponents(components, self.vertexCount):
+            for point in self.meshes[node][start:end + 1]:
+                points.extend(point)
+        self.pointsRead += len(points) // 3
+        return points
+
+    def readTranslations(self, objects):
+        points = []
+        for obj in objects:
+            points.extend(self.objects[obj])
+        return points
+
+    def vertexCount(self, node):
+        return len(self.meshes[node])
+
+    def generation(self, node):
+        return self.generations.get(node, 0)
+
+    def deform(self, node, points):
+        self.meshes[node] = points
+        self.generations[node] = self.generation(node) + 1
+
+
+class _MeshSum(object):
+    __slots__ = ('ranges', 'total', 'generation')
+
+    def __init__(self, ranges, total, generation):
+        self.ranges = ranges
+        self.total = total
+        self.generation = generation
+
+
+class CentroidTracker(object):
+    """
+    Running centroid of a vertex selection.  For each mesh it keeps the
+    selected index ranges and the sum of their positions, so a selection
+    change only reads the vertices that were added or removed.  A mesh is
+    summed again from scratch when its generation (backend.generation)
+    has changed, i.e. it was edited or deformed since it was summed.
+    """
+    def __init__(self, backend=None):
+        self.backend = CmdsBackend() if backend is None else backend
+        self.sums = {}
+
+    def __repr__(self):
+        return 'CentroidTracker({0} meshes)'.format(len(self.sums))
+
+    def reset(self):
+        self.sums = {}
+
+    def _read(self, node, ranges):
+        if not ranges:
+            return [0.0, 0.0, 0.0]
+        return sumPoints(self.backend.readPositions([formatRange(node, s, e) for s, e in ranges]))
+
+    def update(self, components, maxRead=None):
+        """
+        Track the selection given as vertex components.  Returns (sum, count)
+        of the selected points, or None, leaving the tracker as it was, if
+        that would read more than maxRead points
+        """
+        selected = {}
+        for node, start, end in parseComponents(components, self.backend.vertexCount):
+            selected.setdefault(node, []).append((start, end))
+        plans = []
+        cost = 0
+        for node, ranges in selected.items():
+            ranges = normalizeRanges(ranges)
+            generation = self.backend.generation(node)
+            old = self.sums.get(node)
+            count = rangeCount([(node, s, e) for s, e in ranges])
+            if old is None or old.generation != generation:
+                plans.append((node, ranges, generation, None, None, None))
+                cost += count
+                continue
+            added = subtractRanges(ranges, old.ranges)
+            removed = subtractRanges(old.ranges, ranges)
+            delta = rangeCount([(node, s, e) for s, e in added + removed])
+            if delta > count:
+                # the selection changed more than it stayed, reading it all is cheaper
+                plans.append((node, ranges, generation, None, None, None))
+                cost += count
+            else:
+                plans.append((node, ranges, generation, old, added, removed))
+                cost += delta
+        if maxRead is not None and cost > maxRead:
+            return None
+        sums = {}
+        for node, ranges, generation, old, added, removed in plans:
+            if old is None:
+                sums[node] = _MeshSum(ranges, self._read(node, ranges), generation)
+                continue
+            addedSum = self._read(node, added)
+            removedSum = self._read(node, removed)
+            total = [old.total[i] + addedSum[i] - removedSum[i] for i in range(3)]
+            sums[node] = _MeshSum(ranges, total, generation)
+        self.sums = sums
+        total = [0.0, 0.0, 0.0]
+        count = 0
+        for node, meshSum in sums.items():
+            count += rangeCount([(node, s, e) for s, e in meshSum.ranges])
+            total = [total[i] + meshSum.total[i] for i in range(3)]
+        return total, count
+
+
+class PivotEngine(object):
+    """
+    Computes tumble pivots.  With incremental=True, centroids come from a
+    CentroidTracker, which reads only the vertices added to or removed
+    from the selection since the last pivot, and is exact rather than
+    sampled.  When the tracker would have to read more than maxPoints
+    (a new huge selection, or one on an edited mesh), the pivot is
+    sampled as without incremental.
+    """
+    def __init__(self, backend=None, maxPoints=20000, mode='centroid', incremental=False):
+        if mode not in MODES:
+            raise ValueError('invalid pivot mode: {0}'.format(mode))
+        self.backend = CmdsBackend() if backend is None else backend
+        self.maxPoints = maxPoints
+        self.mode = mode
+        self.tracker = CentroidTracker(self.backend) if incremental else None
+
+    def __repr__(self):
+        return 'PivotEngine({0}, maxPoints={1})'.format(self.mode, self.maxPoints)
+
+    def pivot(self, components, objects=()):
+        """
+        Return the pivot of vertex components (as given by
+        polyListComponentConversion) and object translations, or None if
+        there is nothing to centre on
+        """
+        tracked = None
+        if self.mode == 'centroid' and self.tracker is not None:
+            tracked = self.tracker.update(components, self.maxPoints)
+        if tracked is not None:
+            total, count = tracked
+            if objects:
+                translations = self.backend.readTranslations(objects)
+                total = [total[i] + x for i, x in enumerate(sumPoints(translations))]
+                count += len(translations) // 3
+            if not count:
+                return None
+            return tuple([x / float(count) for x in total])
+        ranges = parseComponents(components, self.backend.vertexCount)
+        points = list(self.backend.readPositions(sampleRanges(ranges, self.maxPoints)))
+        if objects:
+            points.extend(self.backend.readTranslations(objects))
+        if self.mode == 'bounds':
+            return boundsCenter(points)
+        return centroid(points)